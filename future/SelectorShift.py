@@ -7,6 +7,7 @@ import time
 import json_repair
 from openai import OpenAI
 from collections import defaultdict
+from quote_pool import get_quote_pool
 
 def get_prompt(concept_plates: str, topic: str) -> str:
 
@@ -25,15 +26,14 @@ def get_prompt(concept_plates: str, topic: str) -> str:
 """
 
 def get_all_plate(market: Market):
-    quote_ctx = OpenQuoteContext(host='127.0.0.1', port=11111)
-    ret, data = quote_ctx.get_plate_list(market, Plate.CONCEPT)
+    with get_quote_pool().borrow() as quote_ctx:
+        ret, data = quote_ctx.get_plate_list(market, Plate.CONCEPT)
     res = {}
     if ret == RET_OK:
         for index, row in data.iterrows():
             res[row['plate_name']] = row['code']
     else:
         print('error:', data)
-    quote_ctx.close()
     return res
 
 def filter_stocks_by_kdj_criteria(market: Market, plate_code: str) -> Dict[str, str]:
@@ -50,8 +50,8 @@ def filter_stocks_by_kdj_criteria(market: Market, plate_code: str) -> Dict[str,
     stock_results = {}
     
     try:
-        # 使用上下文管理器自动关闭连接
-        with OpenQuoteContext(host='127.0.0.1', port=11111) as quote_ctx:
+        # 从共享连接池借用连接，用完自动归还
+        with get_quote_pool().borrow() as quote_ctx:
             # 创建价格过滤器（价格范围2-1000）
             price_filter = SimpleFilter()
             price_filter.filter_min = 2
@@ -111,7 +111,7 @@ def get_plate_stocks(plate_code: str) -> List[str]:
         List[str]: 股票代码列表
     """
     try:
-        with OpenQuoteContext(host='127.0.0.1', port=11111) as quote_ctx:
+        with get_quote_pool().borrow() as quote_ctx:
             ret, data = quote_ctx.get_plate_stock(plate_code)
             if ret == RET_OK:
                 # 尝试获取不同可能的列名
@@ -0,0 +1,72 @@
+# backtrader 自定义分析器 - 输出紧凑的逐笔交易明细，供稳健性分析等后处理使用
+import backtrader as bt
+import pandas as pd
+
+TRADE_COLUMNS = ['code', 'entry_date', 'exit_date', 'entry_price', 'exit_price', 'size', 'pnl', 'pnlcomm', 'return', 'hold_days']
+
+
+class TradeListAnalyzer(bt.Analyzer):
+    """
+    记录每一笔已平仓交易
+
+    TradeAnalyzer 只给出汇总统计，这里保留逐笔明细，
+    get_analysis() 返回字典列表，可直接转换为 DataFrame
+    """
+
+    def start(self):
+        self.trades = []
+        # notify_trade 只在开仓和平仓时触发，平仓时 trade.size 已归零，
+        # 因此逐bar记录持仓期间绝对值最大的持仓数量（保留符号，空头为负）
+        self._sizes = {}
+
+    def next(self):
+        for data in self.strategy.datas:
+            size = self.strategy.getposition(data).size
+            if abs(size) > abs(self._sizes.get(data, 0)):
+                self._sizes[data] = size
+
+    def notify_trade(self, trade):
+        if trade.justopened:
+            self._sizes[trade.data] = trade.size
+        if not trade.isclosed:
+            return
+        size = self._sizes.pop(trade.data, 0)
+        entry_value = trade.price * abs(size)
+        self.trades.append({
+            'code': trade.data._name,
+            'entry_date': bt.num2date(trade.dtopen).date(),
+            'exit_date': bt.num2date(trade.dtclose).date(),
+            'entry_price': trade.price,
+            # pnl = (exit - entry) * size，空头的 size 为负
+            'exit_price': trade.price + trade.pnl / size if size else float('nan'),
+            'size': size,
+            'pnl': trade.pnl,
+            'pnlcomm': trade.pnlcomm,
+            'return': trade.pnlcomm / entry_value if entry_value else 0.0,
+            'hold_days': trade.barlen,
+        })
+
+    def get_analysis(self):
+        return self.trades
+
+
+def trades_to_frame(trades) -> pd.DataFrame:
+    """把 TradeListAnalyzer 的输出转换为 DataFrame"""
+    return pd.DataFrame(list(trades), columns=TRADE_COLUMNS)
+
+
+class EquityCurveAnalyzer(bt.Analyzer):
+    """逐bar记录账户总资产和现金，输出紧凑的资金曲线"""
+
+    def start(self):
+        self.dates = []
+        self.values = []
+        self.cash = []
+
+    def next(self):
+        self.dates.append(self.strategy.datas[0].datetime.date(0))
+        self.values.append(self.strategy.broker.getvalue())
+        self.cash.append(self.strategy.broker.getcash())
+
+    def get_analysis(self):
+        return pd.DataFrame({'date': pd.to_datetime(self.dates), 'value': self.values, 'cash': self.cash})
@@ -2,7 +2,8 @@ from prompts import get_trading_prompt
 import talib as ta
 import pandas as pd
 import json
-from futu import OpenQuoteContext, RET_OK
+from futu import RET_OK
+from quote_pool import get_quote_pool
 from utils import get_ai_recommendation
 from fetch_kline_daily import KlineFetcher
 import datetime
@@ -26,8 +27,8 @@ hist_columns = ['code', 'name', 'time_key', 'open', \
         'turnover_rate', 'turnover', 'change_rate']
         
 def get_stock_pool(pool_name="全部"):
-    quote_ctx = OpenQuoteContext(host='127.0.0.1', port=11111)
-    ret, data = quote_ctx.get_user_security(pool_name)
+    with get_quote_pool().borrow() as quote_ctx:
+        ret, data = quote_ctx.get_user_security(pool_name)
     if ret == RET_OK:
         # print(data)
         if data.shape[0] > 0:  # 如果自选股列表不为空
@@ -37,7 +38,6 @@ def get_stock_pool(pool_name="全部"):
     else:
         print('error:', data)
         res = []
-    quote_ctx.close()
     return res
 
 def get_market_place():
@@ -4,7 +4,8 @@
 import talib as ta
 import pandas as pd
 import json
-from futu import OpenQuoteContext, RET_OK
+from futu import RET_OK
+from quote_pool import get_quote_pool
 from utils import get_ai_recommendation
 from fetch_kline_daily import KlineFetcher
 import datetime
@@ -47,8 +48,8 @@ def get_stock_pool(pool_name="全部"):
     """
     获取自选股列表
     """
-    quote_ctx = OpenQuoteContext(host='127.0.0.1', port=11111)
-    ret, data = quote_ctx.get_user_security(pool_name)
+    with get_quote_pool().borrow() as quote_ctx:
+        ret, data = quote_ctx.get_user_security(pool_name)
     if ret == RET_OK:
         logger.debug(f"获取到{pool_name}股票池，共{data.shape[0]}只股票")
         if data.shape[0] > 0:  # 如果自选股列表不为空
@@ -58,7 +59,6 @@ def get_stock_pool(pool_name="全部"):
     else:
         logger.error(f"获取{pool_name}股票池失败: {data}")
         res = {}
-    quote_ctx.close()
     return res
 
 def create_db_session():
@@ -0,0 +1,130 @@
+# 回测图表渲染 - 与回测运行解耦的无界面、按需、带缓存的绘图阶段
+"""
+回测只输出紧凑的资金曲线和逐笔交易（保存在 data/backtest_series/<key>/），
+需要查看时再渲染图表：
+
+    • 使用非交互的 Agg 后端，在独立的 spawn 进程池中绘制，不影响回测进程
+    • 图表按 (策略, 股票, 参数, 数据版本) 生成缓存键，相同回测只渲染一次
+"""
+
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+from typing import Dict, Iterable, List, Optional
+
+import pandas as pd
+
+SERIES_DIR = 'data/backtest_series'
+CHART_DIR = 'data/charts'
+
+
+def chart_cache_key(strategy_name: str, stock_code: str, params: Dict, data_version: str,
+                    start_date=None, end_date=None) -> str:
+    """由策略名、股票代码、策略参数、回测区间和数据版本生成缓存键"""
+    raw = json.dumps({
+        'strategy': strategy_name,
+        'code': stock_code,
+        'params': params,
+        'start': str(start_date),
+        'end': str(end_date),
+        'data_version': data_version,
+    }, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.md5(raw.encode('utf-8')).hexdigest()[:16]
+
+
+def save_backtest_series(key: str, equity: pd.DataFrame, trades: pd.DataFrame, meta: Dict,
+                         series_dir: str = SERIES_DIR) -> str:
+    """保存一次回测的资金曲线、交易明细和元信息，返回保存目录"""
+    out_dir = os.path.join(series_dir, key)
+    os.makedirs(out_dir, exist_ok=True)
+    equity.to_parquet(os.path.join(out_dir, 'equity.parquet'), index=False)
+    trades.to_parquet(os.path.join(out_dir, 'trades.parquet'), index=False)
+    with open(os.path.join(out_dir, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, default=str)
+    return out_dir
+
+
+def load_backtest_series(key: str, series_dir: str = SERIES_DIR):
+    """读取 save_backtest_series 保存的数据，返回 (equity, trades, meta)"""
+    in_dir = os.path.join(series_dir, key)
+    equity = pd.read_parquet(os.path.join(in_dir, 'equity.parquet'))
+    trades = pd.read_parquet(os.path.join(in_dir, 'trades.parquet'))
+    with open(os.path.join(in_dir, 'meta.json'), 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    return equity, trades, meta
+
+
+def _render_worker(args):
+    """在子进程中绘图；子进程先选定 Agg 后端再导入 pyplot"""
+    key, series_dir, chart_dir, prices = args
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    equity, trades, meta = load_backtest_series(key, series_dir)
+    fig, (ax_price, ax_equity) = plt.subplots(
+        2, 1, figsize=(12, 8), sharex=True, gridspec_kw={'height_ratios': [2, 1]}
+    )
+    if prices is not None and not prices.empty:
+        ax_price.plot(prices['time_key'], prices['close'], color='#1f77b4', linewidth=1, label='close')
+    if not trades.empty:
+        ax_price.scatter(pd.to_datetime(trades['entry_date']), trades['entry_price'],
+                         marker='^', color='#d62728', zorder=3, label='buy')
+        ax_price.scatter(pd.to_datetime(trades['exit_date']), trades['exit_price'],
+                         marker='v', color='#2ca02c', zorder=3, label='sell')
+    ax_price.set_title(f"{meta.get('strategy')} {meta.get('code')}")
+    ax_price.legend(loc='upper left')
+    ax_equity.plot(equity['date'], equity['value'], color='#ff7f0e', linewidth=1)
+    ax_equity.set_ylabel('value')
+    fig.tight_layout()
+
+    os.makedirs(chart_dir, exist_ok=True)
+    out_path = os.path.join(chart_dir, f'{key}.png')
+    tmp_path = f'{out_path}.tmp.png'
+    fig.savefig(tmp_path)
+    plt.close(fig)
+    os.replace(tmp_path, out_path)
+    return out_path
+
+
+def _load_prices(meta: Dict) -> Optional[pd.DataFrame]:
+    """从分区数据集中取回测区间的收盘价；数据集不可用时只画资金曲线"""
+    dataset_dir = meta.get('dataset_dir')
+    if not dataset_dir or not os.path.isdir(dataset_dir):
+        return None
+    from kline_dataset import KlineDataset
+    df = KlineDataset(dataset_dir).read(meta['code'], meta.get('start_date'), meta.get('end_date'),
+                                        columns=['time_key', 'close'])
+    return df if not df.empty else None
+
+
+def render_charts(keys: Iterable[str], max_workers: Optional[int] = None,
+                  series_dir: str = SERIES_DIR, chart_dir: str = CHART_DIR) -> Dict[str, str]:
+    """
+    按需渲染一批回测图表，已缓存的直接返回路径
+
+    返回:
+        {key: png路径}
+    """
+    paths, jobs = {}, []
+    for key in dict.fromkeys(keys):
+        out_path = os.path.join(chart_dir, f'{key}.png')
+        if os.path.exists(out_path):
+            paths[key] = out_path
+            continue
+        _, _, meta = load_backtest_series(key, series_dir)
+        jobs.append((key, series_dir, chart_dir, _load_prices(meta)))
+    if jobs:
+        # spawn 启动的子进程不会继承父进程已选定的交互式后端
+        ctx = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=max_workers or min(len(jobs), os.cpu_count() or 1), mp_context=ctx) as executor:
+            for (key, *_), out_path in zip(jobs, executor.map(_render_worker, jobs)):
+                paths[key] = out_path
+    return paths
+
+
+def render_chart(key: str, **kwargs) -> str:
+    """渲染单个回测图表，返回 png 路径"""
+    return render_charts([key], max_workers=1, **kwargs)[key]
@@ -0,0 +1,152 @@
+# SQLite 存储基准 - 入库写入的同时多个看板读线程查询，对比默认设置与 SQLITE_PRAGMAS 的吞吐和延迟
+"""
+模拟 Streamlit 看板在入库任务运行期间查询 investment_portfolio.db 的场景:
+    • 主进程按批 upsert K线（upsert_stock_klines，每批一个事务），相当于入库任务
+    • N 个读进程反复查询随机股票的最近K线（get_stock_data），相当于各看板进程
+写入结束后统计写入行数/秒、读取次数/秒、读延迟分位数和 database is locked 错误数。
+
+每种设置使用独立的临时数据库文件，互不影响:
+    default  SQLite 默认设置（回滚日志、synchronous=FULL，仅有 sqlite3 驱动默认的 5 秒锁等待）
+    tuned    DatabaseManager 默认的 SQLITE_PRAGMAS（WAL 等）
+
+用法:
+    python bench_sqlite.py --codes 200 --days 500 --readers 4
+    python bench_sqlite.py --db-dir /path/on/target/disk   # 在实际部署的磁盘上测试 fsync 开销
+"""
+
+import argparse
+import logging
+import multiprocessing as mp
+import os
+import random
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from sqlalchemy.exc import OperationalError
+
+from db_schema import SQLITE_PRAGMAS, DatabaseManager, get_stock_data, upsert_stock_klines
+
+PROFILES = {
+    'default': {},
+    'tuned': SQLITE_PRAGMAS,
+}
+
+
+def make_klines(codes: List[str], days: int, seed: int = 0) -> pd.DataFrame:
+    """生成 codes × days 的随机日K线，按交易日排序（与每日入库的写入顺序一致）"""
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range('2020-01-01', periods=days)
+    n = len(codes) * days
+    close = 10 * np.exp(np.cumsum(rng.normal(0, 0.02, size=(days, len(codes))), axis=0)).ravel()
+    df = pd.DataFrame({
+        'code': np.tile(codes, days),
+        'name': np.tile(codes, days),
+        'time_key': np.repeat(dates, len(codes)),
+        'open': close * (1 + rng.normal(0, 0.005, n)),
+        'close': close,
+        'high': close * 1.01,
+        'low': close * 0.99,
+        'pe_ratio': rng.uniform(5, 50, n),
+        'volume': rng.integers(1e5, 1e7, n).astype(float),
+        'turnover_rate': rng.uniform(0, 5, n),
+        'turnover': rng.uniform(1e6, 1e8, n),
+        'change_rate': rng.normal(0, 2, n),
+    })
+    return df
+
+
+def _reader(db_file: str, profile: str, codes: List[str], read_limit: int, seed: int, done, results) -> None:
+    """读进程：写入结束前反复查询，返回 (延迟列表, 错误数)"""
+    logging.getLogger('db_schema').setLevel(logging.WARNING)
+    manager = DatabaseManager(db_file, pragmas=PROFILES[profile])
+    manager.init_db()
+    rng = random.Random(seed)
+    latencies, errors = [], 0
+    while not done.is_set():
+        start = time.perf_counter()
+        try:
+            with manager.create_session() as session:
+                get_stock_data(session, rng.choice(codes), limit=read_limit)
+            latencies.append(time.perf_counter() - start)
+        except OperationalError:
+            errors += 1
+    results.put((latencies, errors))
+
+
+def run_profile(profile: str, df: pd.DataFrame, readers: int, batch_rows: int, read_limit: int,
+                db_dir: Optional[str] = None) -> Dict[str, float]:
+    """在临时数据库上运行一次 写入 + 并发读取，返回统计结果"""
+    codes = df['code'].unique().tolist()
+    with tempfile.TemporaryDirectory(dir=db_dir) as tmp_dir:
+        db_file = os.path.join(tmp_dir, 'bench.db')
+        manager = DatabaseManager(db_file, pragmas=PROFILES[profile])
+        manager.init_db()
+        # 先写入第一批，读进程从一开始就有数据可查
+        with manager.create_session() as session:
+            upsert_stock_klines(session, df.iloc[:batch_rows])
+
+        done, results = mp.Event(), mp.Queue()
+        procs = [
+            mp.Process(target=_reader, args=(db_file, profile, codes, read_limit, i, done, results))
+            for i in range(readers)
+        ]
+        for p in procs:
+            p.start()
+
+        written, write_errors = 0, 0
+        start = time.perf_counter()
+        for offset in range(batch_rows, len(df), batch_rows):
+            try:
+                with manager.create_session() as session:
+                    written += upsert_stock_klines(session, df.iloc[offset:offset + batch_rows])
+            except OperationalError:
+                write_errors += 1
+        elapsed = time.perf_counter() - start
+        done.set()
+        latencies, read_errors = [], 0
+        for _ in procs:
+            lat, err = results.get()
+            latencies.extend(lat)
+            read_errors += err
+        for p in procs:
+            p.join()
+        manager.get_engine().dispose()
+
+    latencies = np.array(latencies) * 1000 if latencies else np.array([np.nan])
+    return {
+        'profile': profile,
+        'write_rows_per_s': written / elapsed,
+        'reads_per_s': len(latencies) / elapsed,
+        'read_p50_ms': float(np.percentile(latencies, 50)),
+        'read_p95_ms': float(np.percentile(latencies, 95)),
+        'read_max_ms': float(np.max(latencies)),
+        'read_errors': read_errors,
+        'write_errors': write_errors,
+        'seconds': elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SQLite 并发读写基准")
+    parser.add_argument("--codes", type=int, default=200, help="股票数")
+    parser.add_argument("--days", type=int, default=500, help="每只股票的交易日数")
+    parser.add_argument("--readers", type=int, default=4, help="并发读进程数")
+    parser.add_argument("--batch-rows", type=int, default=100, help="每个写事务的行数（入库任务按股票分批提交）")
+    parser.add_argument("--read-limit", type=int, default=250, help="每次查询的K线条数")
+    parser.add_argument("--profiles", nargs='+', choices=list(PROFILES), default=list(PROFILES))
+    parser.add_argument("--db-dir", default=None, help="临时数据库所在目录，默认系统临时目录")
+    args = parser.parse_args()
+
+    # 基准期间关闭查询函数的逐条日志
+    logging.getLogger('db_schema').setLevel(logging.WARNING)
+    df = make_klines([f'SH.{600000 + i}' for i in range(args.codes)], args.days)
+    rows = [run_profile(p, df, args.readers, args.batch_rows, args.read_limit, args.db_dir) for p in args.profiles]
+    print(f"写入 {len(df)} 行，{args.readers} 个读进程")
+    print(pd.DataFrame(rows).set_index('profile').round(2).to_string())
+
+
+if __name__ == "__main__":
+    main()
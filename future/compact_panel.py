@@ -0,0 +1,286 @@
+# 紧凑价格面板 - 可选 float32 / int32 tick 存储的 日期×股票 价格数组，以及按列向量化的指标内核
+"""
+OHLC 面板和每个选股器里的 hist 副本默认都是 float64。A股价格最小变动 0.01（ETF 0.001），
+用 float32 或缩放后的 int32 tick 存储可把价格内存减半，滚动指标内核的缓存命中也更好。
+
+精度约定:
+    • 'float64'  默认，与原有结果完全一致
+    • 'float32'  存储与计算均为 float32；价格相对误差 ≤ 2^-24（约 6e-8，5000 元以下价格误差小于 0.001），
+                 指标相对 float64 的误差由 test_compact_panel.py 验证（均线类 ≤ 1e-5，KDJ 绝对误差 ≤ 1e-2）
+    • 'int32'    价格存为 round(价格 × PRICE_SCALE) 的 tick：不复权价格是 0.001 的整数倍，无损；
+                 前复权价格不在 tick 网格上，绝对误差 ≤ 0.5 / PRICE_SCALE。
+                 计算指标时逐列还原为 float64，均线类指标的绝对误差同样 ≤ 0.5 / PRICE_SCALE
+
+pandas 的 rolling/ewm 会把 float32 升为 float64，因此这里的内核直接基于 numpy，
+对二维数组按列（axis=0 为日期）一次计算全部股票，并保持输入的浮点类型。
+
+load_panel 把K线长表一次对齐到全部股票共享的交易日历上（停牌、上市前的日期在 valid 中为 False），
+按数据版本缓存到磁盘；之后各实验直接加载面板，用 code_frames() 取选股器需要的 {code: DataFrame}，
+不再每次用 df[df['code'] == code] 逐只拆分。
+
+用法:
+    panel = load_panel('data/kline_data.parquet', columns=['open', 'high', 'low', 'close', 'volume'])
+    selector.select(panel.dates[-1], panel.code_frames())
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+from kline_dataset import KlineDataset, dataset_version
+from minute_store import PRICE_SCALE, decode_prices, encode_prices
+
+PRICE_DTYPES = ('float64', 'float32', 'int32')
+PRICE_COLUMNS = ['open', 'high', 'low', 'close']
+PANEL_CACHE_DIR = 'data/panel_cache'
+
+
+def _check_dtype(price_dtype: str) -> str:
+    if price_dtype not in PRICE_DTYPES:
+        raise ValueError(f"不支持的价格类型: {price_dtype}，可选 {PRICE_DTYPES}")
+    return price_dtype
+
+
+def compact_frame(df: pd.DataFrame, price_dtype: str = 'float64', columns: Iterable[str] = PRICE_COLUMNS) -> pd.DataFrame:
+    """
+    把长表中的价格列转换为 float32（原地不改动，返回新表）
+
+    长表会直接交给选股器做 pandas 运算，只支持 'float64' / 'float32'；int32 tick 请使用 PricePanel
+    """
+    if _check_dtype(price_dtype) == 'int32':
+        raise ValueError("长表不支持 int32 tick，请使用 PricePanel")
+    if price_dtype == 'float64':
+        return df
+    cols = [c for c in columns if c in df.columns]
+    return df.astype({c: np.float32 for c in cols})
+
+
+class PricePanel:
+    """
+    日期×股票 的价格面板
+
+    参数:
+        dates: 共享交易日历
+        codes: 股票代码
+        arrays: {列名: (日期数, 股票数) 数组}；价格列按 price_dtype 存储（int32 时为 tick），其他列为 float64
+        valid: (日期数, 股票数) 布尔数组，该股票当天是否有K线
+        price_dtype: 'float64' / 'float32' / 'int32'
+    """
+
+    def __init__(self, dates: pd.DatetimeIndex, codes: List[str], arrays: Dict[str, np.ndarray],
+                 valid: np.ndarray, price_dtype: str = 'float64'):
+        self.dates = dates
+        self.codes = list(codes)
+        self.arrays = arrays
+        self.valid = valid
+        self.price_dtype = _check_dtype(price_dtype)
+
+    @classmethod
+    def from_long(cls, df: pd.DataFrame, price_dtype: str = 'float64',
+                  columns: Iterable[str] = PRICE_COLUMNS) -> 'PricePanel':
+        """
+        从 code/time_key 长表构建面板：交易日历取全部股票日期的并集，
+        一次向量化散列写入，缺失的 (日期, 股票) 在 valid 中为 False
+        """
+        _check_dtype(price_dtype)
+        df = df.drop_duplicates(['code', 'time_key'], keep='last')
+        time_key = pd.to_datetime(df['time_key'])
+        dates = pd.DatetimeIndex(time_key.unique()).sort_values()
+        codes = sorted(df['code'].unique())
+        rows = dates.get_indexer(time_key)
+        cols = pd.Index(codes).get_indexer(df['code'])
+        valid = np.zeros((len(dates), len(codes)), dtype=bool)
+        valid[rows, cols] = True
+        arrays = {}
+        for col in columns:
+            if col in PRICE_COLUMNS and price_dtype == 'int32':
+                values = np.zeros(valid.shape, dtype=np.int32)
+                values[rows, cols] = encode_prices(df[col])
+            else:
+                dtype = price_dtype if col in PRICE_COLUMNS else 'float64'
+                values = np.full(valid.shape, np.nan, dtype=dtype)
+                values[rows, cols] = df[col].to_numpy(dtype=dtype)
+            arrays[col] = values
+        return cls(dates, codes, arrays, valid, price_dtype)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(a.nbytes for a in self.arrays.values()) + self.valid.nbytes
+
+    def values(self, column: str) -> np.ndarray:
+        """用于计算的浮点数组，缺失处为 NaN；float 面板直接返回存储数组，int32 面板还原为 float64"""
+        values = self.arrays[column]
+        if values.dtype != np.int32:
+            return values
+        return np.where(self.valid, decode_prices(values), np.nan)
+
+    def frame(self, column: str) -> pd.DataFrame:
+        """某一列的 日期×股票 宽表"""
+        return pd.DataFrame(self.values(column), index=self.dates, columns=self.codes)
+
+    def code_frames(self) -> Dict[str, pd.DataFrame]:
+        """
+        选股器使用的 {code: DataFrame(code, date, 各列)}，只含该股票有K线的日期
+
+        按 valid 一次取出全部有效格子（股票优先、日期升序），再按股票边界切片；结果在面板上缓存
+        """
+        if getattr(self, '_code_frames', None) is None:
+            code_idx, row_idx = np.nonzero(self.valid.T)
+            long = pd.DataFrame({'code': np.asarray(self.codes, dtype=object)[code_idx], 'date': self.dates[row_idx]})
+            for col in self.arrays:
+                long[col] = self.values(col)[row_idx, code_idx]
+            bounds = np.searchsorted(code_idx, np.arange(len(self.codes) + 1))
+            self._code_frames = {
+                code: long.iloc[bounds[i]:bounds[i + 1]].reset_index(drop=True)
+                for i, code in enumerate(self.codes) if bounds[i + 1] > bounds[i]
+            }
+        return self._code_frames
+
+    def save(self, panel_dir: str) -> None:
+        """保存为 .npy 列文件 + meta.json，先写临时目录再整体替换"""
+        tmp_dir = f'{panel_dir}.tmp'
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        np.save(os.path.join(tmp_dir, 'dates.npy'), self.dates.values.astype('datetime64[ns]').astype(np.int64))
+        np.save(os.path.join(tmp_dir, 'valid.npy'), self.valid)
+        for col, values in self.arrays.items():
+            np.save(os.path.join(tmp_dir, f'{col}.npy'), values)
+        meta = {'codes': self.codes, 'columns': list(self.arrays), 'price_dtype': self.price_dtype}
+        with open(os.path.join(tmp_dir, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False)
+        shutil.rmtree(panel_dir, ignore_errors=True)
+        os.replace(tmp_dir, panel_dir)
+
+    @classmethod
+    def load(cls, panel_dir: str) -> 'PricePanel':
+        """以内存映射方式加载 save 保存的面板"""
+        with open(os.path.join(panel_dir, 'meta.json'), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        dates = pd.DatetimeIndex(np.load(os.path.join(panel_dir, 'dates.npy')).astype('datetime64[ns]'))
+        valid = np.load(os.path.join(panel_dir, 'valid.npy'), mmap_mode='r')
+        arrays = {col: np.load(os.path.join(panel_dir, f'{col}.npy'), mmap_mode='r') for col in meta['columns']}
+        return cls(dates, meta['codes'], arrays, valid, meta['price_dtype'])
+
+
+_panels: Dict[str, PricePanel] = {}
+_panels_lock = threading.Lock()
+
+
+def _read_long(source: str, columns: List[str]) -> pd.DataFrame:
+    read_columns = ['code', 'time_key'] + columns
+    if os.path.isdir(source):
+        df = KlineDataset(source).read(columns=read_columns)
+    else:
+        df = pd.read_parquet(source, columns=read_columns)
+    df['time_key'] = pd.to_datetime(df['time_key'])
+    return df
+
+
+def load_panel(source: str, columns: Iterable[str] = PRICE_COLUMNS + ['volume'], price_dtype: str = 'float64',
+               cache_dir: Optional[str] = PANEL_CACHE_DIR) -> PricePanel:
+    """
+    加载对齐到共享交易日历的面板，按数据版本缓存
+
+    同一进程内重复调用直接复用；磁盘缓存以 数据版本 + 列 + 价格类型 为键，数据更新后自动重建
+
+    参数:
+        source: K线 parquet 文件或分区数据集目录
+        columns: 需要的列
+        price_dtype: 价格列类型，见模块说明
+        cache_dir: 磁盘缓存目录，None 表示不落盘
+    """
+    columns = list(columns)
+    _check_dtype(price_dtype)
+    spec = json.dumps({'columns': columns, 'price_dtype': price_dtype})
+    key = f"{dataset_version(source)}_{hashlib.md5(spec.encode('utf-8')).hexdigest()[:10]}"
+    with _panels_lock:
+        panel = _panels.get(key)
+        if panel is not None:
+            return panel
+        panel_dir = os.path.join(cache_dir, key) if cache_dir else None
+        if panel_dir and os.path.exists(os.path.join(panel_dir, 'meta.json')):
+            panel = PricePanel.load(panel_dir)
+        else:
+            panel = PricePanel.from_long(_read_long(source, columns), price_dtype, columns)
+            if panel_dir:
+                os.makedirs(cache_dir, exist_ok=True)
+                panel.save(panel_dir)
+        _panels[key] = panel
+        return panel
+
+
+# ---------- 指标内核：axis=0 为日期，按列计算，保持输入浮点类型 ---------- #
+def _pad(a: np.ndarray, n: int) -> np.ndarray:
+    return np.concatenate([np.full((n,) + a.shape[1:], np.nan, dtype=a.dtype), a])
+
+
+def rolling_mean(a: np.ndarray, window: int, min_periods: Optional[int] = None) -> np.ndarray:
+    """
+    等同 pandas rolling(window, min_periods).mean()；默认 min_periods=window，窗口内有 NaN 时为 NaN
+    """
+    a = np.asarray(a)
+    if min_periods is None or min_periods >= window:
+        out = np.full(a.shape, np.nan, dtype=a.dtype)
+        if len(a) >= window:
+            out[window - 1:] = sliding_window_view(a, window, axis=0).mean(axis=-1)
+        return out
+    view = sliding_window_view(_pad(a, window - 1), window, axis=0)
+    count = (~np.isnan(view)).sum(axis=-1)
+    total = np.where(np.isnan(view), 0, view).sum(axis=-1, dtype=a.dtype)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        out = (total / count).astype(a.dtype, copy=False)
+    out[count < min_periods] = np.nan
+    return out
+
+
+def rolling_min(a: np.ndarray, window: int) -> np.ndarray:
+    """等同 pandas rolling(window, min_periods=1).min()，忽略 NaN"""
+    return np.fmin.reduce(sliding_window_view(_pad(np.asarray(a), window - 1), window, axis=0), axis=-1)
+
+
+def rolling_max(a: np.ndarray, window: int) -> np.ndarray:
+    """等同 pandas rolling(window, min_periods=1).max()，忽略 NaN"""
+    return np.fmax.reduce(sliding_window_view(_pad(np.asarray(a), window - 1), window, axis=0), axis=-1)
+
+
+def ema(a: np.ndarray, span: int) -> np.ndarray:
+    """等同 pandas ewm(span, adjust=False).mean()，从每列第一个有效值开始"""
+    a = np.asarray(a)
+    alpha = a.dtype.type(2.0 / (span + 1))
+    out = np.empty_like(a)
+    prev = a[0].copy()
+    out[0] = prev
+    for t in range(1, len(a)):
+        x = a[t]
+        # 前值缺失时从当前值起算；当前值缺失时沿用前值
+        prev = np.where(np.isnan(prev), x, np.where(np.isnan(x), prev, prev + alpha * (x - prev)))
+        out[t] = prev
+    return out
+
+
+def bbi(close: np.ndarray) -> np.ndarray:
+    """BBI = (MA3 + MA6 + MA12 + MA24) / 4"""
+    return (rolling_mean(close, 3) + rolling_mean(close, 6) + rolling_mean(close, 12) + rolling_mean(close, 24)) / 4
+
+
+def kdj(high: np.ndarray, low: np.ndarray, close: np.ndarray,
+        fastk_period: int = 9, slowk_period: int = 3, slowd_period: int = 3):
+    """与 Selector.compute_kdj 相同的 KDJ，返回 (K, D, J)"""
+    low_n = rolling_min(low, fastk_period)
+    high_n = rolling_max(high, fastk_period)
+    rsv = (close - low_n) / (high_n - low_n + close.dtype.type(1e-9)) * 100
+    k = rolling_mean(rsv, slowk_period, min_periods=1)
+    d = rolling_mean(k, slowd_period, min_periods=1)
+    return k, d, 3 * k - 2 * d
+
+
+def dif(close: np.ndarray, fast: int = 12, slow: int = 26) -> np.ndarray:
+    """MACD 的 DIF = EMA(fast) - EMA(slow)"""
+    return ema(close, fast) - ema(close, slow)
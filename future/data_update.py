@@ -5,18 +5,26 @@ import time
 from datetime import datetime
 from fetch_kline_daily import get_stock_pool, KlineFetcher
 from db_tools import DatabaseTools
+from kline_dataset import DATASET_DIR, append_daily
+from kline_bars import materialize_bars
+import os
 
 daily_columns = ['code', 'name', 'update_time', 'last_price', 'open_price', 'high_price', \
-    'low_price', 'pe_ratio', 'volume', 'turnover', 'turnover_rate']
+    'low_price', 'prev_close_price', 'pe_ratio', 'volume', 'turnover', 'turnover_rate']
 hist_columns = ['code', 'name', 'time_key', 'open', \
     'close', 'high', 'low', 'pe_ratio', 'volume', \
         'turnover_rate', 'turnover', 'change_rate']
+# 数据类型选项 -> 物化的K线周期
+BAR_FREQS = {"周线数据": "week", "月线数据": "month"}
 # 配置日志
 logger = logging.getLogger(__name__)
 
 def update_kline_data(code_list, db_manager=None):
     """
     更新ETF/股票历史K线数据
+
+    抓到的K线写入数据库；日线分区数据集存在时同样追加一份，
+    周线/月线从该数据集物化，与数据库中的日线保持一致
     """
     # 初始化数据库工具
     db_tools = DatabaseTools('investment_portfolio.db')
@@ -26,24 +34,33 @@ def update_kline_data(code_list, db_manager=None):
         # 这里应该调用实际的数据更新接口
         # 为了演示，我们模拟数据更新过程
         results = []
+        fetched = []
         today = datetime.now().strftime('%Y-%m-%d')
+        # 一次查询全部股票在数据库中的最新日期
+        watermarks = db_tools.get_latest_dates_for_stocks(code_list)
 
         for code in code_list:
-            # 查询该股票在数据库中的最新日期
-            latest_date = db_tools.get_latest_date_for_stock(code)
+            latest_date = watermarks.get(code)
             # 如果数据库返回的是 datetime 对象，则格式化为字符串
             if isinstance(latest_date, datetime):
                 latest_date = latest_date.strftime('%Y-%m-%d')
             logger.info(f"股票 {code} 数据库最新日期: {latest_date}")
+            # 已更新到今天的股票直接跳过，中断后重跑只处理剩余股票
+            if latest_date is not None and latest_date >= today:
+                results.append({
+                    'code': code,
+                    'status': '成功',
+                    'message': '数据已是最新',
+                    'updated_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+                })
+                continue
             tmp = fetcher.fetch_hist_kline(code, start=latest_date, end=today)
-            tmp['time_key'] = pd.to_datetime(tmp['time_key'])
-            for item in tmp.iterrows():
-                stock_data = item[1].to_dict()
-                db_tools.insert_stock_kline(stock_data)
-            count = tmp.shape[0]
-            print(f"已插入 {count}条股票数据")
-            # 模拟更新结果
-            success = True  # 随机模拟成功率
+            success = tmp is not None
+            if success:
+                # 整只股票一个事务批量写入，重复的K线直接更新
+                count = db_tools.upsert_stock_klines(tmp)
+                print(f"已插入 {count}条股票数据")
+                fetched.append(tmp)
             if success:
                 results.append({
                     'code': code,
@@ -60,7 +77,12 @@ def update_kline_data(code_list, db_manager=None):
                     'updated_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
                 })
                 logger.warning(f"股票 {code} 数据更新失败")
-        
+
+        if fetched and os.path.isdir(DATASET_DIR):
+            # 同一批K线追加到日线数据集（重复的以本次为准），周期K线据此物化
+            rows = append_daily(pd.concat(fetched, ignore_index=True), DATASET_DIR)
+            logger.info(f"日线数据集追加 {rows} 条K线")
+
         logger.info(f"K线数据更新完成，成功: {len([r for r in results if r['status'] == '成功'])}, 失败: {len([r for r in results if r['status'] == '失败'])}")
         return results
     except Exception as e:
@@ -196,6 +218,16 @@ def show_data_update():
                 # 调用更新函数
                 update_results = update_kline_data(codes_to_update)
                 
+                # 周线/月线从日线数据集物化，本次抓到的日线已同时追加到该数据集
+                for label, freq in BAR_FREQS.items():
+                    if label not in data_types:
+                        continue
+                    if os.path.isdir(DATASET_DIR):
+                        rows = materialize_bars(DATASET_DIR, freq)
+                        st.info(f"{label}已更新 {rows} 根K线")
+                    else:
+                        st.warning(f"{label}由日线数据集 {DATASET_DIR} 生成，该数据集尚未创建，已跳过")
+                
                 # 计算耗时
                 elapsed_time = time.time() - start_time
                 
@@ -15,9 +15,11 @@ pip install -r requirements.txt
 3. 支持的操作：创建表、插入、查询、更新、删除
 """
 
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Index, create_engine, desc
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Index, bindparam, create_engine, desc, event, select, text, type_coerce
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.pool import QueuePool
 from sqlalchemy.sql import func
 import datetime
 import pandas as pd
@@ -31,6 +33,22 @@ logger = logging.getLogger(__name__)
 # 创建基类
 Base = declarative_base()
 
+# 每个连接建立时执行的 PRAGMA。Streamlit 页面读取与入库任务写入同一个数据库文件:
+# - journal_mode=WAL: 读不阻塞写、写不阻塞读，写入只追加到 -wal 文件（该设置持久保存在数据库文件中）
+# - synchronous=NORMAL: WAL 模式下只在检查点时 fsync，断电最多丢失最近的事务，不会损坏数据库
+# - cache_size: 负数表示 KiB，每个连接 32MB 页缓存
+# - mmap_size: 读取经内存映射，减少 read() 系统调用和拷贝
+# - temp_store=MEMORY: 排序、分组的临时表放在内存中
+# - busy_timeout: 遇到写锁时最多等待的毫秒数，而不是立即报 database is locked
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -32000,
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+    'busy_timeout': 10000,
+}
+
 # 定义投资组合模型
 class Portfolio(Base):
     __tablename__ = 'portfolios'
@@ -87,7 +105,8 @@ class Stock(Base):
     __tablename__ = 'stocks'
     
     id = Column(Integer, primary_key=True, autoincrement=True)
-    code = Column(String, nullable=False, index=True)
+    # 按股票查询走 (code, time_key) 唯一索引的前缀，不再单独为 code 建索引
+    code = Column(String, nullable=False)
     name = Column(String, nullable=False)
     time_key = Column(DateTime, nullable=False, index=True)
     open = Column(Float, nullable=False)
@@ -100,13 +119,24 @@ class Stock(Base):
     turnover = Column(Float, nullable=True)
     change_rate = Column(Float, nullable=True)
 
+    # 每只股票每个交易日只有一条K线，批量写入依赖该唯一索引做 upsert
+    __table_args__ = (
+        Index('uq_stocks_code_time_key', 'code', 'time_key', unique=True),
+    )
+
     class Config:
         orm_mode = True
 
 # 数据库连接类
 class DatabaseManager:
-    def __init__(self, db_file='investment_portfolio.db'):
+    def __init__(self, db_file='investment_portfolio.db', pragmas=None):
+        """
+        参数:
+            db_file: SQLite 数据库文件
+            pragmas: 连接建立时执行的 PRAGMA，默认 SQLITE_PRAGMAS；传入 {} 使用 SQLite 默认设置
+        """
         self.db_file = db_file
+        self.pragmas = dict(SQLITE_PRAGMAS if pragmas is None else pragmas)
         self._engine = None
         self.SessionLocal = None
     
@@ -116,18 +146,32 @@ class DatabaseManager:
         
         配置选项说明：
         - echo=False: 关闭SQL语句日志输出，生产环境建议设置为False
-        - 可以根据需要调整连接池参数：pool_size, max_overflow等
+        - 连接池: 本地文件没有网络断线，不做 pool_pre_ping；连接保留在池中复用，
+          每个连接的页缓存和内存映射在多次会话间保持有效
+        - check_same_thread=False: Streamlit 的多个脚本线程共用连接池
+        - timeout: sqlite3 驱动层的锁等待秒数，与 busy_timeout 保持一致
         """
         if self._engine is None:
-            # SQLite连接配置，可根据需要调整
+            busy_timeout = self.pragmas.get('busy_timeout', 5000)
             self._engine = create_engine(
                 f'sqlite:///{self.db_file}',
                 echo=False,        # 是否输出SQL语句
-                pool_pre_ping=True, # 连接池健康检查
+                poolclass=QueuePool,
                 pool_size=5,       # 连接池大小
-                max_overflow=10    # 最大溢出连接数
+                max_overflow=10,   # 最大溢出连接数
+                connect_args={'check_same_thread': False, 'timeout': busy_timeout / 1000},
             )
+            event.listen(self._engine, 'connect', self._apply_pragmas)
         return self._engine
+
+    def _apply_pragmas(self, dbapi_connection, connection_record):
+        """新建连接时执行 PRAGMA（连接级设置，复用的连接不会重复执行）"""
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in self.pragmas.items():
+                cursor.execute(f'PRAGMA {name}={value}')
+        finally:
+            cursor.close()
     
     def init_db(self):
         """初始化数据库连接"""
@@ -136,6 +180,8 @@ class DatabaseManager:
             engine = self.get_engine()
             # 创建所有表
             Base.metadata.create_all(bind=engine)
+            # 旧数据库的表结构变更（create_all 不会为已有的表补建索引）
+            migrate(engine)
             # 创建会话工厂
             self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
             logger.info(f"成功初始化数据库: {self.db_file}")
@@ -158,6 +204,97 @@ class DatabaseManager:
             self.init_db()
         return self.SessionLocal()
 
+# Stock表除自增主键外的全部列
+STOCK_COLUMNS = [c.name for c in Stock.__table__.columns if c.name != 'id']
+
+
+# ---------- 数据库迁移 ----------
+# 已执行到的迁移版本记录在 PRAGMA user_version 中，init_db 时按顺序执行尚未执行的迁移。
+# 每个迁移都可重复执行（IF NOT EXISTS / 幂等删除），多个进程同时初始化也不会出错。
+
+def _stock_index_exists(conn, name):
+    return conn.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = :name"), {'name': name}
+    ).first() is not None
+
+
+def dedupe_stocks(engine, chunk_size=200):
+    """在线删除 stocks 表的重复K线，每组 (code, time_key) 保留id最大的一条
+
+    按股票分块，每块一个短事务，看板读取和入库写入可以在块之间继续进行
+
+    参数:
+        engine: 数据库引擎
+        chunk_size: 每个事务处理的股票数
+    返回:
+        删除的行数
+    """
+    with engine.connect() as conn:
+        codes = [row[0] for row in conn.execute(text("SELECT DISTINCT code FROM stocks"))]
+    stmt = text(
+        "DELETE FROM stocks WHERE code IN :codes AND id NOT IN "
+        "(SELECT MAX(id) FROM stocks WHERE code IN :codes GROUP BY code, time_key)"
+    ).bindparams(bindparam('codes', expanding=True))
+    deleted = 0
+    for start in range(0, len(codes), chunk_size):
+        with engine.begin() as conn:
+            deleted += conn.execute(stmt, {'codes': codes[start:start + chunk_size]}).rowcount
+    return deleted
+
+
+def _migrate_stock_unique_index(engine):
+    """stocks(code, time_key) 唯一索引；先分块在线去重，建索引的事务中只需处理期间新写入的重复行"""
+    with engine.connect() as conn:
+        if _stock_index_exists(conn, 'uq_stocks_code_time_key'):
+            return
+    deleted = dedupe_stocks(engine)
+    with engine.begin() as conn:
+        deleted += conn.execute(text(
+            "DELETE FROM stocks WHERE id NOT IN (SELECT MAX(id) FROM stocks GROUP BY code, time_key)"
+        )).rowcount
+        conn.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS uq_stocks_code_time_key ON stocks (code, time_key)"))
+    logger.info(f"已创建 stocks(code, time_key) 唯一索引，清理重复K线 {deleted} 条")
+
+
+def _migrate_drop_stock_code_index(engine):
+    """ix_stocks_code 是唯一索引的前缀，保留它会让按股票查询选中它再额外排序"""
+    with engine.begin() as conn:
+        conn.execute(text("DROP INDEX IF EXISTS ix_stocks_code"))
+        conn.execute(text("ANALYZE stocks"))
+
+
+# (版本号, 说明, 迁移函数)，版本号递增，只能追加
+MIGRATIONS = [
+    (1, 'stocks(code, time_key) 唯一索引', _migrate_stock_unique_index),
+    (2, '删除被唯一索引覆盖的 ix_stocks_code', _migrate_drop_stock_code_index),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version(engine):
+    """数据库当前的迁移版本（PRAGMA user_version）"""
+    with engine.connect() as conn:
+        return conn.execute(text("PRAGMA user_version")).scalar()
+
+
+def migrate(engine):
+    """按顺序执行尚未执行的迁移，每个迁移完成后更新 user_version
+
+    返回:
+        迁移后的版本号
+    """
+    version = get_schema_version(engine)
+    for target, description, func in MIGRATIONS:
+        if target <= version:
+            continue
+        func(engine)
+        with engine.begin() as conn:
+            conn.execute(text(f"PRAGMA user_version = {int(target)}"))
+        version = target
+        logger.info(f"数据库迁移到版本 {target}: {description}")
+    return version
+
+
 # 数据操作函数
 def insert_portfolio_and_positions(db_session, account_id, portfolio_data, account_info, positions_data=None):
     """插入投资组合和持仓数据
@@ -371,18 +508,11 @@ def get_stock_data(db_session, stock_code, limit=100):
         股票数据字典列表，如果未找到数据则返回空列表
     """
     try:
-        stock_records = db_session.query(Stock).filter(Stock.code == stock_code).order_by(desc(Stock.time_key)).limit(limit).all()
-        if stock_records:
-            logger.info(f"查询到 {len(stock_records)} 条股票数据记录")
+        stock_frame = get_stock_frame(db_session, stock_code, limit)
+        if not stock_frame.empty:
+            logger.info(f"查询到 {len(stock_frame)} 条股票数据记录")
             # 转换为字典列表而不是DataFrame，避免布尔上下文歧义问题
-            stock_data = []
-            for record in stock_records:
-                # 安全地获取属性字典并复制
-                record_dict = record.__dict__.copy()
-                # 移除SQLAlchemy内部状态键
-                record_dict.pop('_sa_instance_state', None)
-                stock_data.append(record_dict)
-            return stock_data
+            return frame_to_records(stock_frame)
         else:
             logger.warning(f"未找到股票{stock_code}")
             return []  # 返回空列表而不是None，更安全
@@ -474,58 +604,81 @@ def insert_stock_kline(db_session, stock_data):
         logger.exception(f"插入股票数据失败: {str(e)}")
         raise
 
-def clean_expired_data(db_session):
-    """清理过期数据和Stock表重复数据
-    
+def upsert_stock_klines(db_session, df, batch_size=5000):
+    """批量写入K线，(code, time_key) 已存在时更新其余字段
+
     参数:
         db_session: 数据库会话对象
+        df: 含 Stock 表各列的 DataFrame，多余的列会被忽略
+        batch_size: 每次 executemany 的行数
+    返回:
+        写入的行数
     """
+    if df is None or df.empty:
+        return 0
     try:
-        # 生成当前日期
-        current_date = datetime.datetime.now().strftime('%Y-%m-%d')
-        # 然后删除所有不在保留列表中的记录
-        from sqlalchemy import func
-        
-        # 获取需要保留的记录ID
-        subquery = db_session.query(
-            func.max(Stock.id).label('max_id')
-        ).group_by(
-            Stock.code,
-            Stock.time_key
-        ).subquery()
-        
-        # 删除重复记录，只保留每组中ID最大的那条
-        deleted_count = db_session.query(Stock).filter(
-            ~Stock.id.in_(db_session.query(subquery.c.max_id))
-        ).delete(synchronize_session=False)
-        
+        data = df.reindex(columns=STOCK_COLUMNS)
+        data['time_key'] = pd.to_datetime(data['time_key'])
+        records = data.astype(object).where(data.notna(), None).to_dict('records')
+
+        stmt = sqlite_insert(Stock.__table__)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['code', 'time_key'],
+            set_={c: stmt.excluded[c] for c in STOCK_COLUMNS if c not in ('code', 'time_key')},
+        )
+        for start in range(0, len(records), batch_size):
+            db_session.execute(stmt, records[start:start + batch_size])
         db_session.commit()
-        logger.info(f"成功清理过期持仓记录和Stock表重复数据，删除了{deleted_count}条重复记录")
+        logger.info(f"批量写入 {len(records)} 条K线")
+        return len(records)
     except Exception as e:
         db_session.rollback()
+        logger.exception(f"批量写入K线失败: {str(e)}")
+        raise
+
+def clean_expired_data(db_session):
+    """清理Stock表重复数据
+
+    (code, time_key) 唯一索引保证不会再写入重复K线，无需每次全表分组去重；
+    这里只确认数据库已迁移到当前版本，尚未迁移的旧数据库在迁移中分块在线去重
+
+    参数:
+        db_session: 数据库会话对象
+    返回:
+        迁移后的数据库版本
+    """
+    try:
+        engine = db_session.get_bind()
+        before = get_schema_version(engine)
+        version = migrate(engine)
+        if before >= SCHEMA_VERSION:
+            logger.info("stocks 表已有 (code, time_key) 唯一索引，无重复数据需要清理")
+        return version
+    except Exception as e:
         logger.exception(f"清理数据失败: {str(e)}")
         raise
 
 def get_latest_date_for_stock(db_session, stock_code):
     """查询某个股票在表中最新的日期
     
+    MAX(time_key) 直接定位到唯一索引中该股票范围的末端，只读索引、不回表
+
     参数:
         db_session: 数据库会话对象
         stock_code: 股票代码
     
     返回:
-        最新日期字符串，格式为 'YYYY-MM-DD'；若未找到则返回 None
+        最新日期（datetime）；若未找到则返回 None
     """
     try:
-        latest_record = (
-            db_session.query(Stock)
+        latest_date = (
+            db_session.query(func.max(Stock.time_key))
             .filter(Stock.code == stock_code)
-            .order_by(Stock.time_key.desc())
-            .first()
+            .scalar()
         )
-        if latest_record:
-            logger.info(f"股票 {stock_code} 最新持仓日期为 {latest_record.time_key}")
-            return latest_record.time_key
+        if latest_date is not None:
+            logger.info(f"股票 {stock_code} 最新持仓日期为 {latest_date}")
+            return latest_date
         else:
             logger.warning(f"未找到股票 {stock_code} 的持仓记录")
             return None
@@ -533,6 +686,33 @@ def get_latest_date_for_stock(db_session, stock_code):
         logger.exception(f"查询股票 {stock_code} 最新日期失败: {str(e)}")
         raise
 
+def get_latest_dates_for_stocks(db_session, stock_codes=None, chunk_size=500):
+    """一次分组查询多只股票在表中的最新日期（增量更新的水位线）
+
+    借助 (code, time_key) 唯一索引，每只股票的 MAX(time_key) 只需读索引末端
+
+    参数:
+        db_session: 数据库会话对象
+        stock_codes: 股票代码列表；为 None 时返回全部股票
+        chunk_size: IN 列表分块大小，避免超过 SQLite 变量个数上限
+    返回:
+        {股票代码: 最新日期}，表中没有的股票不包含在结果中
+    """
+    try:
+        query = db_session.query(Stock.code, func.max(Stock.time_key)).group_by(Stock.code)
+        if stock_codes is None:
+            return dict(query.all())
+        stock_codes = list(dict.fromkeys(stock_codes))
+        watermarks = {}
+        for start in range(0, len(stock_codes), chunk_size):
+            chunk = stock_codes[start:start + chunk_size]
+            watermarks.update(query.filter(Stock.code.in_(chunk)).all())
+        logger.info(f"查询到 {len(watermarks)}/{len(stock_codes)} 只股票的最新日期")
+        return watermarks
+    except Exception as e:
+        logger.exception(f"批量查询股票最新日期失败: {str(e)}")
+        raise
+
 def get_positions_by_account(db_session, account_id, start_date=None, end_date=None, code=None):
     """查询指定账户的持仓记录
     
@@ -571,5 +751,189 @@ def get_positions_by_account(db_session, account_id, start_date=None, end_date=N
         logger.exception(f"查询持仓记录失败: {str(e)}")
         raise
 
+# ---------- 列投影读取 ----------
+# 看板只需要行数据：用 Core select 按列取出元组直接组成 DataFrame，不构造 ORM 对象、不触发关系的延迟加载。
+# DateTime 列按 SQLite 中存储的原始字符串读取，再整列解析，避免逐行转换。
+
+# 返回字典时日期时间列的格式
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def _projection(model, names=None):
+    """模型列的投影，DateTime 列以原始字符串读取
+
+    参数:
+        model: ORM 模型
+        names: 需要的列名，None 表示全部
+    返回:
+        (列列表, {列名: 目标类型})，目标类型 'datetime' 或 'float64'
+    """
+    table_columns = model.__table__.columns
+    columns, dtypes = [], {}
+    for column in (table_columns if names is None else [table_columns[name] for name in names]):
+        if isinstance(column.type, DateTime):
+            columns.append(type_coerce(column, String).label(column.name))
+            dtypes[column.name] = 'datetime'
+        else:
+            columns.append(column)
+            if isinstance(column.type, Float):
+                dtypes[column.name] = 'float64'
+    return columns, dtypes
+
+
+def _parse_datetime_column(values):
+    """SQLite 中以字符串存储的日期时间列 -> datetime64，缺失值为 NaT
+
+    ORM 写入的值带微秒（'%Y-%m-%d %H:%M:%S.%f'），数据库端 func.now() 生成的 CURRENT_TIMESTAMP 不带微秒，
+    同一列可能混有两种格式。先按长度补齐为带微秒的格式再按固定格式整列解析，不依赖各 pandas 版本的格式推断
+    """
+    values = pd.Series(values, dtype=object)
+    lengths = values.str.len()
+    values = values.mask(lengths == 19, values + '.000000')
+    values = values.mask(lengths == 10, values + ' 00:00:00.000000')
+    return pd.to_datetime(values, format='%Y-%m-%d %H:%M:%S.%f')
+
+
+def _execute_frame(db_session, stmt, dtypes):
+    """执行查询并直接由结果元组组成 DataFrame，按 dtypes 整列转换类型"""
+    result = db_session.execute(stmt)
+    df = pd.DataFrame.from_records(result.fetchall(), columns=list(result.keys()))
+    for name, dtype in dtypes.items():
+        if name not in df.columns:
+            continue
+        if dtype == 'datetime':
+            df[name] = _parse_datetime_column(df[name])
+        else:
+            # 整列缺失时结果为 object，统一为浮点
+            df[name] = df[name].astype(dtype)
+    return df
+
+
+def _select_frame(db_session, model, *criteria, order_by=(), limit=None):
+    """执行按列投影的查询，返回 DataFrame，DateTime 列解析为 datetime64"""
+    columns, dtypes = _projection(model)
+    stmt = select(*columns).where(*criteria).order_by(*order_by)
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    return _execute_frame(db_session, stmt, dtypes)
+
+
+def frame_to_records(df, datetime_format=None):
+    """DataFrame -> 字典列表，缺失值为 None
+
+    参数:
+        df: 查询结果
+        datetime_format: 不为空时日期时间列整列格式化为字符串
+    """
+    if datetime_format:
+        df = df.copy()
+        for name in df.columns[df.dtypes.map(pd.api.types.is_datetime64_any_dtype)]:
+            df[name] = df[name].dt.strftime(datetime_format)
+    return df.astype(object).where(df.notna(), None).to_dict('records')
+
+
+def get_portfolios_frame(db_session, account_id, start_date=None, end_date=None):
+    """按列读取指定账户的投资组合历史，按日期降序
+
+    参数与 get_portfolios_by_account 相同
+    返回:
+        DataFrame，每行一个投资组合记录
+    """
+    criteria = [Portfolio.account_id == account_id]
+    if start_date:
+        criteria.append(Portfolio.date >= start_date)
+    if end_date:
+        criteria.append(Portfolio.date <= end_date)
+    df = _select_frame(db_session, Portfolio, *criteria, order_by=[Portfolio.date.desc()])
+    logger.info(f"查询到账户{account_id}的{len(df)}个投资组合记录")
+    return df
+
+
+def get_positions_frame(db_session, portfolio_id=None, account_id=None, start_date=None, end_date=None, code=None):
+    """按列读取持仓记录
+
+    参数:
+        db_session: 数据库会话对象
+        portfolio_id: 投资组合ID（可选）
+        account_id: 账户ID（可选）；给出时按日期、创建时间降序，与 get_positions_by_account 一致，
+                    否则与 get_positions_by_portfolio 一样不排序
+        start_date, end_date, code: 过滤条件（可选）
+    返回:
+        DataFrame，每行一个持仓记录
+    """
+    criteria = []
+    if portfolio_id:
+        criteria.append(Position.portfolio_id == portfolio_id)
+    if account_id:
+        criteria.append(Position.account_id == account_id)
+    if start_date:
+        criteria.append(Position.date >= start_date)
+    if end_date:
+        criteria.append(Position.date <= end_date)
+    if code:
+        criteria.append(Position.code == code)
+    order_by = [Position.date.desc(), Position.created_at.desc()] if account_id else []
+    df = _select_frame(db_session, Position, *criteria, order_by=order_by)
+    logger.info(f"查询到{len(df)}条持仓记录")
+    return df
+
+
+def get_stock_frame(db_session, stock_code, limit=100):
+    """按列读取股票最近 limit 条K线，按 time_key 降序，time_key 为 datetime64"""
+    # 唯一索引 (code, time_key) 上的倒序范围扫描，取到 limit 条即停止，无需排序
+    return _select_frame(db_session, Stock, Stock.code == stock_code, order_by=[desc(Stock.time_key)], limit=limit)
+
+
+def get_stock_panel_frame(db_session, stock_codes, start_date=None, end_date=None, columns=None, limit=None,
+                          chunk_size=500):
+    """一次查询多只股票的K线，IN 列表按 chunk_size 分块
+
+    参数:
+        db_session: 数据库会话对象
+        stock_codes: 股票代码列表
+        start_date, end_date: 日期区间（可选），结束日期当天包含在内
+        columns: 除 code、time_key 外需要的列，None 表示全部
+        limit: 每只股票只取最近 limit 条（可选）
+        chunk_size: IN 列表分块大小，避免超过 SQLite 变量个数上限
+    返回:
+        按 (code, time_key) 升序的长表，time_key 为 datetime64，价格等数值列为 float64
+    """
+    names = ['code', 'time_key'] + [c for c in (columns or STOCK_COLUMNS) if c not in ('code', 'time_key')]
+    projection, dtypes = _projection(Stock, names)
+    criteria = []
+    # 按日期字符串比较：无论存储为 'YYYY-MM-DD HH:MM:SS' 还是带微秒，当天的K线都在区间内
+    time_key = type_coerce(Stock.time_key, String)
+    if start_date is not None:
+        criteria.append(time_key >= pd.Timestamp(start_date).strftime('%Y-%m-%d'))
+    if end_date is not None:
+        criteria.append(time_key < (pd.Timestamp(end_date) + pd.Timedelta(days=1)).strftime('%Y-%m-%d'))
+
+    stock_codes = sorted(set(stock_codes))
+    frames = []
+    try:
+        for start in range(0, len(stock_codes), chunk_size):
+            chunk_criteria = criteria + [Stock.code.in_(stock_codes[start:start + chunk_size])]
+            if limit is None:
+                stmt = select(*projection).where(*chunk_criteria).order_by(Stock.code, Stock.time_key)
+            else:
+                # 每只股票在唯一索引上倒序编号，只保留最近 limit 条
+                row_number = func.row_number().over(partition_by=Stock.code, order_by=Stock.time_key.desc())
+                ranked = select(*projection, row_number.label('rn')).where(*chunk_criteria).subquery()
+                stmt = (
+                    select(*[ranked.c[name] for name in names])
+                    .where(ranked.c.rn <= limit)
+                    .order_by(ranked.c.code, ranked.c.time_key)
+                )
+            frames.append(_execute_frame(db_session, stmt, dtypes))
+        if not frames:
+            frames.append(_execute_frame(db_session, select(*projection).limit(0), dtypes))
+        df = pd.concat(frames, ignore_index=True)
+        logger.info(f"查询到 {df['code'].nunique()}/{len(stock_codes)} 只股票的 {len(df)} 条K线")
+        return df
+    except Exception as e:
+        logger.exception(f"批量查询K线失败: {str(e)}")
+        raise
+
+
 if __name__ == "__main__":
     example_usage()
\ No newline at end of file
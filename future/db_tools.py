@@ -10,24 +10,28 @@ from db_schema import (
     update_portfolio,
     delete_portfolio,
     insert_position,
-    get_stock_data,
     update_stock,
     get_stock_name,
     delete_stock_data,
     clean_expired_data,
     insert_stock_kline,
-    get_latest_date_for_stock,
     get_positions_by_account,
-    Stock,
+    get_portfolios_frame,
+    get_positions_frame,
+    frame_to_records,
+    DATETIME_FORMAT,
     Position,
     Portfolio
 )
 from outlines import Template
-from sqlalchemy import func
-from futu import OpenQuoteContext, RET_OK
+from compact_panel import PricePanel
+from price_store import PriceStore, open_price_store
+from futu import RET_OK
+from quote_pool import get_quote_pool
 import logging
 from contextlib import contextmanager
 from fetch_kline_daily import get_market_snapshot
+from snapshot_service import get_snapshot_service
 from utils import get_ai_recommendation
 import json_repair
 
@@ -37,8 +41,8 @@ logger = logging.getLogger(__name__)
 
 
 def get_stock_pool(pool_name="全部"):
-    quote_ctx = OpenQuoteContext(host='127.0.0.1', port=11111)
-    ret, data = quote_ctx.get_user_security(pool_name)
+    with get_quote_pool().borrow() as quote_ctx:
+        ret, data = quote_ctx.get_user_security(pool_name)
     if ret == RET_OK:
         # print(data)
         if data.shape[0] > 0:  # 如果自选股列表不为空
@@ -48,7 +52,6 @@ def get_stock_pool(pool_name="全部"):
     else:
         print('error:', data)
         res = []
-    quote_ctx.close()
     return res
 class DatabaseTools:
     """
@@ -56,12 +59,13 @@ class DatabaseTools:
     提供会话管理和错误处理机制
     """
     
-    def __init__(self, db_file_or_manager='investment_portfolio.db'):
+    def __init__(self, db_file_or_manager='investment_portfolio.db', price_store='sqlite'):
         """
         初始化数据库工具类
         
         参数:
             db_file_or_manager: 数据库文件路径字符串 或 DatabaseManager对象
+            price_store: K线存储，PriceStore 对象或 'sqlite' / 'duckdb'；投资组合和持仓始终在 SQLite 中
         """
         if isinstance(db_file_or_manager, DatabaseManager):
             self.db_manager = db_file_or_manager
@@ -72,6 +76,9 @@ class DatabaseTools:
             # 假设是数据库文件路径
             self.db_manager = DatabaseManager(db_file_or_manager)
             self.db_manager.init_db()
+        if not isinstance(price_store, PriceStore):
+            price_store = open_price_store(price_store, self.db_manager)
+        self.price_store = price_store
 
     @contextmanager
     def get_session(self):
@@ -104,44 +111,15 @@ class DatabaseTools:
         查询指定账户的投资组合历史，并确保返回的数据不依赖于活动会话
         """
         with self.get_session() as session:
-            portfolios = get_portfolios_by_account(session, account_id, start_date, end_date)
-            # 转换为字典列表以避免会话关闭后的访问问题
-            result = []
-            for portfolio in portfolios:
-                # 创建字典并手动复制所有属性
-                portfolio_dict = {}
-                # 只获取基本属性，避免触发延迟加载
-                for attr in dir(portfolio):
-                    if not attr.startswith('_') and not callable(getattr(portfolio, attr)):
-                        value = getattr(portfolio, attr)
-                        # 处理日期时间格式
-                        if hasattr(value, 'strftime'):
-                            value = value.strftime('%Y-%m-%d %H:%M:%S')
-                        portfolio_dict[attr] = value
-                result.append(portfolio_dict)
-            return result
+            # 按列读取后整表转换为字典列表，日期时间列整列格式化
+            return frame_to_records(get_portfolios_frame(session, account_id, start_date, end_date), DATETIME_FORMAT)
     
     def get_positions_by_portfolio(self, portfolio_id):
         """
         查询指定投资组合的持仓，并确保返回的数据不依赖于活动会话
         """
         with self.get_session() as session:
-            positions = get_positions_by_portfolio(session, portfolio_id)
-            # 转换为字典列表以避免会话关闭后的访问问题
-            result = []
-            for position in positions:
-                # 创建字典并手动复制所有属性
-                position_dict = {}
-                # 只获取基本属性，避免触发延迟加载
-                for attr in dir(position):
-                    if not attr.startswith('_') and not callable(getattr(position, attr)):
-                        value = getattr(position, attr)
-                        # 处理日期时间格式
-                        if hasattr(value, 'strftime'):
-                            value = value.strftime('%Y-%m-%d %H:%M:%S')
-                        position_dict[attr] = value
-                result.append(position_dict)
-            return result
+            return frame_to_records(get_positions_frame(session, portfolio_id=portfolio_id), DATETIME_FORMAT)
     
     def update_portfolio(self, portfolio_id, update_data):
         """
@@ -166,10 +144,9 @@ class DatabaseTools:
     
     def get_stock_data(self, stock_code, limit=100):
         """
-        查询股票数据
+        查询股票最近 limit 条K线，按日期降序的字典列表
         """
-        with self.get_session() as session:
-            return get_stock_data(session, stock_code, limit)
+        return frame_to_records(self.price_store.recent(stock_code, limit))
     
     def update_stock(self, stock_data):
         """
@@ -192,34 +169,33 @@ class DatabaseTools:
         with self.get_session() as session:
             return insert_stock_kline(session, stock_data)
     
+    def upsert_stock_klines(self, df):
+        """
+        批量写入K线，(code, time_key) 冲突时更新
+        """
+        return self.price_store.write(df)
+    
     def get_latest_date_for_stock(self, stock_code):
         """
-        查询某个股票在表中最新的日期
+        查询某个股票在表中最新的日期，未找到时返回 None
         """
-        with self.get_session() as session:
-            return get_latest_date_for_stock(session, stock_code)
+        return self.price_store.latest_dates([stock_code]).get(stock_code)
+    
+    def get_latest_dates_for_stocks(self, stock_codes=None):
+        """
+        一次查询多只股票在表中的最新日期，返回 {股票代码: 最新日期}
+        """
+        return self.price_store.latest_dates(stock_codes)
     
     def get_positions_by_account(self, account_id, start_date=None, end_date=None, code=None):
         """
         查询指定账户的持仓记录
         """
         with self.get_session() as session:
-            positions = get_positions_by_account(session, account_id, start_date, end_date, code)
-            # 转换为字典列表以避免会话关闭后的访问问题
-            result = []
-            for position in positions:
-                # 创建字典并手动复制所有属性
-                position_dict = {}
-                # 只获取基本属性，避免触发延迟加载
-                for attr in dir(position):
-                    if not attr.startswith('_') and not callable(getattr(position, attr)):
-                        value = getattr(position, attr)
-                        # 处理日期时间格式
-                        if hasattr(value, 'strftime'):
-                            value = value.strftime('%Y-%m-%d %H:%M:%S')
-                        position_dict[attr] = value
-                result.append(position_dict)
-            return result
+            frame = get_positions_frame(
+                session, account_id=account_id, start_date=start_date, end_date=end_date, code=code
+            )
+            return frame_to_records(frame, DATETIME_FORMAT)
     
     def delete_position(self, position_id):
         """
@@ -245,34 +221,55 @@ class DatabaseTools:
         """
         查询缓存的股票数量
         """
-        with self.get_session() as session:
-            cnts = session.query(Stock.code).distinct().count()
-            return cnts
+        return self.price_store.count_codes()
     def get_total_kline_entries(self):
         """
         查询缓存的股票kline数据数量
         """
-        with self.get_session() as session:
-            cnts = session.query(Stock).count()
-            return cnts
+        return self.price_store.count_rows()
 
     def get_last_update_time(self):
         """
         查询数据库中最新的更新时间
         """
-        with self.get_session() as session:
-            last_update = session.query(func.max(Stock.time_key)).scalar()
-            return last_update
+        return self.price_store.last_update_time()
     def insert_portfolio_and_positions(self, account_id, portfolio_data, account_info):
         """
         新增投资组合数据到Portfolio表和Position表
         """
         with self.get_session() as session:
             return insert_portfolio_and_positions(session, account_id, portfolio_data, account_info)
-    def get_tech_summary(self, stock_code):
-        tmp_data = self.get_stock_data(stock_code, limit=100)
-        tmp_data = pd.DataFrame(tmp_data)
-        df = tmp_data.sort_values(by='time_key')
+    def get_stock_panel(self, codes, start=None, end=None, columns=None, limit=None, as_panel=False,
+                        price_dtype='float64'):
+        """
+        一次查询多只股票的K线（SQLite 存储时 IN 列表自动分块）
+
+        参数:
+            codes: 股票代码列表
+            start, end: 日期区间（可选），结束日期当天包含在内
+            columns: 除 code、time_key 外需要的列，None 表示全部
+            limit: 每只股票只取最近 limit 条（可选）
+            as_panel: 为 True 时返回对齐到共享交易日历的 PricePanel（columns 需均为数值列）
+            price_dtype: as_panel 时的价格类型，见 compact_panel
+        返回:
+            按 (code, time_key) 升序、类型已转换的长表，或 PricePanel
+        """
+        df = self.price_store.read(codes, start, end, columns, limit)
+        if not as_panel:
+            return df
+        value_columns = [c for c in df.columns if c not in ('code', 'time_key')]
+        return PricePanel.from_long(df, price_dtype, value_columns)
+
+    def get_tech_summary(self, stock_code, last_price=None, history=None):
+        """
+        计算技术指标摘要，last_price 为空时实时获取最新价
+
+        参数:
+            history: 该股票按时间升序的K线；为空时单独查询最近100条
+        """
+        if history is None:
+            history = self.get_stock_panel([stock_code], columns=['high', 'low', 'close', 'volume'], limit=100)
+        df = history.sort_values(by='time_key')
         df['ema_5'] = ta.EMA(df['close'].values, timeperiod=5)
         df['ema_10'] = ta.EMA(df['close'].values, timeperiod=10)
         df['ema_20'] = ta.EMA(df['close'].values, timeperiod=20)
@@ -301,15 +298,21 @@ class DatabaseTools:
             'rsi_14': df['rsi_14'].iloc[-10:].tolist(),
             'volume': df['volume'].iloc[-10:].tolist(),
         }
-        last_price = get_market_snapshot(stock_code)
+        if last_price is None:
+            last_price = get_market_snapshot(stock_code)
         return indicator, last_price
 
     def get_market_place(self):
         stock_pool = get_stock_pool("etf")
         tech_sum = dict()
+        # 先一次性取回全部最新价和K线，逐只调用大模型期间不再请求行情、查询数据库
+        prices = get_snapshot_service().get_prices(stock_pool)
+        panel = self.get_stock_panel(list(stock_pool), columns=['high', 'low', 'close', 'volume'], limit=100)
+        histories = dict(tuple(panel.groupby('code', sort=False)))
         for code, name in stock_pool.items():
             print(code, name)
-            indicator, last_price = self.get_tech_summary(code)
+            history = histories.get(code, panel.iloc[0:0])
+            indicator, last_price = self.get_tech_summary(code, prices[code], history)
             template = Template.from_file("prompts/single_etf_ana.jinja")
             prompt = template(
                 stock_code=code,
@@ -321,10 +324,10 @@ class DatabaseTools:
         return tech_sum
     def clean_expired_data(self):
         """
-        清理过期数据
+        清理过期数据，返回迁移后的数据库版本
         """
         with self.get_session() as session:
-            clean_expired_data(session)
+            return clean_expired_data(session)
     def get_stock_name(self, stock_code):
         """
         查询股票名称
@@ -0,0 +1,272 @@
+# 选股结果事件研究 - 基于缓存的远期收益矩阵评估选股器
+"""
+远期收益矩阵（1/5/10/20日收益、最大有利/不利波动、相对基准超额）按数据版本只构建一次并落盘，
+之后评估任意选股器或参数组合只是对 日期×股票 信号矩阵做一次掩码聚合。
+
+约定：以信号日收盘价为入场价，h 日远期收益 = close[t+h] / close[t] - 1，t+h 为该股票之后的第 h 个交易日
+（停牌日不计入）；MFE/MAE 使用 (t, t+h] 区间内的最高价/最低价。
+"""
+
+import argparse
+import logging
+import os
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from compact_panel import PRICE_DTYPES, load_panel
+from kline_dataset import dataset_version
+from portfolio_backtest import (
+    pivot_panel,
+    load_selectors,
+    load_or_build_signal_matrix,
+    signal_cache_file,
+)
+
+logger = logging.getLogger(__name__)
+
+HORIZONS = (1, 5, 10, 20)
+
+
+def _forward_extreme(panel: np.ndarray, h: int, func) -> np.ndarray:
+    """计算 (t, t+h] 区间的滚动极值，窗口不足 h 时为 NaN"""
+    n = panel.shape[0]
+    out = np.full(panel.shape, np.nan)
+    if n <= h:
+        return out
+    # 窗口 [t+1, t+h] 的极值 = 依次取 h 个错位切片的逐元素极值
+    acc = panel[1:n - h + 1].copy()
+    for k in range(2, h + 1):
+        acc = func(acc, panel[k:n - h + k])
+    out[:n - h] = acc
+    return out
+
+
+class ForwardReturnCache:
+    """
+    按数据版本缓存的远期收益矩阵
+
+    属性:
+        dates, codes: 行/列标签
+        returns[h]: 日期×股票 h日远期收益
+        excess[h]: 相对基准的超额收益
+        mfe[h], mae[h]: 最大有利/不利波动
+    """
+
+    def __init__(self, dates, codes, returns, excess, mfe, mae, version=None):
+        self.dates = pd.DatetimeIndex(dates)
+        self.codes = pd.Index(codes)
+        self.returns = returns
+        self.excess = excess
+        self.mfe = mfe
+        self.mae = mae
+        self.version = version
+
+    @property
+    def horizons(self) -> List[int]:
+        return sorted(self.returns.keys())
+
+    @classmethod
+    def build(cls, df: pd.DataFrame, horizons: Iterable[int] = HORIZONS, benchmark: Optional[str] = None, version=None):
+        """
+        从K线长表构建远期收益矩阵
+
+        h 日指该股票自己的 h 个交易日：每列的有效行先稳定地移到列首，在只含交易日的序列上错位计算后再放回原日期，
+        区间内遇到停牌时向后顺延，而不是因为对齐后的第 t+h 行为 NaN 而丢弃该事件
+
+        参数:
+            df: 含 code/time_key/high/low/close 的长表
+            horizons: 远期收益周期（交易日）
+            benchmark: 基准代码；为 None 时使用全市场等权平均收益
+        """
+        close = pivot_panel(df, 'close')
+        high = pivot_panel(df, 'high').reindex_like(close).to_numpy(dtype=np.float64)
+        low = pivot_panel(df, 'low').reindex_like(close).to_numpy(dtype=np.float64)
+        close_arr = close.to_numpy(dtype=np.float64)
+        mask = ~np.isnan(close_arr)
+        order = np.argsort(~mask, axis=0, kind='stable')
+
+        def pack(values):
+            return np.take_along_axis(values, order, axis=0)
+
+        def unpack(packed):
+            out = np.empty_like(packed)
+            np.put_along_axis(out, order, packed, axis=0)
+            out[~mask] = np.nan
+            return out
+
+        close_p, high_p, low_p = pack(close_arr), pack(high), pack(low)
+        n = close_arr.shape[0]
+
+        returns, excess, mfe, mae = {}, {}, {}, {}
+        for h in horizons:
+            # 列尾的无效行收盘价为 NaN，剩余交易日不足 h 的事件远期收益为 NaN
+            fwd_p = np.full(close_p.shape, np.nan)
+            if n > h:
+                fwd_p[:n - h] = close_p[h:] / close_p[:n - h] - 1
+            incomplete = np.isnan(fwd_p)
+            fwd = unpack(fwd_p)
+            if benchmark is not None and benchmark in close.columns:
+                bench = fwd[:, close.columns.get_loc(benchmark)]
+            else:
+                valid = ~np.isnan(fwd)
+                counts = valid.sum(axis=1)
+                bench = np.where(counts > 0, np.where(valid, fwd, 0.0).sum(axis=1) / np.maximum(counts, 1), np.nan)
+            returns[h] = fwd
+            excess[h] = fwd - bench[:, None]
+            mfe[h] = unpack(np.where(incomplete, np.nan, _forward_extreme(high_p, h, np.fmax) / close_p - 1))
+            mae[h] = unpack(np.where(incomplete, np.nan, _forward_extreme(low_p, h, np.fmin) / close_p - 1))
+        return cls(close.index, close.columns, returns, excess, mfe, mae, version=version)
+
+    def save(self, cache_file: str) -> None:
+        arrays = {'dates': self.dates.values.astype('datetime64[ns]').astype(np.int64), 'codes': np.asarray(self.codes, dtype=str)}
+        for h in self.horizons:
+            arrays[f'ret_{h}'] = self.returns[h]
+            arrays[f'excess_{h}'] = self.excess[h]
+            arrays[f'mfe_{h}'] = self.mfe[h]
+            arrays[f'mae_{h}'] = self.mae[h]
+        os.makedirs(os.path.dirname(cache_file) or '.', exist_ok=True)
+        tmp_file = f'{cache_file}.tmp.npz'
+        np.savez(tmp_file, **arrays)
+        os.replace(tmp_file, cache_file)
+
+    @classmethod
+    def load(cls, cache_file: str, version=None):
+        with np.load(cache_file) as z:
+            horizons = sorted(int(k.split('_')[1]) for k in z.files if k.startswith('ret_'))
+            return cls(
+                pd.to_datetime(z['dates']),
+                z['codes'].tolist(),
+                {h: z[f'ret_{h}'] for h in horizons},
+                {h: z[f'excess_{h}'] for h in horizons},
+                {h: z[f'mfe_{h}'] for h in horizons},
+                {h: z[f'mae_{h}'] for h in horizons},
+                version=version,
+            )
+
+    @classmethod
+    def load_or_build(cls, kline_file: str, cache_dir: str = 'data/event_cache', horizons=HORIZONS, benchmark=None):
+        """同一数据版本只构建一次，之后直接读取缓存"""
+        version = dataset_version(kline_file)
+        tag = '_'.join(map(str, horizons)) + (f'_{benchmark}' if benchmark else '')
+        cache_file = os.path.join(cache_dir, f'fwd_{version}_{tag}.npz')
+        if os.path.exists(cache_file):
+            return cls.load(cache_file, version=version)
+        df = pd.read_parquet(kline_file, columns=['code', 'time_key', 'high', 'low', 'close'])
+        df['time_key'] = pd.to_datetime(df['time_key'])
+        cache = cls.build(df, horizons=horizons, benchmark=benchmark, version=version)
+        cache.save(cache_file)
+        logger.info(f"远期收益矩阵已缓存: {cache_file}")
+        return cache
+
+    def align(self, signals: pd.DataFrame) -> np.ndarray:
+        """把信号矩阵对齐到缓存的 日期×股票 网格，返回布尔掩码"""
+        aligned = signals.reindex(index=self.dates, columns=self.codes)
+        return aligned.fillna(False).to_numpy(dtype=bool)
+
+    def evaluate(self, signals: pd.DataFrame) -> pd.DataFrame:
+        """
+        对信号矩阵做掩码聚合
+
+        返回:
+            每个周期一行：样本数、被丢弃的信号数（信号日无K线或之后不足 h 个交易日）、
+            平均/中位收益、胜率、平均超额、超额胜率、平均MFE/MAE
+        """
+        mask = self.align(signals)
+        rows = []
+        for h in self.horizons:
+            ret = self.returns[h][mask]
+            valid = ~np.isnan(ret)
+            dropped = int(ret.size - valid.sum())
+            if dropped:
+                logger.info(f"{h}日周期丢弃 {dropped} 个没有完整远期收益的信号")
+            ret = ret[valid]
+            excess = self.excess[h][mask][valid]
+            mfe = self.mfe[h][mask][valid]
+            mae = self.mae[h][mask][valid]
+            count = int(ret.size)
+            rows.append({
+                'horizon': h,
+                'events': count,
+                'dropped': dropped,
+                'mean_return': float(ret.mean()) if count else np.nan,
+                'median_return': float(np.median(ret)) if count else np.nan,
+                'hit_rate': float((ret > 0).mean()) if count else np.nan,
+                'mean_excess': float(np.nanmean(excess)) if count else np.nan,
+                'excess_hit_rate': float((excess > 0).mean()) if count else np.nan,
+                'mean_mfe': float(np.nanmean(mfe)) if count else np.nan,
+                'mean_mae': float(np.nanmean(mae)) if count else np.nan,
+            })
+        return pd.DataFrame(rows)
+
+
+def picks_to_signal_matrix(picks: Dict[pd.Timestamp, List[str]], dates=None, codes=None) -> pd.DataFrame:
+    """把 {日期: select() 结果} 转换为 日期×股票 布尔信号矩阵"""
+    index = pd.DatetimeIndex(dates if dates is not None else sorted(picks.keys()), name='time_key')
+    columns = codes if codes is not None else sorted({c for p in picks.values() for c in p})
+    signals = pd.DataFrame(False, index=index, columns=columns)
+    for date, codes_on_date in picks.items():
+        date = pd.Timestamp(date)
+        if date in signals.index and codes_on_date:
+            signals.loc[date, [c for c in codes_on_date if c in signals.columns]] = True
+    return signals
+
+
+def selector_report(
+    kline_file: str,
+    config_file: str,
+    start_date: str,
+    end_date: str,
+    signal_cache_dir: str = 'data/signal_cache',
+    event_cache_dir: str = 'data/event_cache',
+    benchmark: Optional[str] = None,
+    processes: Optional[int] = None,
+    price_dtype: str = 'float64',
+) -> pd.DataFrame:
+    """
+    为 configs.json 中每个启用的选股器生成事件研究报表，合并为一张长表
+
+    参数:
+        price_dtype: 选股器 hist 的价格类型，与组合回测共用信号缓存时需一致
+    """
+    cache = ForwardReturnCache.load_or_build(kline_file, event_cache_dir, benchmark=benchmark)
+    dates = cache.dates[(cache.dates >= pd.Timestamp(start_date)) & (cache.dates <= pd.Timestamp(end_date))]
+    data = load_panel(kline_file, price_dtype=price_dtype).code_frames()
+
+    tables = []
+    for alias, selector in load_selectors(config_file):
+        cache_file = signal_cache_file(signal_cache_dir, cache.version, selector, price_dtype)
+        signals = load_or_build_signal_matrix(selector, data, dates, cache_file=cache_file, processes=processes)
+        table = cache.evaluate(signals)
+        table.insert(0, 'selector', alias)
+        tables.append(table)
+    return pd.concat(tables, ignore_index=True) if tables else pd.DataFrame()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="选股器远期收益事件研究")
+    parser.add_argument("--data-file", default="./data/kline_data.parquet", help="K线parquet文件")
+    parser.add_argument("--config", default="../Inference/configs.json", help="Selector 配置文件")
+    parser.add_argument("--start-date", required=True, help="开始日期 (YYYY-MM-DD)")
+    parser.add_argument("--end-date", required=True, help="结束日期 (YYYY-MM-DD)")
+    parser.add_argument("--benchmark", default=None, help="基准代码，缺省为全市场等权")
+    parser.add_argument("--output", default="selector_event_study.csv", help="报表输出路径")
+    parser.add_argument("--processes", type=int, default=None, help="构建信号矩阵的并行进程数")
+    parser.add_argument("--price-dtype", choices=PRICE_DTYPES, default='float64',
+                        help="选股器使用的面板价格类型，float32 内存减半，int32 为 tick 存储")
+    args = parser.parse_args()
+
+    report = selector_report(
+        args.data_file, args.config, args.start_date, args.end_date,
+        benchmark=args.benchmark, processes=args.processes, price_dtype=args.price_dtype,
+    )
+    with pd.option_context('display.max_columns', None, 'display.width', 200):
+        print(report)
+    report.to_csv(args.output, index=False)
+    print(f"报表已保存到: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,297 @@
+# 本地模拟的富途 OpenD 行情网关 - 离线运行、压测抓取和选股链路
+"""
+FakeOpenD 从 parquet K线夹具读取数据，FakeQuoteContext 实现项目用到的 OpenQuoteContext 接口:
+
+    request_history_kline（分页）、get_market_snapshot、get_user_security、
+    get_plate_list、get_plate_stock、get_stock_filter、get_global_state、close
+
+配额按 30 秒窗口在所有连接间共享（与真实网关按账户计算一致），超出时返回 RET_ERROR；
+还可配置每次请求的延迟、随机错误率，以及请求若干次后断开连接，用于验证重试和连接池重连。
+
+用法:
+    server = FakeOpenD('data/kline_data.parquet', latency=0.05, error_rate=0.01)
+    server.install()            # 替换共享行情连接池，之后所有 get_quote_pool() 的调用都走本地模拟
+"""
+
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from types import SimpleNamespace
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+import talib as ta
+from futu import RET_ERROR, RET_OK
+from futu.common.open_context_base import ContextStatus
+
+from quote_pool import QuoteContextPool, set_quote_pool
+
+QUOTA_WINDOW = 30.0
+# 各接口每 30 秒的请求次数上限，参考富途接口限频
+DEFAULT_QUOTAS = {
+    'request_history_kline': 60,
+    'get_market_snapshot': 60,
+    'get_plate_list': 10,
+    'get_plate_stock': 10,
+    'get_stock_filter': 10,
+}
+# 单次快照请求的最大股票数
+MAX_SNAPSHOT_CODES = 400
+# 条件选股单页最大返回数
+MAX_FILTER_PAGE = 200
+
+
+class FakeOpenD:
+    """
+    模拟网关，持有夹具数据、配额计数和故障配置，可创建任意多个 FakeQuoteContext
+
+    参数:
+        kline_file: K线夹具（code/name/time_key/open/close/high/low/... 长表）
+        groups: 自选股分组 {分组名: 代码列表}，默认 '全部' 为夹具中的全部代码
+        plates: 板块 {板块代码: (板块名, 代码列表)}，默认按 市场.代码前两位 自动生成
+        latency: 每次请求的延迟秒数，或 (最小, 最大) 均匀分布
+        quotas: 各接口每个窗口的请求上限，None 表示不限
+        quota_window: 配额窗口长度（秒），默认与网关一致为 30 秒，测试时可缩短
+        error_rate: 每次请求随机返回错误的概率
+        disconnect_after: 每个连接请求该次数后断开，None 表示不断开
+        seed: 随机种子
+    """
+
+    def __init__(
+        self,
+        kline_file: str = 'data/kline_data.parquet',
+        groups: Optional[Dict[str, List[str]]] = None,
+        plates: Optional[Dict[str, Tuple[str, List[str]]]] = None,
+        latency: Union[float, Tuple[float, float]] = 0.0,
+        quotas: Optional[Dict[str, int]] = DEFAULT_QUOTAS,
+        quota_window: float = QUOTA_WINDOW,
+        error_rate: float = 0.0,
+        disconnect_after: Optional[int] = None,
+        seed: Optional[int] = None,
+    ):
+        df = pd.read_parquet(kline_file)
+        df['time_key'] = pd.to_datetime(df['time_key'])
+        self.klines = {code: g.sort_values('time_key').reset_index(drop=True) for code, g in df.groupby('code')}
+        self.names = {code: g['name'].iloc[-1] for code, g in self.klines.items()}
+        self.groups = groups or {'全部': sorted(self.klines)}
+        self.plates = plates or self._default_plates()
+        self.latency = latency
+        self.quotas = quotas or {}
+        self.quota_window = quota_window
+        self.error_rate = error_rate
+        self.disconnect_after = disconnect_after
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._calls = defaultdict(deque)
+        self.stats = defaultdict(int)
+
+    def _default_plates(self) -> Dict[str, Tuple[str, List[str]]]:
+        plates = defaultdict(list)
+        for code in self.klines:
+            market, symbol = code.split('.', 1)
+            plates[f'{market}.BK{symbol[:2]}'].append(code)
+        return {plate: (f'模拟板块{plate}', codes) for plate, codes in plates.items()}
+
+    def new_context(self) -> 'FakeQuoteContext':
+        return FakeQuoteContext(self)
+
+    def install(self, max_size: int = 4) -> QuoteContextPool:
+        """用本地模拟替换进程内共享的行情连接池"""
+        pool = QuoteContextPool(max_size=max_size, context_factory=self.new_context)
+        set_quote_pool(pool)
+        return pool
+
+    def _admit(self, method: str) -> Optional[str]:
+        """模拟延迟、配额和随机错误；允许请求时返回 None，否则返回错误信息"""
+        if self.latency:
+            low, high = self.latency if isinstance(self.latency, tuple) else (self.latency, self.latency)
+            time.sleep(self._rng.uniform(low, high))
+        with self._lock:
+            self.stats[method] += 1
+            limit = self.quotas.get(method)
+            if limit is not None:
+                calls = self._calls[method]
+                now = time.monotonic()
+                while calls and now - calls[0] >= self.quota_window:
+                    calls.popleft()
+                if len(calls) >= limit:
+                    self.stats['quota_rejected'] += 1
+                    return f'{method} 请求频率太高，{self.quota_window:g}秒内最多{limit}次'
+                calls.append(now)
+            if self.error_rate and self._rng.random() < self.error_rate:
+                self.stats['injected_errors'] += 1
+                return '模拟网络错误'
+        return None
+
+    def snapshot_row(self, code: str) -> Dict:
+        bars = self.klines[code]
+        last = bars.iloc[-1]
+        prev_close = bars['close'].iloc[-2] if len(bars) > 1 else last['open']
+        return {
+            'code': code,
+            'name': self.names[code],
+            'update_time': last['time_key'].strftime('%Y-%m-%d 15:00:00'),
+            'last_price': last['close'],
+            'open_price': last['open'],
+            'high_price': last['high'],
+            'low_price': last['low'],
+            'prev_close_price': prev_close,
+            'pe_ratio': last.get('pe_ratio'),
+            'volume': last['volume'],
+            'turnover': last.get('turnover'),
+            'turnover_rate': last.get('turnover_rate'),
+        }
+
+    def indicator(self, code: str, field: str, para: Optional[Sequence[int]] = None) -> float:
+        """计算条件选股用到的最新指标值，不支持的指标返回 NaN"""
+        bars = self.klines[code]
+        if field == 'CUR_PRICE':
+            return float(bars['close'].iloc[-1])
+        if field in ('KDJ_K', 'KDJ_D', 'KDJ_J'):
+            n, m1, m2 = (list(para or []) + [9, 3, 3][len(para or []):])[:3]
+            high, low, close = (bars[c].to_numpy(dtype=np.float64) for c in ('high', 'low', 'close'))
+            k, d = ta.STOCH(high, low, close, fastk_period=n, slowk_period=m1, slowd_period=m2)
+            return float({'KDJ_K': k, 'KDJ_D': d, 'KDJ_J': 3 * k - 2 * d}[field][-1])
+        return float('nan')
+
+
+def _field_name(field) -> str:
+    return getattr(field, 'name', None) or str(field)
+
+
+class FakeQuoteContext:
+    """OpenQuoteContext 的本地替身，请求由所属 FakeOpenD 提供数据"""
+
+    def __init__(self, server: FakeOpenD):
+        self.server = server
+        self.status = ContextStatus.READY
+        self._requests = 0
+        self._pages = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def close(self):
+        self.status = ContextStatus.CLOSED
+
+    def _call(self, method: str) -> Optional[str]:
+        if self.status == ContextStatus.CLOSED:
+            return '连接已断开'
+        self._requests += 1
+        limit = self.server.disconnect_after
+        if limit is not None and self._requests > limit:
+            self.status = ContextStatus.CLOSED
+            return '连接已断开'
+        return self.server._admit(method)
+
+    def get_global_state(self):
+        if self.status == ContextStatus.CLOSED:
+            return RET_ERROR, '连接已断开'
+        return RET_OK, {'qot_logined': True}
+
+    def request_history_kline(self, code, start=None, end=None, ktype='K_DAY', autype='qfq', fields=None,
+                              max_count=1000, page_req_key=None, extended_time=False, session='N/A'):
+        error = self._call('request_history_kline')
+        if error:
+            return RET_ERROR, error, None
+        bars = self.server.klines.get(code)
+        if bars is None:
+            return RET_ERROR, f'未知股票 {code}', None
+        if page_req_key is None:
+            end_ts = pd.Timestamp(end) if end else bars['time_key'].max()
+            start_ts = pd.Timestamp(start) if start else end_ts - pd.Timedelta(days=365)
+            mask = (bars['time_key'] >= start_ts) & (bars['time_key'] < end_ts.normalize() + pd.Timedelta(days=1))
+            offset, rows = 0, bars[mask]
+        else:
+            offset, rows = self._pages.pop(page_req_key)
+        page = rows.iloc[offset:offset + max_count].copy()
+        page['time_key'] = page['time_key'].dt.strftime('%Y-%m-%d 00:00:00')
+        next_key = None
+        if offset + max_count < len(rows):
+            next_key = f'{code}:{offset + max_count}'.encode()
+            self._pages[next_key] = (offset + max_count, rows)
+        return RET_OK, page.reset_index(drop=True), next_key
+
+    def get_market_snapshot(self, code_list):
+        codes = [code_list] if isinstance(code_list, str) else list(code_list)
+        if len(codes) > MAX_SNAPSHOT_CODES:
+            return RET_ERROR, f'单次最多请求{MAX_SNAPSHOT_CODES}只股票'
+        error = self._call('get_market_snapshot')
+        if error:
+            return RET_ERROR, error
+        unknown = [c for c in codes if c not in self.server.klines]
+        if unknown:
+            return RET_ERROR, f'未知股票 {unknown}'
+        return RET_OK, pd.DataFrame([self.server.snapshot_row(c) for c in codes])
+
+    def get_user_security(self, group_name):
+        error = self._call('get_user_security')
+        if error:
+            return RET_ERROR, error
+        if group_name not in self.server.groups:
+            return RET_ERROR, f'未找到分组 {group_name}'
+        codes = self.server.groups[group_name]
+        return RET_OK, pd.DataFrame({'code': codes, 'name': [self.server.names.get(c, c) for c in codes]})
+
+    def get_plate_list(self, market, plate_class):
+        error = self._call('get_plate_list')
+        if error:
+            return RET_ERROR, error
+        market = _field_name(market)
+        rows = [
+            {'code': plate, 'plate_name': name, 'plate_id': plate.split('.', 1)[1]}
+            for plate, (name, _) in self.server.plates.items() if plate.startswith(f'{market}.')
+        ]
+        return RET_OK, pd.DataFrame(rows, columns=['code', 'plate_name', 'plate_id'])
+
+    def get_plate_stock(self, plate_code, sort_field='CODE', ascend=True):
+        error = self._call('get_plate_stock')
+        if error:
+            return RET_ERROR, error
+        if plate_code not in self.server.plates:
+            return RET_ERROR, f'未找到板块 {plate_code}'
+        codes = sorted(self.server.plates[plate_code][1], reverse=not ascend)
+        return RET_OK, pd.DataFrame({'code': codes, 'stock_name': [self.server.names[c] for c in codes]})
+
+    def _match(self, code: str, flt) -> bool:
+        # is_no_filter 为 True 时该字段只返回不筛选
+        if flt.is_no_filter:
+            return True
+        if hasattr(flt, 'stock_field1'):
+            left = self.server.indicator(code, _field_name(flt.stock_field1), flt.stock_field1_para)
+            if _field_name(flt.stock_field2) == 'VALUE':
+                right = getattr(flt, 'value', float('nan'))
+            else:
+                right = self.server.indicator(code, _field_name(flt.stock_field2), flt.stock_field2_para)
+            if np.isnan(left) or np.isnan(right):
+                return False
+            position = _field_name(flt.relative_position)
+            return left < right if position == 'LESS' else left > right
+        value = self.server.indicator(code, _field_name(flt.stock_field))
+        if np.isnan(value):
+            return True
+        low = flt.filter_min if flt.filter_min is not None else -np.inf
+        high = flt.filter_max if flt.filter_max is not None else np.inf
+        return low <= value <= high
+
+    def get_stock_filter(self, market, filter_list=None, plate_code=None, begin=0, num=MAX_FILTER_PAGE):
+        error = self._call('get_stock_filter')
+        if error:
+            return RET_ERROR, error
+        if plate_code is not None:
+            if plate_code not in self.server.plates:
+                return RET_ERROR, f'未找到板块 {plate_code}'
+            candidates = self.server.plates[plate_code][1]
+        else:
+            candidates = [c for c in self.server.klines if c.startswith(f'{_field_name(market)}.')]
+        matched = [c for c in sorted(candidates) if all(self._match(c, f) for f in (filter_list or []))]
+        page = matched[begin:begin + min(num, MAX_FILTER_PAGE)]
+        items = [SimpleNamespace(stock_code=c, stock_name=self.server.names[c]) for c in page]
+        last_page = begin + len(page) >= len(matched)
+        return RET_OK, (last_page, len(matched), items)
@@ -6,21 +6,24 @@ import json
 from futu import *
 import time
 import datetime
+import os
+from quote_pool import get_quote_pool
+from snapshot_service import get_snapshot_service
+from hist_kline_scheduler import HistKlineScheduler
+from parquet_sink import ParquetSink
+from ingest_checkpoint import IngestCheckpoint
+from kline_dataset import append_daily, build_dataset_from_parquet, compact_in_background, dataset_version
+from market_store import publish_source, publish_source_append
+from kline_bars import FREQS, materialize_bars
+from minute_store import MINUTE_COLUMNS, MINUTE_STORE_DIR, MinuteStore
 
 def get_market_snapshot(codes: str):
-    quote_ctx = OpenQuoteContext(host='127.0.0.1', port=11111)
-
-    ret, data = quote_ctx.get_market_snapshot(codes)
-    if ret == RET_OK:
-        last_price = data['last_price'][0]
-    else:
-        print('error:', data)
-    quote_ctx.close()
-    return last_price
+    # 经快照服务获取，短时间内重复取价命中缓存；多只股票请用 get_snapshot_service().get_prices
+    return get_snapshot_service().get(codes)['last_price']
 
 def get_stock_pool(pool_name="全部"):
-    quote_ctx = OpenQuoteContext(host='127.0.0.1', port=11111)
-    ret, data = quote_ctx.get_user_security(pool_name)
+    with get_quote_pool().borrow() as quote_ctx:
+        ret, data = quote_ctx.get_user_security(pool_name)
     if ret == RET_OK:
         # print(data)
         if data.shape[0] > 0:  # 如果自选股列表不为空
@@ -30,23 +33,21 @@ def get_stock_pool(pool_name="全部"):
     else:
         print('error:', data)
         res = []
-    quote_ctx.close()
     return res
 # 从 config.yaml 文件中读取配置
 with open('config.yaml', 'r', encoding='utf-8') as f:
     config = yaml.safe_load(f)
 TARGET_POOLS = get_stock_pool("etf")
 daily_columns = ['code', 'name', 'update_time', 'last_price', 'open_price', 'high_price', \
-    'low_price', 'pe_ratio', 'volume', 'turnover', 'turnover_rate']
+    'low_price', 'prev_close_price', 'pe_ratio', 'volume', 'turnover', 'turnover_rate']
 columns_dict = config['columns_dict']
 hist_columns = ['code', 'name', 'time_key', 'open', \
     'close', 'high', 'low', 'pe_ratio', 'volume', \
         'turnover_rate', 'turnover', 'change_rate']
         
 def acquire_security_list():
-    quote_ctx = OpenQuoteContext(host='127.0.0.1', port=11111)
-    ret, data = quote_ctx.get_user_security("全部")
-    quote_ctx.close()
+    with get_quote_pool().borrow() as quote_ctx:
+        ret, data = quote_ctx.get_user_security("全部")
     if ret == RET_OK:
         if data.shape[0] > 0:  # 如果自选股列表不为空
             return data['code'].values.tolist()
@@ -63,89 +64,144 @@ class KlineFetcher:
 
     @staticmethod
     def fetch_kline_daily(daily_columns: list, target_data: list):
-        quote_ctx = OpenQuoteContext(host='127.0.0.1', port=11111)
-        ret, data = quote_ctx.get_market_snapshot(target_data)
+        with get_quote_pool().borrow() as quote_ctx:
+            ret, data = quote_ctx.get_market_snapshot(target_data)
         if ret == RET_OK:
             data = data[daily_columns]
-            quote_ctx.close()
             return data
         else:
             print('error:', data)
-            quote_ctx.close()
             return None
     
     def process_daily_kline(self, data):
         data = data.rename(columns=columns_dict)
         data['time_key'] = [datetime.datetime.strptime(x[:10], "%Y-%m-%d") for x in data['time_key']]
-        data['change_rate'] = (data['close'] - data['open']) / data['open']
+        # 与历史K线一致：涨跌幅为相对昨收的百分比（1.5 表示涨 1.5%）
+        data['change_rate'] = (data['close'] / data['prev_close_price'] - 1) * 100
         data['change_rate'] = data['change_rate'].round(4)
         return data
 
     def fetch_hist_kline(self, code, start, end, ktype=KLType.K_DAY, max_count=200, timeout=30):
-        quote_ctx = OpenQuoteContext(host='127.0.0.1', port=11111)
-        
         try:
-            ret, data, page_req_key = quote_ctx.request_history_kline(code, start=start, 
-            end=end, ktype=ktype, max_count=max_count)
-            if ret != RET_OK:
-                print(f'Error fetching data for {code}: {data}')
-                return None
-            
-            data = data[hist_columns]
-            page_count = 1
-            max_pages = 100  # 设置最大页数，防止无限循环
-            
-            while page_req_key != None and page_count < max_pages:
-                print(f'Fetching page {page_count} for {code}...')
-                ret, new_data, page_req_key = quote_ctx.request_history_kline(code, start=start, 
-                end=end, ktype=ktype, max_count=200, page_req_key=page_req_key)
-                
+            with get_quote_pool().borrow() as quote_ctx:
+                ret, data, page_req_key = quote_ctx.request_history_kline(code, start=start, 
+                end=end, ktype=ktype, max_count=max_count)
                 if ret != RET_OK:
-                    print(f'Error fetching page {page_count} for {code}: {data}')
-                    break
+                    print(f'Error fetching data for {code}: {data}')
+                    return None
                 
-                new_data = new_data[hist_columns]
-                data = pd.concat([data, new_data], axis=0)
-                page_count += 1
+                pages = [data[hist_columns]]
+                page_count = 1
+                max_pages = 100  # 设置最大页数，防止无限循环
                 
+                while page_req_key != None and page_count < max_pages:
+                    print(f'Fetching page {page_count} for {code}...')
+                    ret, new_data, page_req_key = quote_ctx.request_history_kline(code, start=start, 
+                    end=end, ktype=ktype, max_count=200, page_req_key=page_req_key)
+                    
+                    if ret != RET_OK:
+                        print(f'Error fetching page {page_count} for {code}: {data}')
+                        break
+                    
+                    pages.append(new_data[hist_columns])
+                    page_count += 1
+                    
+            # 所有分页收齐后只合并一次
+            data = pd.concat(pages, axis=0)
             print(f'Finished fetching data for {code}, total pages: {page_count}')
             return data
         except Exception as e:
             print(f'Exception occurred for {code}: {str(e)}')
             return None
-        finally:
-            quote_ctx.close()
     
-    def hist_kline_persistence(self, file_name, start_date='2024-01-01'):
+    def hist_kline_persistence(self, file_name, start_date='2024-01-01', max_workers=None, return_data=True, resume=True):
+        """
+        抓取全部股票的历史K线并保存为 parquet
+
+        每抓到一页立即写入暂存目录并记录该股票的水位线，中途失败后重跑会跳过已完成的股票、
+        未完成的从水位线继续；全部抓取后逐只股票作为一个 row group 合并为最终文件，内存占用与股票数量无关。
+        resume=False 时丢弃暂存进度重新抓取；return_data=False 时只返回文件路径
+        """
         yesterday = (datetime.datetime.now() - datetime.timedelta(days=1)).strftime('%Y-%m-%d')
-        final_data = pd.DataFrame(columns=self.hist_columns)  # 修复列名初始化
-        
-        total_stocks = len(self.target_pools)
-        for i, item in enumerate(self.target_pools):
-            print(f'Processing stock {i+1}/{total_stocks}: {item}')
-            data = self.fetch_hist_kline(item, start_date, yesterday)
-            
-            if data is not None and not data.empty:
-                data['time_key'] = [datetime.datetime.strptime(x[:10], "%Y-%m-%d") for x in data['time_key']]
-                data['change_rate'] = data['change_rate'].round(4)
-                final_data = pd.concat([final_data, data], axis=0)
-            else:
-                print(f'Skipping {item} due to empty data')
+        file_path = f'{self.save_dir}/{file_name}.parquet'
+        checkpoint = IngestCheckpoint(f'{self.save_dir}/.staging/{file_name}', {'start_date': start_date})
+        if not resume:
+            checkpoint.reset()
+        plan = checkpoint.plan(self.target_pools, start_date, yesterday)
+        print(f'{len(plan)} stocks to fetch, {len(set(self.target_pools)) - len(plan)} already up to date')
+
+        def on_page(code, data):
+            data = data.copy()
+            data['time_key'] = pd.to_datetime(data['time_key'].str[:10])
+            data['change_rate'] = data['change_rate'].round(4)
+            checkpoint.write_page(code, data)
+
+        # 多只股票并发抓取，请求频率由调度器的滑动窗口限频器控制在接口配额内
+        scheduler = HistKlineScheduler(columns=self.hist_columns, max_workers=max_workers)
+        for item, _ in scheduler.run(list(plan), start_date, yesterday, on_page=on_page, starts=plan):
+            if item not in scheduler.failed:
+                checkpoint.mark_done(item, yesterday)
         
-        final_data.to_parquet(f'{self.save_dir}/{file_name}.parquet', index=False)
-        print(f'Data saved to {self.save_dir}/{file_name}.parquet')
-        return final_data
+        if scheduler.failed:
+            print(f'Failed to fetch {len(scheduler.failed)} stocks, rerun to resume: {list(scheduler.failed)}')
+        with ParquetSink(file_path) as sink:
+            for item in dict.fromkeys(self.target_pools):
+                data = checkpoint.read_code(item)
+                if data is not None:
+                    sink.write(data)
+                else:
+                    print(f'Skipping {item} due to empty data')
+        print(f'Data saved to {file_path}, total rows: {sink.rows}')
+        # 发布新版本到共享行情库，已挂载的进程在下次读取时切换
+        publish_source(file_path)
+        if not return_data:
+            return file_path
+        return pd.read_parquet(file_path)
+
+    def ingest_minute_kline(self, start, end, ktype=KLType.K_1M, root=MINUTE_STORE_DIR, max_workers=None):
+        """
+        并发抓取目标股票的分钟K线并写入分钟K线存储，返回 {code: 写入后涉及月份的行数}
 
-    def update_kline_daily(self):
+        分钟K线分页多，抓取与日线共用调度器的限频和重试；每只股票抓完即按月份合并写入
+        """
+        store = MinuteStore(root, ktype)
+        scheduler = HistKlineScheduler(columns=MINUTE_COLUMNS, max_workers=max_workers)
+        results = {}
+        for code, data in scheduler.run(self.target_pools, start, end, ktype=ktype):
+            if data is None:
+                print(f'Skipping {code} due to empty data')
+                continue
+            results[code] = store.write(data)
+        if scheduler.failed:
+            print(f'{len(scheduler.failed)} codes failed: {list(scheduler.failed)}')
+        return results
+
+    def update_kline_daily(self, dataset_name='kline_etf_dataset', base_file='kline_etf_data'):
+        """
+        把当日快照追加到分区数据集
+
+        只写入当日的小文件，不再读取和改写全部历史；同一 (code, time_key) 以最后写入的为准，重复运行结果不变。
+        小文件由后台线程定期合并；周线/月线随之增量物化
+        """
         data = self.fetch_kline_daily(self.daily_columns, self.target_pools)
+        if data is None:
+            return
         data = self.process_daily_kline(data)
-        try:
-            final_data = pd.read_parquet(f'{self.save_dir}/kline_etf_data.parquet')
-        except FileNotFoundError:
-            final_data = pd.DataFrame()
-        final_data = pd.concat([final_data, data], axis=0)
-        final_data.to_parquet(f'{self.save_dir}/kline_etf_data.parquet', index=False)
-        print("kline_etf_data.parquet updated")
+        dataset_dir = f'{self.save_dir}/{dataset_name}'
+        base_path = f'{self.save_dir}/{base_file}.parquet'
+        if not os.path.isdir(dataset_dir) and os.path.exists(base_path):
+            build_dataset_from_parquet(base_path, dataset_dir)
+        previous_version = dataset_version(dataset_dir) if os.path.isdir(dataset_dir) else None
+        data = data.reindex(columns=self.hist_columns)
+        rows = append_daily(data, dataset_dir)
+        print(f"{dataset_dir} appended {rows} rows")
+        if rows:
+            # 共享行情库只追加当日K线的增量文件，不重读全部历史
+            publish_source_append(dataset_dir, data, previous_version)
+            # 在后台合并改写文件之前完成周期K线物化
+            for freq in FREQS:
+                materialize_bars(dataset_dir, freq)
+        compact_in_background(dataset_dir)
         return
 
 def main():
@@ -0,0 +1,82 @@
+# 跨进程文件锁 - 用 fcntl.flock 锁住目录中的锁文件，同一进程内可重入
+"""
+数据集和行情库由多个进程同时读写：抓取任务、数据更新页面和 Streamlit 各自是独立进程，
+threading 锁只能互斥同一进程内的线程。DirectoryLock 在目录下的 .lock 文件上加排他 flock，
+进程退出（包括崩溃）时由操作系统自动释放，不会留下死锁。
+
+同一进程内对同一目录总是返回同一个锁对象，可以重入；没有 fcntl 的平台（Windows）退化为进程内锁。
+
+用法:
+    with directory_lock('data/kline_dataset'):
+        ...
+"""
+
+import os
+import threading
+from typing import Dict
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+LOCK_FILE = '.lock'
+
+
+class DirectoryLock:
+    """
+    目录级的排他锁：进程内用 RLock 互斥线程，持有者在最外层加/解文件锁
+
+    参数:
+        directory: 被保护的目录，不存在时加锁时创建
+    """
+
+    def __init__(self, directory: str):
+        self.path = os.path.join(directory, LOCK_FILE)
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._fd = None
+
+    def acquire(self) -> None:
+        self._lock.acquire()
+        if self._depth == 0:
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+            except BaseException:
+                self._lock.release()
+                raise
+            self._fd = fd
+        self._depth += 1
+
+    def release(self) -> None:
+        self._depth -= 1
+        if self._depth == 0:
+            fd, self._fd = self._fd, None
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+        self._lock.release()
+
+    def __enter__(self) -> 'DirectoryLock':
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.release()
+
+
+_locks: Dict[str, DirectoryLock] = {}
+_locks_guard = threading.Lock()
+
+
+def directory_lock(directory: str) -> DirectoryLock:
+    """目录对应的锁，同一进程内复用同一对象"""
+    key = os.path.abspath(directory)
+    with _locks_guard:
+        lock = _locks.get(key)
+        if lock is None:
+            lock = _locks[key] = DirectoryLock(key)
+        return lock
@@ -4,20 +4,35 @@ from pathlib import Path
 from typing import List, Tuple, Optional, Dict, Any
 import logging
 import time
+from market_store import read_klines
+from compact_panel import compact_frame
 
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def load_stock_data_from_parquet(parquet_file: Path) -> Optional[pd.DataFrame]:
-    """从单个parquet文件加载股票数据"""
+def load_stock_data_from_parquet(
+    parquet_file: Path,
+    codes: Optional[List[str]] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    columns: Optional[List[str]] = None,
+    price_dtype: str = 'float64',
+) -> Optional[pd.DataFrame]:
+    """
+    从parquet文件或分区数据集目录加载股票数据
+
+    按代码偏移索引和日期二分定位切片，只读取 columns 指定的列；
+    price_dtype='float32' 时价格列转为 float32（精度约定见 compact_panel）
+    """
     try:
         if not parquet_file.exists():
             logger.error(f"Parquet文件不存在: {parquet_file}")
             return None
         
-        # 读取parquet文件
-        df = pd.read_parquet(parquet_file)
+        # 分区数据集目录和单个parquet文件优先从共享行情库读取；行情库落后于数据源时直接读取数据源
+        df = read_klines(str(parquet_file), codes, start_date, end_date, columns)
+        df = compact_frame(df, price_dtype)
         
         # 确保日期列已正确解析
         if 'date' in df.columns and not pd.api.types.is_datetime64_any_dtype(df['date']):
@@ -159,7 +174,15 @@ def main():
     # 加载数据
     parquet_file = Path(args.data_file)
     logger.info(f"开始从 {parquet_file} 加载股票数据...")
-    df = load_stock_data_from_parquet(parquet_file)
+    # 与 find_by_price_from_df 的日期规则一致：只给一端时按单日查询
+    start_date = args.start_date or args.end_date
+    end_date = args.end_date or args.start_date
+    df = load_stock_data_from_parquet(
+        parquet_file,
+        start_date=start_date,
+        end_date=end_date,
+        columns=['code', 'time_key', args.price_type],
+    )
     
     if df is None:
         logger.error("没有找到可用的股票数据")
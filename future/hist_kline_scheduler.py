@@ -0,0 +1,208 @@
+# 历史K线并发抓取调度器 - 多连接并发、滑动窗口限频、分页、失败重试
+"""
+富途历史K线接口按 30 秒窗口限制请求次数（每一页都计一次请求）。
+串行逐只抓取时耗时由网络往返决定；这里把多只股票分发到线程池中，
+各线程从共享连接池借用行情连接，所有请求先经过滑动窗口限频器，
+全市场回补的总耗时只受接口配额约束。
+
+用法:
+    scheduler = HistKlineScheduler(max_workers=4)
+    for code, data in scheduler.run(codes, '2024-01-01', '2024-12-31'):
+        ...
+"""
+
+import logging
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import pandas as pd
+from futu import KLType, RET_OK
+
+from quote_pool import QuoteContextPool, get_quote_pool
+
+logger = logging.getLogger(__name__)
+
+# 历史K线接口：每 30 秒最多 60 次请求
+HIST_KLINE_QUOTA = 60
+QUOTA_WINDOW = 30.0
+# 单页最大条数，页越大消耗的请求配额越少
+PAGE_SIZE = 1000
+
+
+class SlidingWindowLimiter:
+    """
+    线程安全的滑动窗口限频器：任意 period 秒内最多放行 capacity 次请求
+
+    与网关的计数方式一致（记录每次请求的时间戳），不会像令牌桶那样在满桶突发之后
+    再叠加一窗口的补充量而超出配额。
+
+    参数:
+        capacity: 窗口内允许的请求数
+        period: 窗口长度（秒）
+        margin: 窗口额外留出的秒数，网关按收到请求的时间计数，本地时间戳早于网关，
+                留出余量以吸收网络延迟的抖动
+    """
+
+    def __init__(self, capacity: int = HIST_KLINE_QUOTA, period: float = QUOTA_WINDOW, margin: float = 1.0):
+        if capacity < 1 or period <= 0 or margin < 0:
+            raise ValueError("capacity 必须大于0，period 必须为正数，margin 不能为负")
+        self.capacity = capacity
+        self.period = period + margin
+        self._calls = deque()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """阻塞直到窗口内还有剩余配额，并记录本次请求"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                while self._calls and now - self._calls[0] >= self.period:
+                    self._calls.popleft()
+                if len(self._calls) < self.capacity:
+                    self._calls.append(now)
+                    return
+                wait = self.period - (now - self._calls[0])
+            time.sleep(wait)
+
+
+class HistKlineScheduler:
+    """
+    并发抓取多只股票的历史K线
+
+    参数:
+        columns: 保留的列，默认保留接口返回的全部列
+        pool: 行情连接池，默认使用进程内共享连接池
+        max_workers: 并发线程数，默认与连接池上限一致
+        limiter: 限频器，默认按历史K线接口配额创建
+        max_retries: 单页失败后的最大重试次数
+        backoff: 重试退避基数（秒），第 n 次重试等待 backoff * 2**n 加随机抖动
+        page_size: 每页请求条数
+        progress: 进度回调 progress(done, total, code, ok)，默认写日志
+    """
+
+    def __init__(
+        self,
+        columns: Optional[List[str]] = None,
+        pool: Optional[QuoteContextPool] = None,
+        max_workers: Optional[int] = None,
+        limiter: Optional[SlidingWindowLimiter] = None,
+        max_retries: int = 3,
+        backoff: float = 1.0,
+        page_size: int = PAGE_SIZE,
+        progress: Optional[Callable[[int, int, str, bool], None]] = None,
+    ):
+        self.columns = columns
+        self.pool = pool or get_quote_pool()
+        self.max_workers = max_workers or self.pool.max_size
+        self.limiter = limiter or SlidingWindowLimiter()
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.page_size = page_size
+        self.progress = progress or self._log_progress
+
+    @staticmethod
+    def _log_progress(done: int, total: int, code: str, ok: bool) -> None:
+        logger.info(f"历史K线进度 {done}/{total}: {code} {'完成' if ok else '失败'}")
+
+    def _request_page(self, quote_ctx, code, start, end, ktype, page_req_key):
+        """请求一页数据，失败时按指数退避重试；连接已断开时抛出 ConnectionError，由调用方换连接"""
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire()
+            try:
+                ret, data, next_key = quote_ctx.request_history_kline(
+                    code, start=start, end=end, ktype=ktype,
+                    max_count=self.page_size, page_req_key=page_req_key,
+                )
+            except Exception as e:
+                ret, data, next_key = None, str(e), None
+            if ret == RET_OK:
+                return data, next_key
+            if not self.pool._is_connected(quote_ctx):
+                raise ConnectionError(f"{code} 行情连接已断开: {data}")
+            if attempt < self.max_retries:
+                wait = self.backoff * 2 ** attempt * (1 + random.random())
+                logger.warning(f"{code} 请求失败（第{attempt + 1}次）: {data}，{wait:.1f}秒后重试")
+                time.sleep(wait)
+        raise RuntimeError(f"{code} 请求历史K线失败: {data}")
+
+    def fetch_code(self, code: str, start: str, end: str, ktype=KLType.K_DAY,
+                   on_page: Optional[Callable[[str, pd.DataFrame], None]] = None) -> Optional[pd.DataFrame]:
+        """
+        抓取单只股票全部分页，返回合并后的 DataFrame；无数据时返回 None
+
+        连接中途断开时归还并重新借用连接（最多 max_retries 次）；分页键随旧连接失效，
+        从已收到的最后一根K线的日期重新请求，并过滤掉已收到的K线
+
+        给定 on_page 时每页到达即回调 on_page(code, page)（在工作线程中调用），不再合并分页，返回 None
+        """
+        pages = []
+        reconnects = 0
+        page_req_key, last_key = None, None
+        quote_ctx = self.pool.acquire()
+        try:
+            while True:
+                page_start = start if last_key is None else last_key[:10]
+                try:
+                    data, page_req_key = self._request_page(quote_ctx, code, page_start, end, ktype, page_req_key)
+                except ConnectionError as e:
+                    if reconnects >= self.max_retries:
+                        raise
+                    reconnects += 1
+                    logger.warning(f"{e}，重新连接（第{reconnects}次）")
+                    self.pool.release(quote_ctx, broken=True)
+                    quote_ctx = None
+                    quote_ctx = self.pool.acquire()
+                    page_req_key = None
+                    continue
+                if last_key is not None:
+                    data = data[data['time_key'] > last_key]
+                if not data.empty:
+                    last_key = data['time_key'].iloc[-1]
+                    data = data[self.columns] if self.columns else data
+                    if on_page is not None:
+                        on_page(code, data)
+                    else:
+                        pages.append(data)
+                if page_req_key is None:
+                    break
+        finally:
+            if quote_ctx is not None:
+                self.pool.release(quote_ctx)
+        if not pages:
+            return None
+        return pd.concat(pages, ignore_index=True)
+
+    def run(self, codes: Sequence[str], start: str, end: str, ktype=KLType.K_DAY,
+            on_page: Optional[Callable[[str, pd.DataFrame], None]] = None,
+            starts: Optional[Dict[str, str]] = None) -> Iterator[Tuple[str, Optional[pd.DataFrame]]]:
+        """
+        并发抓取 codes，按完成顺序逐只产出 (code, data)
+
+        失败或无数据的股票产出 (code, None)，失败详情记录在 self.failed 中
+
+        参数:
+            on_page: 逐页回调，见 fetch_code
+            starts: 个别股票的起始日期，覆盖 start（用于断点续传）
+        """
+        codes = list(dict.fromkeys(codes))
+        starts = starts or {}
+        self.failed = {}
+        total = len(codes)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {
+                executor.submit(self.fetch_code, code, starts.get(code, start), end, ktype, on_page): code
+                for code in codes
+            }
+            for done, future in enumerate(as_completed(futures), 1):
+                code = futures[future]
+                try:
+                    data = future.result()
+                except Exception as e:
+                    self.failed[code] = str(e)
+                    data = None
+                self.progress(done, total, code, code not in self.failed)
+                yield code, data
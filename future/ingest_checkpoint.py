@@ -0,0 +1,126 @@
+# 可断点续传的K线抓取 - 逐页落盘到暂存目录并记录每只股票的进度，重跑时从断点继续
+"""
+暂存目录结构:
+
+    <staging_dir>/run.json                      本次任务参数（如起始日期），参数变化时清空重来
+    <staging_dir>/codes/<code>/state.json       {'watermark': 已写入的最新日期, 'pages': 已写入页数, 'through': 已完成到的结束日期}
+    <staging_dir>/codes/<code>/000000.parquet   逐页写入的数据
+
+每抓到一页立即写入暂存文件并更新该股票的 state.json（均为临时文件 + os.replace），
+网关中途断开或进程崩溃后重跑：已完成到目标日期的股票直接跳过，未完成的从水位线的下一天继续抓取。
+全部抓取完成后由调用方用 read_code 逐只股票读出并合并为最终文件。
+"""
+
+import json
+import os
+import shutil
+from typing import Dict, Iterable, Optional
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+from parquet_sink import HIST_SCHEMA, to_arrow_table
+
+
+def _write_json(path: str, data: Dict) -> None:
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+class IngestCheckpoint:
+    """
+    按股票记录抓取进度的检查点
+
+    参数:
+        staging_dir: 暂存目录
+        params: 任务参数，与上次记录不一致时丢弃旧的暂存数据
+        schema: 暂存文件的列及类型
+    """
+
+    def __init__(self, staging_dir: str, params: Optional[Dict] = None, schema=HIST_SCHEMA):
+        self.staging_dir = staging_dir
+        self.codes_dir = os.path.join(staging_dir, 'codes')
+        self.schema = schema
+        params = params or {}
+        run_file = os.path.join(staging_dir, 'run.json')
+        if os.path.exists(run_file):
+            with open(run_file, 'r', encoding='utf-8') as f:
+                if json.load(f) != params:
+                    self.reset()
+        os.makedirs(self.codes_dir, exist_ok=True)
+        _write_json(run_file, params)
+
+    def reset(self) -> None:
+        """删除全部暂存数据和进度"""
+        shutil.rmtree(self.staging_dir, ignore_errors=True)
+        os.makedirs(self.codes_dir, exist_ok=True)
+
+    def _code_dir(self, code: str) -> str:
+        return os.path.join(self.codes_dir, code)
+
+    def state(self, code: str) -> Dict:
+        """读取单只股票的进度，未开始时返回空进度"""
+        path = os.path.join(self._code_dir(code), 'state.json')
+        if not os.path.exists(path):
+            return {'watermark': None, 'pages': 0, 'through': None}
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _save_state(self, code: str, state: Dict) -> None:
+        os.makedirs(self._code_dir(code), exist_ok=True)
+        _write_json(os.path.join(self._code_dir(code), 'state.json'), state)
+
+    def plan(self, codes: Iterable[str], start: str, end: str) -> Dict[str, str]:
+        """
+        生成需要抓取的股票及各自的起始日期
+
+        已完成到 end 的股票跳过；有水位线的股票从水位线的下一天开始
+        """
+        plan = {}
+        for code in dict.fromkeys(codes):
+            state = self.state(code)
+            if state['through'] is not None and state['through'] >= end:
+                continue
+            code_start = start
+            if state['watermark'] is not None:
+                resume = (pd.Timestamp(state['watermark']) + pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+                code_start = max(start, resume)
+            if code_start > end:
+                # 最后一页已写入但未来得及标记完成
+                self.mark_done(code, end)
+                continue
+            plan[code] = code_start
+        return plan
+
+    def write_page(self, code: str, data: pd.DataFrame) -> None:
+        """写入一页数据并推进水位线；同一页重复写入会覆盖，不会产生重复数据"""
+        if data is None or data.empty:
+            return
+        state = self.state(code)
+        os.makedirs(self._code_dir(code), exist_ok=True)
+        path = os.path.join(self._code_dir(code), f"{state['pages']:06d}.parquet")
+        pq.write_table(to_arrow_table(data, self.schema), f'{path}.tmp')
+        os.replace(f'{path}.tmp', path)
+        watermark = pd.to_datetime(data['time_key']).max().strftime('%Y-%m-%d')
+        state['pages'] += 1
+        state['watermark'] = max(filter(None, [state['watermark'], watermark]))
+        self._save_state(code, state)
+
+    def mark_done(self, code: str, through: str) -> None:
+        """标记股票已抓取到 through（含当天没有新K线的情况）"""
+        state = self.state(code)
+        state['through'] = through
+        self._save_state(code, state)
+
+    def read_code(self, code: str) -> Optional[pd.DataFrame]:
+        """读取单只股票的全部暂存数据，按 time_key 去重排序；没有数据时返回 None"""
+        code_dir = self._code_dir(code)
+        if not os.path.isdir(code_dir):
+            return None
+        files = sorted(f for f in os.listdir(code_dir) if f.endswith('.parquet'))
+        if not files:
+            return None
+        df = pd.concat([pq.read_table(os.path.join(code_dir, f)).to_pandas() for f in files], ignore_index=True)
+        return df.drop_duplicates(['code', 'time_key'], keep='last').sort_values('time_key').reset_index(drop=True)
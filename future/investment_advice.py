@@ -14,7 +14,7 @@ from outlines import Template
 from pathlib import Path
 from utils import get_ai_recommendation, search_stock_info
 from db_tools import DatabaseTools
-from fetch_kline_daily import get_market_snapshot
+from snapshot_service import get_snapshot_service
 from utils import StockAna
 
 
@@ -35,13 +35,14 @@ def get_portfolio_info(account_id):
     portfolio['total_value'] = portfolios[0]['total_value']
     portfolio['cash'] = portfolios[0]['cash']
     portfolio['positions'] = []
+    prices = get_snapshot_service().get_prices([item['code'] for item in positions])
     for item in positions:
         portfolio['positions'].append({
             'name': item['name'],
             'code': item['code'],
             'price': item['price'],
             'quantity': item['quantity'],
-            'value': get_market_snapshot(item['code']),
+            'value': prices[item['code']],
         })
     return account_info, portfolio
 
@@ -525,7 +526,7 @@ def show_investment_advice(account_id):
             df = pd.DataFrame(json_repair.loads(recommendations)).T.reset_index().rename(columns={'index': 'code'})
             df = df[df['signal'] != 'hold']
             df['name'] = df['code'].apply(lambda x: db_manager.get_stock_name(x))
-            df['leverage'] = df['code'].apply(lambda x: get_market_snapshot(x))
+            df['leverage'] = df['code'].map(get_snapshot_service().get_prices(df['code']))
             df['leverage'] = (df['leverage']*df['quantity']).apply(lambda x: f"{x:.2f}")
             df.rename(columns={'leverage': 'values'}, inplace=True)
             st.dataframe(df)
@@ -0,0 +1,168 @@
+# 周线/月线物化 - 从日K线分区数据集一次分组聚合生成周期K线，增量更新，读取接口与日线相同
+"""
+周线/月线不再由每个使用方各自 resample，而是物化为与日线结构相同的分区数据集:
+
+    data/kline_dataset        日线
+    data/kline_dataset_week   周线（每周最后一个交易日为 time_key）
+    data/kline_dataset_month  月线
+
+全量构建时对全部股票做一次 groupby(code, 周期) 聚合，并记录日线数据集的版本和文件清单（路径、大小、修改时间）。
+日线数据集中的文件只新增、不原地改写（追加写新的增量文件，合并写新文件名），
+之后日线有变化时，新出现的文件里最早的K线所在周期就是需要重算的起点：
+只重算该周期及之后的K线，并只改写涉及的年份分区。重复写入、历史回补都落在新文件中，不会漏算；
+后台合并小文件不改变数据集版本，不触发重算。
+
+用法:
+    weekly = open_bars('week')
+    df = weekly.read(['SH.600000'], '2023-01-01', '2024-12-31')
+"""
+
+import json
+import logging
+import os
+import shutil
+from typing import Dict, Optional
+
+import pandas as pd
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+
+from kline_dataset import DATASET_DIR, KlineDataset, dataset_lock, dataset_version, write_dataset
+from parquet_sink import HIST_SCHEMA
+
+logger = logging.getLogger(__name__)
+
+# 周期 -> pandas Period 频率；周线以周五为周期结束
+FREQS = {'week': 'W-FRI', 'month': 'M'}
+STATE_FILE = '_materialized.json'
+
+
+def bars_dir_for(daily_dir: str, freq: str) -> str:
+    """日线数据集对应的周期K线目录，如 data/kline_dataset -> data/kline_dataset_week"""
+    return f'{os.path.normpath(daily_dir)}_{freq}'
+
+
+def resample_bars(daily: pd.DataFrame, freq: str, prev_close: Optional[pd.Series] = None) -> pd.DataFrame:
+    """
+    把日K线长表聚合为周期K线，全部股票一次分组完成
+
+    参数:
+        daily: 含 HIST_SCHEMA 列的日K线
+        freq: 'week' 或 'month'
+        prev_close: 各股票上一根周期K线的收盘价（按 code 索引），用于计算第一根K线的涨跌幅
+    返回:
+        与日线列相同的周期K线，time_key 为周期内最后一个交易日
+    """
+    if freq not in FREQS:
+        raise ValueError(f"不支持的周期: {freq}，可选 {list(FREQS)}")
+    if daily.empty:
+        return pd.DataFrame(columns=HIST_SCHEMA.names)
+    daily = daily.sort_values(['code', 'time_key'], kind='stable')
+    period = pd.to_datetime(daily['time_key']).dt.to_period(FREQS[freq]).rename('period')
+    bars = daily.groupby([daily['code'], period], sort=False).agg(
+        name=('name', 'last'),
+        time_key=('time_key', 'last'),
+        open=('open', 'first'),
+        close=('close', 'last'),
+        high=('high', 'max'),
+        low=('low', 'min'),
+        pe_ratio=('pe_ratio', 'last'),
+        volume=('volume', 'sum'),
+        turnover_rate=('turnover_rate', 'sum'),
+        turnover=('turnover', 'sum'),
+    ).reset_index().drop(columns='period')
+    # 涨跌幅（%）相对上一根周期K线的收盘价
+    prev = bars.groupby('code')['close'].shift(1)
+    if prev_close is not None:
+        prev = prev.fillna(bars['code'].map(prev_close))
+    bars['change_rate'] = ((bars['close'] / prev - 1) * 100).round(4)
+    return bars[HIST_SCHEMA.names]
+
+
+def _load_state(bars_dir: str) -> Optional[dict]:
+    path = os.path.join(bars_dir, STATE_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _save_state(bars_dir: str, state: dict) -> None:
+    path = os.path.join(bars_dir, STATE_FILE)
+    with open(f'{path}.tmp', 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+    os.replace(f'{path}.tmp', path)
+
+
+def _file_stamps(daily: KlineDataset) -> Dict[str, str]:
+    """日线数据集各文件的 {相对路径: 大小|修改时间}"""
+    stamps = {}
+    for path in daily.dataset.files:
+        stat = os.stat(path)
+        stamps[os.path.relpath(path, daily.dataset_dir)] = f'{stat.st_size}|{stat.st_mtime_ns}'
+    return stamps
+
+
+def materialize_bars(daily_dir: str = DATASET_DIR, freq: str = 'week', bars_dir: Optional[str] = None,
+                     rebuild: bool = False) -> int:
+    """
+    把日线数据集物化为周期K线数据集，已物化时只增量更新
+
+    参数:
+        daily_dir: 日线分区数据集目录
+        freq: 'week' 或 'month'
+        bars_dir: 输出目录，默认 bars_dir_for(daily_dir, freq)
+        rebuild: 强制全量重建
+    返回:
+        本次写入的周期K线行数，已是最新时返回 0
+    """
+    bars_dir = bars_dir or bars_dir_for(daily_dir, freq)
+    # 持有日线数据集的写锁，物化期间文件清单不变，记录的状态与读到的数据一致
+    with dataset_lock(daily_dir):
+        daily = KlineDataset(daily_dir)
+        version = dataset_version(daily_dir)
+        state = None if rebuild else _load_state(bars_dir)
+        if state is not None and (state.get('freq') != freq or 'files' not in state or not os.path.isdir(bars_dir)):
+            state = None
+        if state is not None and state['version'] == version:
+            return 0
+
+        stamps = _file_stamps(daily)
+        if not stamps:
+            return 0
+        new_files = [os.path.join(daily_dir, path) for path, stamp in stamps.items()
+                     if state is not None and state['files'].get(path) != stamp]
+        if state is not None and new_files:
+            new_keys = ds.dataset(new_files, format='parquet').to_table(columns=['time_key']).column('time_key')
+            cutoff = pd.Period(pd.Timestamp(pc.min(new_keys).as_py()), FREQS[freq]).start_time
+            # 上一年也读出，截止点在一月时第一根K线的涨跌幅仍有上一根周期K线可比
+            existing = KlineDataset(bars_dir).read(start_date=f'{cutoff.year - 1}-01-01')
+            before = existing[existing['time_key'] < cutoff]
+            prev_close = before.groupby('code')['close'].last()
+            kept = before[before['time_key'] >= pd.Timestamp(cutoff.year, 1, 1)]
+            bars = resample_bars(daily.read(start_date=cutoff), freq, prev_close=prev_close)
+            # 涉及的年份分区整体改写：保留截止点之前的K线 + 重算后的K线
+            write_dataset(pd.concat([kept, bars], ignore_index=True), bars_dir)
+            _save_state(bars_dir, {'freq': freq, 'version': version, 'files': stamps})
+            logger.info(f"{bars_dir} 增量更新 {len(bars)} 根{freq}K线（自 {cutoff.date()} 起）")
+            return len(bars)
+
+        # 首次构建，或只有文件被删除（没有新文件可以定位变化）时全量重建
+        bars = resample_bars(daily.read(), freq)
+        shutil.rmtree(bars_dir, ignore_errors=True)
+        write_dataset(bars, bars_dir)
+        _save_state(bars_dir, {'freq': freq, 'version': version, 'files': stamps})
+        logger.info(f"{bars_dir} 全量构建 {len(bars)} 根{freq}K线")
+        return len(bars)
+
+
+def open_bars(freq: str = 'week', daily_dir: str = DATASET_DIR) -> KlineDataset:
+    """
+    打开周期K线数据集，先确保物化结果与日线一致；freq 为 'day' 时直接返回日线数据集
+
+    返回的 KlineDataset 与日线使用相同的 read 接口
+    """
+    if freq == 'day':
+        return KlineDataset(daily_dir)
+    materialize_bars(daily_dir, freq)
+    return KlineDataset(bars_dir_for(daily_dir, freq))
@@ -0,0 +1,405 @@
+# 分区K线数据集 - 按 市场/代码前缀/年份 分区存储，读取时下推代码、日期过滤并只读需要的列
+"""
+单个 kline_data.parquet 每次都要整文件读入再按代码/日期筛选。这里把日K线写成 hive 分区目录:
+
+    data/kline_dataset/market=SH/prefix=60/year=2024/part-0.parquet
+
+文件内按 (code, time_key) 排序、以较小的 row group 写入，每个 row group 带 code/time_key 的 min/max 统计。
+读取时分区过滤裁掉无关目录，行过滤借助 row group 统计跳过无关数据块，列投影只解码需要的列，
+读取单只股票两年数据只涉及几十KB。
+
+每日增量用 append_daily 追加为各分区中的小文件（不改写历史文件），
+小文件累积到一定数量后由 compact_partitions 在后台合并。同一 (code, time_key) 可以重复写入
+（修正或复权后的K线），读取时以最后写入的为准；写入与合并由数据集目录下的文件锁互斥（跨进程），
+读取时遇到被合并删除的文件会重新发现文件后重试。
+
+用法:
+    dataset = KlineDataset.open_or_build('data/kline_data.parquet')
+    df = dataset.read(codes=['SH.600000'], start_date='2023-01-01', end_date='2024-12-31',
+                      columns=['time_key', 'open', 'high', 'low', 'close', 'volume'])
+"""
+
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from file_lock import DirectoryLock, directory_lock
+from parquet_sink import HIST_SCHEMA, to_arrow_table
+
+logger = logging.getLogger(__name__)
+
+DATASET_DIR = 'data/kline_dataset'
+PARTITION_SCHEMA = pa.schema([('market', pa.string()), ('prefix', pa.string()), ('year', pa.int32())])
+# 每个 row group 的行数；约为数十只股票一年的日K线
+ROW_GROUP_ROWS = 8192
+# 文件被合并删除时，读取重新发现文件的次数
+SCAN_RETRIES = 3
+# 每次写入后更新的内容版本标记；合并小文件不改变内容，不更新。以 _ 开头，不会被当作数据文件
+VERSION_FILE = '_VERSION'
+
+
+def dataset_lock(dataset_dir: str = DATASET_DIR) -> DirectoryLock:
+    """
+    数据集的写锁（数据集目录下 .lock 文件上的 flock，跨进程有效）：
+    append_daily / write_dataset 持锁完成整批写入，compact_partitions 逐个分区持锁合并
+    """
+    return directory_lock(dataset_dir)
+
+
+def _mark_written(dataset_dir: str) -> None:
+    """记录一次内容变更（需持有写锁），dataset_version 据此判断数据是否更新"""
+    path = os.path.join(dataset_dir, VERSION_FILE)
+    with open(f'{path}.tmp', 'w', encoding='utf-8') as f:
+        f.write(str(time.time_ns()))
+    os.replace(f'{path}.tmp', path)
+
+
+def _code_parts(codes: pd.Series):
+    """'SH.600000' -> ('SH', '60')"""
+    parts = codes.str.split('.', n=1, expand=True)
+    return parts[0], parts[1].str[:2]
+
+
+def _all(exprs):
+    """把多个过滤表达式用 & 连接；全部为空时返回 None"""
+    exprs = [e for e in exprs if e is not None]
+    if not exprs:
+        return None
+    expr = exprs[0]
+    for e in exprs[1:]:
+        expr = expr & e
+    return expr
+
+
+def write_dataset(df: pd.DataFrame, dataset_dir: str = DATASET_DIR, schema: pa.Schema = HIST_SCHEMA) -> None:
+    """
+    把K线长表写入分区数据集；涉及到的分区整体覆盖，其余分区保持不变
+
+    参数:
+        df: 含 schema 全部列的K线长表
+    """
+    if df.empty:
+        return
+    with dataset_lock(dataset_dir):
+        ds.write_dataset(
+            _partition_table(df, schema),
+            dataset_dir,
+            format='parquet',
+            partitioning=ds.partitioning(PARTITION_SCHEMA, flavor='hive'),
+            basename_template='part-{i}.parquet',
+            existing_data_behavior='delete_matching',
+            max_rows_per_group=ROW_GROUP_ROWS,
+            min_rows_per_group=ROW_GROUP_ROWS,
+        )
+        _mark_written(dataset_dir)
+
+
+def _partition_table(df: pd.DataFrame, schema: pa.Schema) -> pa.Table:
+    """按 (code, time_key) 排序并附加 market/prefix/year 分区列"""
+    df = df.sort_values(['code', 'time_key'])
+    table = to_arrow_table(df, schema)
+    market, prefix = _code_parts(df['code'])
+    year = pd.to_datetime(table.column('time_key').to_pandas()).dt.year.astype('int32')
+    return (table.append_column('market', pa.array(market.to_numpy(), pa.string()))
+                 .append_column('prefix', pa.array(prefix.to_numpy(), pa.string()))
+                 .append_column('year', pa.array(year.to_numpy(), pa.int32())))
+
+
+def _is_delta(name: str) -> bool:
+    return os.path.basename(name).startswith('delta-')
+
+
+def _write_order(names: pd.Series) -> pd.Series:
+    """
+    文件的写入先后，用于同一K线出现在多个文件中时取最新：
+    part-* 最早（全量写入或合并结果），delta-<写入序号>-* 按序号递增
+    """
+    base = names.map(os.path.basename)
+    return base.where(base.str.startswith('delta-'), '')
+
+
+def latest_rows(df: pd.DataFrame, order: Optional[pd.Series] = None) -> pd.DataFrame:
+    """同一 (code, time_key) 只保留 order 最大（最后写入）的一行；order 为 None 时按行顺序"""
+    if order is not None:
+        df = df.assign(_order=order.to_numpy()).sort_values(['code', 'time_key', '_order'], kind='stable')
+        df = df.drop(columns='_order')
+    return df.drop_duplicates(['code', 'time_key'], keep='last')
+
+
+def append_daily(df: pd.DataFrame, dataset_dir: str = DATASET_DIR, tag: Optional[str] = None,
+                 schema: pa.Schema = HIST_SCHEMA) -> int:
+    """
+    以追加方式写入一批K线，每个分区新增一个小文件 delta-<写入序号>-<tag>-N.parquet，已有文件不改写
+
+    语义为 upsert：批内重复只保留最后一条；数据集中已存在的 (code, time_key) 不跳过，
+    读取和合并时以最后写入的一条为准，因此重新写入修正或复权后的K线会生效，重跑也是幂等的
+
+    参数:
+        tag: 本批次标识，只用于文件名，默认取批内最大日期 YYYYMMDD
+    返回:
+        写入的行数
+    """
+    if df.empty:
+        return 0
+    df = df.copy()
+    df['time_key'] = pd.to_datetime(df['time_key'])
+    df = df.drop_duplicates(['code', 'time_key'], keep='last')
+    tag = tag or df['time_key'].max().strftime('%Y%m%d')
+
+    with dataset_lock(dataset_dir):
+        # time_ns 在可预见的范围内都是 19 位，文件名按字典序即按写入先后排列
+        _publish_files(_partition_table(df, schema), dataset_dir, f'delta-{time.time_ns()}-{tag}-' + '{i}.parquet')
+        _mark_written(dataset_dir)
+    return len(df)
+
+
+def _publish_files(table: pa.Table, dataset_dir: str, basename_template: str) -> None:
+    """
+    先把分区文件写到数据集旁的临时目录，再逐个 os.replace 到对应分区，
+    读取方只会看到写完整的文件
+    """
+    parent = os.path.dirname(os.path.abspath(dataset_dir))
+    os.makedirs(parent, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix=f'.{os.path.basename(os.path.normpath(dataset_dir))}-', dir=parent)
+    try:
+        ds.write_dataset(
+            table,
+            staging,
+            format='parquet',
+            partitioning=ds.partitioning(PARTITION_SCHEMA, flavor='hive'),
+            basename_template=basename_template,
+        )
+        for root, _, files in os.walk(staging):
+            target_dir = os.path.join(dataset_dir, os.path.relpath(root, staging))
+            for name in files:
+                os.makedirs(target_dir, exist_ok=True)
+                os.replace(os.path.join(root, name), os.path.join(target_dir, name))
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+
+def compact_partitions(dataset_dir: str = DATASET_DIR, min_files: int = 8, schema: pa.Schema = HIST_SCHEMA) -> int:
+    """
+    把文件数达到 min_files 的分区合并为单个 part-<合并序号>.parquet，返回合并的分区数
+
+    每个分区在写锁内完成 读取 → 写临时文件 → 改名为新文件名 → 删除被合并的文件，
+    期间其他线程和进程的 append_daily、compact_partitions 不会在该数据集中新增或删除文件；
+    同一K线以最后写入的为准。不持锁的旧版本进程已删除的文件跳过，不报错。
+    合并结果使用新文件名而不是原地替换，读取方缓存的旧文件元数据不会与新内容混用，
+    旧文件被删除时读取方重新发现文件后重试
+    """
+    compacted = 0
+    for root, _, _ in os.walk(dataset_dir):
+        with dataset_lock(dataset_dir):
+            try:
+                parts = sorted(f for f in os.listdir(root) if f.endswith('.parquet'))
+            except FileNotFoundError:
+                continue
+            if len(parts) < max(min_files, 2):
+                continue
+            paths = [os.path.join(root, f) for f in parts]
+            try:
+                tables = [pq.read_table(p, schema=schema) for p in paths]
+            except FileNotFoundError:
+                # 文件在列出之后被删除，下次合并时重新列出
+                logger.info(f"{root} 的文件已被其他进程合并，跳过")
+                continue
+            order = pd.Series(np.repeat(_write_order(pd.Series(paths)).to_numpy(), [t.num_rows for t in tables]))
+            df = latest_rows(pa.concat_tables(tables).to_pandas(), order)
+            target = os.path.join(root, f'part-{time.time_ns()}.parquet')
+            # 以 . 开头的临时文件不会被读取方的文件发现扫到
+            tmp_path = os.path.join(root, f'.{os.path.basename(target)}.tmp')
+            pq.write_table(to_arrow_table(df, schema), tmp_path, row_group_size=ROW_GROUP_ROWS)
+            os.replace(tmp_path, target)
+            for path in paths:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            compacted += 1
+    if compacted:
+        logger.info(f"{dataset_dir} 已合并 {compacted} 个分区的小文件")
+    return compacted
+
+
+_compaction_threads: Dict[str, threading.Thread] = {}
+
+
+def compact_in_background(dataset_dir: str = DATASET_DIR, min_files: int = 8) -> threading.Thread:
+    """在后台线程中合并小文件；同一数据集同时只运行一个合并任务"""
+    key = os.path.abspath(dataset_dir)
+    thread = _compaction_threads.get(key)
+    if thread is not None and thread.is_alive():
+        return thread
+    thread = threading.Thread(target=compact_partitions, args=(dataset_dir, min_files), daemon=True,
+                              name=f'compact-{os.path.basename(key)}')
+    _compaction_threads[key] = thread
+    thread.start()
+    return thread
+
+
+def build_dataset_from_parquet(parquet_file: str, dataset_dir: str = DATASET_DIR) -> str:
+    """把单文件K线转换为分区数据集，返回数据集目录"""
+    df = pd.read_parquet(parquet_file)
+    write_dataset(df, dataset_dir)
+    logger.info(f"已从 {parquet_file} 构建分区数据集 {dataset_dir}，共 {len(df)} 行")
+    return dataset_dir
+
+
+class KlineDataset:
+    """
+    分区K线数据集读取器
+
+    参数:
+        dataset_dir: 数据集根目录
+    """
+
+    def __init__(self, dataset_dir: str = DATASET_DIR):
+        if not os.path.isdir(dataset_dir):
+            raise FileNotFoundError(f"分区数据集不存在: {dataset_dir}")
+        self.dataset_dir = dataset_dir
+        self.refresh()
+
+    def refresh(self) -> None:
+        """重新发现数据集文件（新增的增量文件、合并后的文件）"""
+        self.dataset = ds.dataset(
+            self.dataset_dir, format='parquet',
+            partitioning=ds.partitioning(PARTITION_SCHEMA, flavor='hive'),
+        )
+
+    @property
+    def has_deltas(self) -> bool:
+        """是否存在尚未合并的增量文件；没有时同一K线不会重复，读取可以跳过去重"""
+        return any(_is_delta(path) for path in self.dataset.files)
+
+    def scan(self, columns: List[str], filter=None) -> pd.DataFrame:
+        """
+        读取 columns（需包含 code、time_key），重复的K线只保留最后写入的一条
+
+        文件在发现之后被后台合并删除时，重新发现文件后重试
+        """
+        for attempt in range(SCAN_RETRIES + 1):
+            try:
+                if not self.has_deltas:
+                    return self.dataset.to_table(columns=columns, filter=filter).to_pandas()
+                df = self.dataset.to_table(columns=columns + ['__filename'], filter=filter).to_pandas()
+                return latest_rows(df.drop(columns='__filename'), _write_order(df['__filename']))
+            except FileNotFoundError:
+                if attempt == SCAN_RETRIES:
+                    raise
+                logger.debug(f"{self.dataset_dir} 文件已被合并，重新读取")
+                self.refresh()
+
+    @classmethod
+    def open_or_build(cls, parquet_file: str, dataset_dir: str = DATASET_DIR) -> 'KlineDataset':
+        """数据集不存在时从单文件构建"""
+        if not os.path.isdir(dataset_dir):
+            build_dataset_from_parquet(parquet_file, dataset_dir)
+        return cls(dataset_dir)
+
+    @property
+    def version(self) -> str:
+        """根据全部分区文件的路径、大小和修改时间生成数据版本号"""
+        return dataset_version(self.dataset_dir)
+
+    @staticmethod
+    def row_filter(codes: Optional[List[str]] = None, start_date=None, end_date=None):
+        """
+        code/time_key 行过滤表达式，依靠 row group 统计跳过数据块；
+        也可直接作为 pd.read_parquet 的 filters 用于单个parquet文件
+        """
+        exprs = []
+        if codes is not None:
+            exprs.append(ds.field('code').isin(list(codes)))
+        if start_date is not None:
+            exprs.append(ds.field('time_key') >= pa.scalar(pd.Timestamp(start_date).value, pa.timestamp('ns')))
+        if end_date is not None:
+            # 与 DataFrame 字符串切片一致，结束日期当天整天包含在内
+            end = pd.Timestamp(end_date).normalize() + pd.Timedelta(days=1)
+            exprs.append(ds.field('time_key') < pa.scalar(end.value, pa.timestamp('ns')))
+        return _all(exprs)
+
+    @staticmethod
+    def partition_filter(codes: Optional[List[str]] = None, start_date=None, end_date=None):
+        """market/prefix/year 分区过滤表达式，用于直接裁掉无关目录"""
+        exprs = []
+        if codes is not None:
+            market, prefix = _code_parts(pd.Series(codes, dtype=object))
+            exprs.append(ds.field('market').isin(sorted(set(market))))
+            exprs.append(ds.field('prefix').isin(sorted(set(prefix.dropna()))))
+        if start_date is not None:
+            exprs.append(ds.field('year') >= pd.Timestamp(start_date).year)
+        if end_date is not None:
+            exprs.append(ds.field('year') <= pd.Timestamp(end_date).year)
+        return _all(exprs)
+
+    def read(
+        self,
+        codes: Optional[Union[str, Iterable[str]]] = None,
+        start_date=None,
+        end_date=None,
+        columns: Optional[List[str]] = None,
+    ) -> pd.DataFrame:
+        """
+        按代码、日期区间读取K线，结果按 (code, time_key) 排序
+
+        参数:
+            codes: 单个代码或代码列表，None 表示全部
+            start_date, end_date: 日期区间（含两端），None 表示不限
+            columns: 需要的列，默认 HIST_SCHEMA 全部列；排序需要时会自动补读 code/time_key
+        """
+        if isinstance(codes, str):
+            codes = [codes]
+        elif codes is not None:
+            codes = list(codes)
+        columns = list(columns) if columns else list(HIST_SCHEMA.names)
+        read_columns = list(dict.fromkeys(['code', 'time_key'] + columns))
+        expr = _all([
+            self.partition_filter(codes, start_date, end_date),
+            self.row_filter(codes, start_date, end_date),
+        ])
+        df = self.scan(read_columns, expr)
+        df = df.sort_values(['code', 'time_key'], kind='stable').reset_index(drop=True)
+        return df[columns]
+
+    def codes(self) -> List[str]:
+        """数据集中的全部股票代码"""
+        df = self.scan(['code', 'time_key'])
+        return sorted(pd.unique(df['code']))
+
+
+def dataset_version(path: str) -> str:
+    """
+    数据版本号：分区数据集目录取写入时更新的 _VERSION 标记（后台合并小文件不改变版本）；
+    其他文件或目录根据全部文件的路径、大小和修改时间生成
+    """
+    marker = os.path.join(path, VERSION_FILE)
+    if os.path.isdir(path) and os.path.exists(marker):
+        with open(marker, 'r', encoding='utf-8') as f:
+            raw = f"{os.path.abspath(path)}|{f.read().strip()}"
+    elif not os.path.isdir(path):
+        stat = os.stat(path)
+        raw = f"{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}"
+    else:
+        entries = []
+        for root, _, files in os.walk(path):
+            # 锁文件、临时文件等以 . 开头的文件不属于数据
+            for name in files:
+                if name.startswith('.'):
+                    continue
+                full = os.path.join(root, name)
+                stat = os.stat(full)
+                entries.append(f"{os.path.relpath(full, path)}|{stat.st_size}|{stat.st_mtime_ns}")
+        raw = os.path.abspath(path) + '\n' + '\n'.join(sorted(entries))
+    return hashlib.md5(raw.encode('utf-8')).hexdigest()[:12]
@@ -0,0 +1,53 @@
+# K线列式数据源 - 为backtrader回测提供零拷贝数据源
+"""
+MmapKlineData 直接读取列数组（如 MarketStore.get_arrays 返回的内存映射视图），
+多进程并发回测时共享同一份操作系统页缓存，不再为每个进程复制 DataFrame。
+"""
+
+import datetime
+import numpy as np
+import backtrader as bt
+
+MMAP_COLUMNS = ['open', 'high', 'low', 'close', 'volume']
+
+# 1970-01-01 的 proleptic ordinal，用于把纳秒时间戳直接换算成 backtrader 的日期数值
+_EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+_NS_PER_DAY = 86400 * 10**9
+
+
+class MmapKlineData(bt.feed.DataBase):
+    """
+    直接读取内存映射列的 backtrader 数据源
+
+    参数:
+        arrays: {'time_key': int64纳秒数组, 列名: 数组}，如 MarketStore.get_arrays 的返回值
+    """
+    params = (
+        ('arrays', None),
+    )
+
+    def start(self):
+        super(MmapKlineData, self).start()
+        arrays = self.p.arrays
+        # 预先向量化换算日期数值，避免在 _load 中逐行构造 datetime
+        self._dtnum = np.asarray(arrays['time_key'], dtype=np.int64) / _NS_PER_DAY + _EPOCH_ORDINAL
+        self._open = arrays['open']
+        self._high = arrays['high']
+        self._low = arrays['low']
+        self._close = arrays['close']
+        self._volume = arrays['volume']
+        self._idx = 0
+
+    def _load(self):
+        i = self._idx
+        if i >= len(self._dtnum):
+            return False
+        self.lines.datetime[0] = self._dtnum[i]
+        self.lines.open[0] = self._open[i]
+        self.lines.high[0] = self._high[i]
+        self.lines.low[0] = self._low[i]
+        self.lines.close[0] = self._close[i]
+        self.lines.volume[0] = self._volume[i]
+        self.lines.openinterest[0] = 0.0
+        self._idx = i + 1
+        return True
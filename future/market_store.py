@@ -0,0 +1,511 @@
+# 共享内存列式行情库 - 以内存映射的 Arrow IPC 文件发布K线，各进程零拷贝挂载
+"""
+Streamlit 页面、选股脚本和回测进程各自把 parquet 读进内存，同一份K线在每个进程里都有一份拷贝。
+这里把当前数据发布为按 (code, time_key) 排序的 Arrow IPC 文件，附带每个 code 的偏移索引和版本号；
+读者用 pa.memory_map 挂载，数据只存在于操作系统页缓存中，所有进程共用一份。
+
+目录结构:
+    <store_dir>/v000001/data.arrow    Arrow IPC 文件（不压缩，可直接映射）
+    <store_dir>/v000001/meta.json     {version, source_version, rows, columns, index: {code: [start, count]},
+                                       deltas: [{file, rows, index}]}
+    <store_dir>/v000002/delta-000001.arrow   增量发布的新K线，结构与 data.arrow 相同
+    <store_dir>/CURRENT               当前版本目录名，发布时临时文件 + os.replace 原子切换
+    <store_dir>/.lock                 发布锁（flock，跨进程）；发布和清理旧版本都在锁内进行
+
+全量抓取后调用 publish 生成新版本；每日增量调用 publish_append，只写入新K线的增量文件，
+data.arrow 和已有增量文件以硬链接带入新版本目录，不复制、不重写历史。
+同一 (code, time_key) 以后写入的为准，增量文件达到 max_deltas 个时合并为新的全量版本。
+读者调用 refresh() 或 attach() 时切换到新版本，已挂载旧版本的读者不受影响；
+旧版本目录只保留最近 keep 个，共享的硬链接文件在最后一个引用删除时才释放空间。
+
+只有写入数据源的任务（全量抓取、每日追加）发布；读者只挂载，不发布。
+数据源已更新而行情库尚未发布时，read_klines 直接读取数据源。
+
+用法:
+    store = attach('data/market_store/kline_data')
+    df = store.read(['SH.510300'], '2024-01-01', '2024-12-31')
+    df = read_klines('data/kline_data.parquet', ['SH.510300'], '2024-01-01')
+"""
+
+import json
+import os
+import re
+import shutil
+import threading
+import uuid
+from typing import Dict, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from file_lock import directory_lock
+from kline_dataset import KlineDataset, dataset_version
+
+STORE_ROOT = 'data/market_store'
+CURRENT_FILE = 'CURRENT'
+DATA_FILE = 'data.arrow'
+META_FILE = 'meta.json'
+# 增量文件数达到该值时合并为全量版本
+MAX_DELTAS = 20
+_VERSION_DIR = re.compile(r'^v(\d{6})$')
+# 发布中的临时目录/文件: <版本目录名或 CURRENT>.<进程号>-<随机串>.tmp
+_TMP_NAME = re.compile(r'^(?:v\d{6}|CURRENT)\.(\d+)-[0-9a-f]+\.tmp$')
+
+
+def default_store_dir(source: str) -> str:
+    """数据源对应的行情库目录，如 data/kline_data.parquet -> data/market_store/kline_data"""
+    name = os.path.splitext(os.path.basename(os.path.normpath(source)))[0]
+    return os.path.join(os.path.dirname(os.path.normpath(source)), 'market_store', name)
+
+
+def _read_current(store_dir: str) -> Optional[str]:
+    path = os.path.join(store_dir, CURRENT_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read().strip() or None
+
+
+def _published_source_version(store_dir: str) -> Optional[str]:
+    """当前发布版本对应的数据源版本，尚未发布时为 None"""
+    name = _read_current(store_dir)
+    if name is None:
+        return None
+    with open(os.path.join(store_dir, name, META_FILE), 'r', encoding='utf-8') as f:
+        return json.load(f).get('source_version')
+
+
+def _versions(store_dir: str) -> List[int]:
+    if not os.path.isdir(store_dir):
+        return []
+    return sorted(int(m.group(1)) for m in map(_VERSION_DIR.match, os.listdir(store_dir)) if m)
+
+
+def _to_table(df: pd.DataFrame) -> pa.Table:
+    """数值列保持 NaN 而非 null，读取时可以零拷贝转成 numpy"""
+    arrays, names = [], []
+    for col in df.columns:
+        series = df[col]
+        if col == 'time_key':
+            arrays.append(pa.array(pd.to_datetime(series).to_numpy('datetime64[ns]')))
+        elif pd.api.types.is_numeric_dtype(series):
+            arrays.append(pa.array(series.to_numpy()))
+        else:
+            arrays.append(pa.array(series.astype(object).where(series.notna(), None), pa.string()))
+        names.append(col)
+    return pa.Table.from_arrays(arrays, names=names)
+
+
+def _code_index(df: pd.DataFrame) -> Dict[str, List[int]]:
+    """按 code 排序后每只股票的 [起始行, 行数]"""
+    codes, starts, counts = np.unique(df['code'].to_numpy(dtype=object).astype(str), return_index=True, return_counts=True)
+    return {code: [int(start), int(count)] for code, start, count in zip(codes, starts, counts)}
+
+
+def _write_arrow(table: pa.Table, path: str) -> None:
+    with pa.OSFile(path, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            # 单个 record batch，每列一块连续内存，按偏移切片即可得到视图
+            writer.write_table(table, max_chunksize=max(len(table), 1))
+
+
+def _tmp_name(name: str) -> str:
+    """本进程独有的临时文件名，中断的发布留下的临时文件可以按进程号判断归属"""
+    return f'{name}.{os.getpid()}-{uuid.uuid4().hex[:12]}.tmp'
+
+
+def _new_version_dir(store_dir: str):
+    """分配下一个版本号（需持有发布锁），返回 (版本号, 版本目录名, 临时目录)"""
+    versions = _versions(store_dir)
+    version = (versions[-1] if versions else 0) + 1
+    name = f'v{version:06d}'
+    tmp_dir = os.path.join(store_dir, _tmp_name(name))
+    os.makedirs(tmp_dir)
+    return version, name, tmp_dir
+
+
+def _commit_version(store_dir: str, name: str, tmp_dir: str, meta: Dict, keep: int) -> None:
+    """写入 meta.json，把临时目录改名为版本目录并切换 CURRENT，然后清理旧版本"""
+    with open(os.path.join(tmp_dir, META_FILE), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False)
+    os.replace(tmp_dir, os.path.join(store_dir, name))
+
+    # 版本目录完整写好后才切换 CURRENT
+    current_tmp = os.path.join(store_dir, _tmp_name(CURRENT_FILE))
+    with open(current_tmp, 'w', encoding='utf-8') as f:
+        f.write(name)
+    os.replace(current_tmp, os.path.join(store_dir, CURRENT_FILE))
+    gc_versions(store_dir, keep)
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _orphaned_tmp(name: str) -> bool:
+    """本进程或已退出的进程留下的临时文件；其他仍在运行的进程的临时文件不属于本进程，不删除"""
+    match = _TMP_NAME.match(name)
+    if match is None:
+        return False
+    pid = int(match.group(1))
+    return pid == os.getpid() or not _pid_alive(pid)
+
+
+def gc_versions(store_dir: str, keep: int = 2) -> List[str]:
+    """
+    删除当前版本之外、最近 keep 个以前的旧版本目录，以及中断的发布留下的临时文件，返回删除的名称
+
+    在发布锁内执行；已挂载旧版本的读者仍持有映射，删除目录不影响其读取（Windows 上删除失败则留到下次）
+    """
+    if not os.path.isdir(store_dir):
+        return []
+    with directory_lock(store_dir):
+        current = _read_current(store_dir)
+        removed = [f'v{old:06d}' for old in _versions(store_dir)[:-(keep + 1)]]
+        removed += [name for name in os.listdir(store_dir) if _orphaned_tmp(name)]
+        removed = [name for name in removed if name != current]
+        for name in removed:
+            path = os.path.join(store_dir, name)
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            elif os.path.exists(path):
+                os.remove(path)
+    return removed
+
+
+def publish(df: pd.DataFrame, store_dir: str, source_version: Optional[str] = None, keep: int = 2) -> int:
+    """
+    把K线长表发布为新的全量版本，返回版本号
+
+    参数:
+        df: 至少包含 code、time_key 列
+        store_dir: 行情库目录
+        source_version: 数据源版本，open_current 据此判断行情库是否与数据源一致
+        keep: 保留的旧版本个数
+    """
+    df = df.sort_values(['code', 'time_key'], kind='stable').reset_index(drop=True)
+    index = _code_index(df)
+    with directory_lock(store_dir):
+        version, name, tmp_dir = _new_version_dir(store_dir)
+        _write_arrow(_to_table(df), os.path.join(tmp_dir, DATA_FILE))
+        meta = {
+            'version': version,
+            'source_version': source_version,
+            'rows': int(len(df)),
+            'columns': list(df.columns),
+            'index': index,
+            'deltas': [],
+        }
+        _commit_version(store_dir, name, tmp_dir, meta, keep)
+    print(f'行情库已发布: {store_dir} 版本 {version}, 共 {len(df)} 行, {len(index)} 只股票')
+    return version
+
+
+def _link(src: str, dst: str) -> None:
+    """硬链接不可变的数据文件；文件系统不支持硬链接时复制"""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+def publish_append(df: pd.DataFrame, store_dir: str, source_version: Optional[str] = None, keep: int = 2,
+                   max_deltas: int = MAX_DELTAS) -> int:
+    """
+    把新K线作为增量文件发布为新版本，返回版本号；写入量与新K线行数成正比，与历史长度无关
+
+    同一 (code, time_key) 以后写入的为准。尚未发布过时等同于 publish；
+    增量文件已有 max_deltas 个时把当前版本与新K线合并为全量版本
+
+    参数:
+        df: 新K线，列须包含当前版本的全部列
+    """
+    with directory_lock(store_dir):
+        name = _read_current(store_dir)
+        if name is None:
+            return publish(df, store_dir, source_version, keep)
+        if df.empty:
+            return int(name[1:])
+        current_dir = os.path.join(store_dir, name)
+        with open(os.path.join(current_dir, META_FILE), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        deltas = meta.get('deltas', [])
+        if len(deltas) >= max_deltas:
+            merged = pd.concat([MarketStore(store_dir).read(), df[meta['columns']]], ignore_index=True)
+            merged = merged.drop_duplicates(['code', 'time_key'], keep='last')
+            return publish(merged, store_dir, source_version, keep)
+
+        df = df[meta['columns']].copy()
+        df['time_key'] = pd.to_datetime(df['time_key'])
+        df = df.sort_values(['code', 'time_key'], kind='stable')
+        df = df.drop_duplicates(['code', 'time_key'], keep='last').reset_index(drop=True)
+        schema = pa.ipc.open_file(pa.memory_map(os.path.join(current_dir, DATA_FILE), 'r')).schema
+        # 数值列类型与全量文件一致，读取时可以直接拼接
+        for field in schema:
+            if pa.types.is_integer(field.type):
+                df[field.name] = pd.to_numeric(df[field.name]).fillna(0).astype(field.type.to_pandas_dtype())
+            elif pa.types.is_floating(field.type):
+                df[field.name] = pd.to_numeric(df[field.name], errors='coerce').astype(field.type.to_pandas_dtype())
+        version, name, tmp_dir = _new_version_dir(store_dir)
+        for file_name in [DATA_FILE] + [delta['file'] for delta in deltas]:
+            _link(os.path.join(current_dir, file_name), os.path.join(tmp_dir, file_name))
+        delta_file = f'delta-{version:06d}.arrow'
+        _write_arrow(_to_table(df).cast(schema), os.path.join(tmp_dir, delta_file))
+        meta = dict(meta, version=version, source_version=source_version,
+                    deltas=deltas + [{'file': delta_file, 'rows': int(len(df)), 'index': _code_index(df)}])
+        _commit_version(store_dir, name, tmp_dir, meta, keep)
+        print(f'行情库增量发布: {store_dir} 版本 {version}, 新增 {len(df)} 行, 增量文件 {len(meta["deltas"])} 个')
+        return version
+
+
+def read_source(source: str, codes: Union[str, List[str], None] = None, start_date=None, end_date=None,
+                columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    直接从 parquet 文件或分区数据集目录读取，参数与返回格式同 MarketStore.read
+
+    行情库尚未发布当前数据时读者使用，不发布
+    """
+    if isinstance(codes, str):
+        codes = [codes]
+    if os.path.isdir(source):
+        return KlineDataset(source).read(codes, start_date, end_date, columns)
+    read_columns = None if columns is None else list(dict.fromkeys(list(columns) + ['code', 'time_key']))
+    df = pd.read_parquet(source, columns=read_columns)
+    df['time_key'] = pd.to_datetime(df['time_key'])
+    mask = pd.Series(True, index=df.index)
+    if codes is not None:
+        mask &= df['code'].isin(codes)
+    if start_date is not None:
+        mask &= df['time_key'] >= pd.Timestamp(start_date)
+    if end_date is not None:
+        mask &= df['time_key'] < pd.Timestamp(end_date).normalize() + pd.Timedelta(days=1)
+    df = df[mask].sort_values(['code', 'time_key'], kind='stable').reset_index(drop=True)
+    return df if columns is None else df[list(columns)]
+
+
+def publish_source(source: str, store_dir: Optional[str] = None, keep: int = 2) -> int:
+    """从 parquet 文件或分区数据集目录发布新的全量版本"""
+    store_dir = store_dir or default_store_dir(source)
+    with directory_lock(store_dir):
+        source_version = dataset_version(source)
+        return publish(read_source(source), store_dir, source_version=source_version, keep=keep)
+
+
+def publish_source_append(source: str, df: pd.DataFrame, previous_version: str, store_dir: Optional[str] = None,
+                          keep: int = 2) -> int:
+    """
+    数据源刚追加了 df 之后增量发布：只写入 df，发布版本记为追加后的数据源版本
+
+    参数:
+        previous_version: 追加前的数据源版本（dataset_version）；当前发布的不是该版本时
+                          （例如上次发布中断），只补 df 会漏数据，改为全量发布
+    """
+    store_dir = store_dir or default_store_dir(source)
+    # 判断与发布在同一把锁内，其他进程不会在两者之间发布
+    with directory_lock(store_dir):
+        published = _published_source_version(store_dir)
+        if published is None or published != previous_version:
+            return publish_source(source, store_dir, keep)
+        return publish_append(df, store_dir, source_version=dataset_version(source), keep=keep)
+
+
+class MarketStore:
+    """
+    挂载到行情库当前版本的只读视图，切片只返回 Arrow/numpy 视图，不复制数据
+
+    参数:
+        store_dir: 行情库目录
+    """
+
+    def __init__(self, store_dir: str):
+        self.store_dir = store_dir
+        self.version_name = None
+        self._lock = threading.Lock()
+        if not self.refresh():
+            raise FileNotFoundError(f'行情库尚未发布: {store_dir}')
+
+    @classmethod
+    def open_current(cls, source: str, store_dir: Optional[str] = None) -> Optional['MarketStore']:
+        """
+        挂载与数据源当前版本一致的行情库；尚未发布或数据源已更新（发布落后）时返回 None，
+        由调用方改为直接读取数据源。读者不发布，发布由写入数据源的任务负责
+        """
+        store_dir = store_dir or default_store_dir(source)
+        if not os.path.exists(source) or _published_source_version(store_dir) != dataset_version(source):
+            return None
+        return attach(store_dir)
+
+    def refresh(self) -> bool:
+        """CURRENT 指向新版本时切换挂载，返回是否已挂载到某个版本"""
+        name = _read_current(self.store_dir)
+        if name is None:
+            return self.version_name is not None
+        if name == self.version_name:
+            return True
+        version_dir = os.path.join(self.store_dir, name)
+        with open(os.path.join(version_dir, META_FILE), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        table = self._map(os.path.join(version_dir, DATA_FILE))
+        deltas = []
+        for delta in meta.get('deltas', []):
+            delta_table = self._map(os.path.join(version_dir, delta['file']))
+            deltas.append((delta_table, delta['index'], _column_numpy(delta_table, 'time_key').view(np.int64)))
+        with self._lock:
+            self.meta, self.index, self.table = meta, meta['index'], table
+            self._time_key = _column_numpy(table, 'time_key').view(np.int64)
+            self._deltas = deltas
+            self.version_name = name
+        return True
+
+    @staticmethod
+    def _map(path: str) -> pa.Table:
+        return pa.ipc.open_file(pa.memory_map(path, 'r')).read_all()
+
+    @property
+    def version(self) -> int:
+        return self.meta['version']
+
+    @property
+    def codes(self) -> List[str]:
+        if not self._deltas:
+            return list(self.index.keys())
+        return sorted(set(self.index).union(*(index for _, index, _ in self._deltas)))
+
+    def _numpy(self, column: str) -> np.ndarray:
+        """全量文件整列的 numpy 视图；含 null 或字符串列时才会复制"""
+        return _column_numpy(self.table, column)
+
+    def _segments(self, code: str, start_date=None, end_date=None):
+        """
+        code 在 [start_date, end_date] 区间内的行所在的 (表, 起始行, 结束行, time_key)，全量文件在前、增量按写入顺序在后；
+        各部分都没有该股票时返回 None
+        """
+        parts = [(self.table, self.index, self._time_key)] + self._deltas
+        segments, found = [], False
+        for table, index, time_keys in parts:
+            if code not in index:
+                continue
+            found = True
+            start, count = index[code]
+            time_key = time_keys[start:start + count]
+            lo, hi = 0, count
+            if start_date is not None:
+                lo = int(np.searchsorted(time_key, pd.Timestamp(start_date).value, side='left'))
+            if end_date is not None:
+                # 与 DataFrame 字符串切片一致，结束日期当天整天包含在内
+                end_ns = (pd.Timestamp(end_date).normalize() + pd.Timedelta(days=1)).value
+                hi = int(np.searchsorted(time_key, end_ns, side='left'))
+            if hi > lo:
+                segments.append((table, start + lo, start + hi, time_keys))
+        return segments if found else None
+
+    def get_arrays(self, code: str, start_date=None, end_date=None,
+                   columns=('open', 'high', 'low', 'close', 'volume')) -> Optional[Dict[str, np.ndarray]]:
+        """
+        单只股票在 [start_date, end_date] 区间内的列字典，可直接交给 MmapKlineData
+
+        股票只在全量文件中有数据时返回映射视图；有增量K线时拼接后按 time_key 取最后写入的一条（复制）
+
+        返回:
+            {'time_key': int64纳秒数组, 列名: 数组}，未找到股票时返回 None
+        """
+        segments = self._segments(code, start_date, end_date)
+        if segments is None:
+            return None
+        if len(segments) <= 1:
+            table, lo, hi, time_keys = segments[0] if segments else (self.table, 0, 0, self._time_key)
+            arrays = {'time_key': time_keys[lo:hi]}
+            for col in columns:
+                arrays[col] = table.column(col).chunk(0).slice(lo, hi - lo).to_numpy(zero_copy_only=False)
+            return arrays
+        time_key = np.concatenate([time_keys[lo:hi] for _, lo, hi, time_keys in segments])
+        keep = _latest_positions(time_key)
+        arrays = {'time_key': time_key[keep]}
+        for col in columns:
+            values = [table.column(col).chunk(0).slice(lo, hi - lo).to_numpy(zero_copy_only=False)
+                      for table, lo, hi, _ in segments]
+            arrays[col] = np.concatenate(values)[keep]
+        return arrays
+
+    def read(
+        self,
+        codes: Union[str, List[str], None] = None,
+        start_date=None,
+        end_date=None,
+        columns: Optional[List[str]] = None,
+    ) -> pd.DataFrame:
+        """
+        与 KlineDataset.read 相同的读取接口，按 code、time_key 排序返回
+
+        参数:
+            codes: 股票代码或代码列表，None 表示全部
+            start_date, end_date: 日期区间，结束日期当天包含在内
+            columns: 需要的列，None 表示全部
+        """
+        if isinstance(codes, str):
+            codes = [codes]
+        names = list(columns) if columns is not None else list(self.table.column_names)
+        if codes is None and start_date is None and end_date is None and not self._deltas:
+            return self.table.select(names).to_pandas()
+        # 去重需要 code、time_key
+        read_names = list(dict.fromkeys(names + (['code', 'time_key'] if self._deltas else [])))
+        pieces, overlap = [], False
+        # 各股票的行在文件中按 code 排序连续存放，按代码顺序切片拼接即保持 (code, time_key) 顺序
+        for code in sorted(set(self.codes if codes is None else codes)):
+            segments = self._segments(code, start_date, end_date) or []
+            overlap = overlap or len(segments) > 1
+            pieces += [table.select(read_names).slice(lo, hi - lo) for table, lo, hi, _ in segments]
+        if not pieces:
+            return self.table.select(names).schema.empty_table().to_pandas()
+        df = pa.concat_tables(pieces).to_pandas()
+        if overlap:
+            # 同一股票的全量和增量切片依次排列，稳定排序后保留最后写入的一条
+            df = df.sort_values(['code', 'time_key'], kind='stable')
+            df = df.drop_duplicates(['code', 'time_key'], keep='last').reset_index(drop=True)
+        return df[names]
+
+
+def _column_numpy(table: pa.Table, column: str) -> np.ndarray:
+    """整列的 numpy 视图；含 null 或字符串列时才会复制"""
+    chunked = table.column(column)
+    chunk = chunked.chunk(0) if chunked.num_chunks == 1 else chunked.combine_chunks()
+    return chunk.to_numpy(zero_copy_only=False)
+
+
+def _latest_positions(time_key: np.ndarray) -> np.ndarray:
+    """按 time_key 排序后的位置，相同 time_key 只保留最后出现（最后写入）的一个"""
+    order = np.argsort(time_key, kind='stable')
+    ordered = time_key[order]
+    return order[np.append(ordered[1:] != ordered[:-1], True)]
+
+
+_stores: Dict[str, MarketStore] = {}
+_stores_lock = threading.Lock()
+
+
+def attach(store_dir: str) -> MarketStore:
+    """挂载行情库，同一进程内复用同一映射；已发布新版本时自动切换"""
+    key = os.path.abspath(store_dir)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = _stores[key] = MarketStore(store_dir)
+        else:
+            store.refresh()
+        return store
+
+
+def read_klines(source: str, codes: Union[str, List[str], None] = None, start_date=None, end_date=None,
+                columns: Optional[List[str]] = None, store_dir: Optional[str] = None) -> pd.DataFrame:
+    """读取K线：行情库已发布当前数据时从映射读取，否则直接读取数据源"""
+    store = MarketStore.open_current(source, store_dir)
+    if store is None:
+        return read_source(source, codes, start_date, end_date, columns)
+    return store.read(codes, start_date, end_date, columns)
@@ -0,0 +1,217 @@
+# 分钟K线存储 - 按 周期/股票/月份 分区，价格存为整数 tick，读取时可重采样为小时/日线
+"""
+分钟K线行数是日线的 240 倍，单个 parquet 文件无法容纳全市场数据。这里按分区目录存储:
+
+    data/minute_store/ktype=K_1M/code=SH.600000/month=202406/part-0.parquet
+
+编码:
+    • 价格乘以 PRICE_SCALE 存为 int32 tick（A股/ETF 最小变动 0.01/0.001，不复权价格无损；
+      前复权价格不在 tick 网格上，绝对误差 ≤ 0.5 / PRICE_SCALE），
+      相邻分钟的价格差很小，用 DELTA_BINARY_PACKED 编码
+    • time_key 存为秒级时间戳，等间隔递增，同样 DELTA_BINARY_PACKED 编码
+    • 成交量逐分钟波动大，差分编码反而变大，保留字典/PLAIN 编码交给 zstd 压缩
+
+写入按 (股票, 月份) 合并：只读写涉及的月份文件，按 time_key 去重，重复抓取不会产生重复K线。
+读取时分区过滤只打开相关股票、相关月份的文件。
+
+用法:
+    store = MinuteStore(ktype='K_1M')
+    store.write(df)
+    bars = store.read(['SH.600000'], '2024-06-01', '2024-06-30')
+    hourly = store.resample(['SH.600000'], '2024-06-01', '2024-06-30', rule='hour')
+"""
+
+import os
+from typing import Iterable, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+MINUTE_STORE_DIR = 'data/minute_store'
+# 价格 tick 缩放倍数，int32 可表示的最高价格约为 214 万
+PRICE_SCALE = 1000
+PRICE_COLUMNS = ['open', 'close', 'high', 'low']
+MINUTE_COLUMNS = ['code', 'time_key'] + PRICE_COLUMNS + ['volume', 'turnover']
+MINUTE_SCHEMA = pa.schema(
+    [('time_key', pa.timestamp('s'))]
+    + [(col, pa.int32()) for col in PRICE_COLUMNS]
+    + [('volume', pa.int64()), ('turnover', pa.float64())]
+)
+PARTITION_SCHEMA = pa.schema([('code', pa.string()), ('month', pa.int32())])
+COLUMN_ENCODING = {col: 'DELTA_BINARY_PACKED' for col in ['time_key'] + PRICE_COLUMNS}
+# 重采样规则 (频率, 偏移)；小时线以 9:30 为起点，A股得到 10:30、11:30、13:30、14:30、15:00 五根
+RESAMPLE_RULES = {'hour': ('60min', '30min'), 'day': ('1D', '0min')}
+
+
+def encode_prices(prices: pd.Series) -> np.ndarray:
+    """价格 -> int32 tick；超出 int32 范围时抛出 ValueError"""
+    ticks = np.round(pd.to_numeric(prices).to_numpy(dtype=np.float64) * PRICE_SCALE)
+    if np.isnan(ticks).any():
+        raise ValueError("价格中存在缺失值")
+    if np.abs(ticks).max(initial=0) > np.iinfo(np.int32).max:
+        raise ValueError(f"价格超出 int32 tick 表示范围（PRICE_SCALE={PRICE_SCALE}）")
+    return ticks.astype(np.int32)
+
+
+def decode_prices(ticks: np.ndarray) -> np.ndarray:
+    """int32 tick -> float64 价格"""
+    return np.asarray(ticks, dtype=np.float64) / PRICE_SCALE
+
+
+class MinuteStore:
+    """
+    分钟K线分区存储
+
+    参数:
+        root: 存储根目录
+        ktype: K线周期，如 'K_1M'、'K_5M'
+    """
+
+    def __init__(self, root: str = MINUTE_STORE_DIR, ktype: str = 'K_1M'):
+        self.root = root
+        self.ktype = str(ktype)
+        self.base_dir = os.path.join(root, f'ktype={self.ktype}')
+
+    def _path(self, code: str, month: int) -> str:
+        return os.path.join(self.base_dir, f'code={code}', f'month={month}', 'part-0.parquet')
+
+    def _to_table(self, df: pd.DataFrame) -> pa.Table:
+        arrays = [pa.array(df['time_key'].to_numpy('datetime64[s]'))]
+        arrays += [pa.array(encode_prices(df[col])) for col in PRICE_COLUMNS]
+        arrays += [
+            pa.array(pd.to_numeric(df['volume']).fillna(0).to_numpy(dtype=np.int64)),
+            pa.array(pd.to_numeric(df['turnover'], errors='coerce').to_numpy(dtype=np.float64)),
+        ]
+        return pa.Table.from_arrays(arrays, schema=MINUTE_SCHEMA)
+
+    def _write_file(self, path: str, df: pd.DataFrame) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 临时文件以 . 开头，并发读取时不会被数据集扫描到
+        tmp_path = os.path.join(os.path.dirname(path), f'.{os.path.basename(path)}.tmp')
+        pq.write_table(
+            self._to_table(df), tmp_path, compression='zstd',
+            use_dictionary=['volume', 'turnover'], column_encoding=COLUMN_ENCODING,
+        )
+        os.replace(tmp_path, path)
+
+    def write(self, df: pd.DataFrame) -> int:
+        """
+        写入分钟K线（含 MINUTE_COLUMNS），与已有数据按 (code, time_key) 合并去重
+
+        返回:
+            写入后涉及月份文件的总行数
+        """
+        if df is None or df.empty:
+            return 0
+        df = df[MINUTE_COLUMNS].copy()
+        df['time_key'] = pd.to_datetime(df['time_key'])
+        df['month'] = (df['time_key'].dt.year * 100 + df['time_key'].dt.month).astype('int32')
+        rows = 0
+        for (code, month), part in df.groupby(['code', 'month'], sort=False):
+            path = self._path(code, month)
+            if os.path.exists(path):
+                existing = self._decode(pq.read_table(path))
+                part = pd.concat([existing, part], ignore_index=True)
+            part = part.drop_duplicates('time_key', keep='last').sort_values('time_key')
+            self._write_file(path, part)
+            rows += len(part)
+        return rows
+
+    @staticmethod
+    def _decode(table: pa.Table) -> pd.DataFrame:
+        df = table.to_pandas()
+        df['time_key'] = df['time_key'].astype('datetime64[ns]')
+        for col in PRICE_COLUMNS:
+            if col in df.columns:
+                df[col] = decode_prices(df[col].to_numpy())
+        return df
+
+    def _dataset(self) -> Optional[ds.Dataset]:
+        if not os.path.isdir(self.base_dir):
+            return None
+        return ds.dataset(self.base_dir, format='parquet', partitioning=ds.partitioning(PARTITION_SCHEMA, flavor='hive'))
+
+    def read(
+        self,
+        codes: Union[str, Iterable[str], None] = None,
+        start=None,
+        end=None,
+        columns: Optional[List[str]] = None,
+    ) -> pd.DataFrame:
+        """
+        按股票、时间区间读取分钟K线，价格还原为浮点数，按 (code, time_key) 排序
+
+        参数:
+            codes: 单个代码或代码列表，None 表示全部
+            start, end: 时间区间；只给日期时 end 当天整天包含在内
+            columns: 需要的列，默认 MINUTE_COLUMNS
+        """
+        columns = list(columns) if columns else list(MINUTE_COLUMNS)
+        dataset = self._dataset()
+        if dataset is None:
+            return pd.DataFrame(columns=columns)
+        if isinstance(codes, str):
+            codes = [codes]
+        exprs = []
+        if codes is not None:
+            exprs.append(ds.field('code').isin(list(codes)))
+        if start is not None:
+            start = pd.Timestamp(start)
+            exprs.append(ds.field('month') >= start.year * 100 + start.month)
+            exprs.append(ds.field('time_key') >= pa.scalar(start.value // 10**9, pa.timestamp('s')))
+        if end is not None:
+            end = pd.Timestamp(end)
+            exprs.append(ds.field('month') <= end.year * 100 + end.month)
+            if end == end.normalize():
+                end = end + pd.Timedelta(days=1)
+                exprs.append(ds.field('time_key') < pa.scalar(end.value // 10**9, pa.timestamp('s')))
+            else:
+                exprs.append(ds.field('time_key') <= pa.scalar(end.value // 10**9, pa.timestamp('s')))
+        expr = None
+        for e in exprs:
+            expr = e if expr is None else expr & e
+        read_columns = list(dict.fromkeys(['code', 'time_key'] + [c for c in columns if c != 'code']))
+        df = self._decode(dataset.to_table(columns=read_columns, filter=expr))
+        df = df.sort_values(['code', 'time_key'], kind='stable').reset_index(drop=True)
+        return df[columns]
+
+    def resample(self, codes=None, start=None, end=None, rule: str = 'hour') -> pd.DataFrame:
+        """
+        读取时把分钟K线聚合为小时线或日线，全部股票一次分组完成
+
+        参数:
+            rule: 'hour'、'day' 或 pandas 频率字符串；
+                  日线 time_key 为当日零点，其余周期为区间内最后一根分钟K线的时间
+        """
+        freq, offset = RESAMPLE_RULES.get(rule, (rule, '0min'))
+        df = self.read(codes, start, end)
+        if df.empty:
+            return df
+        if rule == 'day':
+            bucket = df['time_key'].dt.normalize()
+        else:
+            # 左开右闭区间 (k*freq+offset, (k+1)*freq+offset]，分钟K线的时间为区间结束时刻
+            offset = pd.Timedelta(offset)
+            bucket = (df['time_key'] - offset).dt.ceil(freq) + offset
+        # 只对有成交的区间分组，午休等空区间不会产出K线
+        bars = df.groupby([df['code'], bucket.rename('bucket')], sort=True).agg(
+            time_key=('time_key', 'last'),
+            open=('open', 'first'),
+            close=('close', 'last'),
+            high=('high', 'max'),
+            low=('low', 'min'),
+            volume=('volume', 'sum'),
+            turnover=('turnover', 'sum'),
+        ).reset_index()
+        if rule == 'day':
+            bars['time_key'] = bars['bucket']
+        return bars[MINUTE_COLUMNS]
+
+    def codes(self) -> List[str]:
+        """已存储的股票代码"""
+        if not os.path.isdir(self.base_dir):
+            return []
+        return sorted(name.split('=', 1)[1] for name in os.listdir(self.base_dir) if name.startswith('code='))
@@ -0,0 +1,108 @@
+# 流式 parquet 写入 - 按批追加 row group，固定 schema，完成后原子替换目标文件
+"""
+逐只股票 pd.concat 累加再一次性 to_parquet，耗时随总行数平方增长，且全部数据都要留在内存中。
+ParquetSink 每收到一批数据就写成一个 row group，内存只占当前一批；
+写入过程中输出到临时文件，close() 时才 os.replace 到目标路径，中途失败不会破坏旧文件。
+
+用法:
+    with ParquetSink('data/kline_data.parquet') as sink:
+        for code, data in ...:
+            sink.write(data)
+"""
+
+import os
+from typing import Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# 历史K线列及类型，与 fetch_kline_daily.hist_columns 一致
+HIST_SCHEMA = pa.schema([
+    ('code', pa.string()),
+    ('name', pa.string()),
+    ('time_key', pa.timestamp('ns')),
+    ('open', pa.float64()),
+    ('close', pa.float64()),
+    ('high', pa.float64()),
+    ('low', pa.float64()),
+    ('pe_ratio', pa.float64()),
+    ('volume', pa.int64()),
+    ('turnover_rate', pa.float64()),
+    ('turnover', pa.float64()),
+    ('change_rate', pa.float64()),
+])
+
+
+def to_arrow_table(df: pd.DataFrame, schema: pa.Schema = HIST_SCHEMA) -> pa.Table:
+    """按 schema 选列并转换类型；缺少列时抛出 ValueError"""
+    missing = [name for name in schema.names if name not in df.columns]
+    if missing:
+        raise ValueError(f"数据缺少列: {missing}")
+    df = df[schema.names].copy()
+    for field in schema:
+        if pa.types.is_timestamp(field.type):
+            df[field.name] = pd.to_datetime(df[field.name])
+        elif pa.types.is_integer(field.type):
+            df[field.name] = pd.to_numeric(df[field.name]).fillna(0).astype('int64')
+        elif pa.types.is_floating(field.type):
+            df[field.name] = pd.to_numeric(df[field.name], errors='coerce').astype('float64')
+    return pa.Table.from_pandas(df, schema=schema, preserve_index=False)
+
+
+class ParquetSink:
+    """
+    流式 parquet 写入器
+
+    参数:
+        path: 目标文件路径
+        schema: 列及类型，默认 HIST_SCHEMA
+        compression: 压缩算法
+    """
+
+    def __init__(self, path: str, schema: pa.Schema = HIST_SCHEMA, compression: str = 'snappy'):
+        self.path = path
+        self.schema = schema
+        self.compression = compression
+        self.tmp_path = f'{path}.tmp'
+        self.rows = 0
+        self._writer: Optional[pq.ParquetWriter] = None
+
+    def _open(self) -> pq.ParquetWriter:
+        if self._writer is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            self._writer = pq.ParquetWriter(self.tmp_path, self.schema, compression=self.compression)
+        return self._writer
+
+    def write(self, df: pd.DataFrame) -> None:
+        """把一批数据追加为一个 row group"""
+        if df is None or df.empty:
+            return
+        self._open().write_table(to_arrow_table(df, self.schema))
+        self.rows += len(df)
+
+    def close(self) -> str:
+        """完成写入并原子替换目标文件，返回目标路径；没有任何数据时也写出空文件"""
+        writer = self._open()
+        writer.close()
+        self._writer = None
+        os.replace(self.tmp_path, self.path)
+        return self.path
+
+    def abort(self) -> None:
+        """放弃写入，删除临时文件，保留原有目标文件"""
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
@@ -0,0 +1,413 @@
+# 组合级多标的回测 - 基于每日选股信号矩阵的资金分配与离场模拟
+"""
+工作流与实盘一致：每天运行 configs.json 中启用的选股器，次日开盘买入选出的股票，
+满足离场规则（如收盘价跌破BBI，同 SuperB1Strategy）后次日开盘卖出。
+
+选股器只在构建信号矩阵时运行一次（可多进程并行、可落盘缓存），
+组合模拟只消费 日期×股票 的布尔矩阵，调整仓位参数或离场规则无需重新选股。
+"""
+
+import argparse
+import hashlib
+import importlib
+import json
+import logging
+import multiprocessing
+import os
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from compact_panel import PRICE_DTYPES, bbi, load_panel
+from kline_dataset import dataset_version
+
+logger = logging.getLogger(__name__)
+
+TRADING_DAYS_PER_YEAR = 252
+
+
+# ---------- 数据准备 ---------- #
+def pivot_panel(df: pd.DataFrame, column: str) -> pd.DataFrame:
+    """把 code/time_key 长表转换为 日期×股票 的宽表"""
+    df = df.drop_duplicates(['code', 'time_key'], keep='last')
+    return df.pivot(index='time_key', columns='code', values=column).sort_index()
+
+
+def split_by_code(df: pd.DataFrame) -> Dict[str, pd.DataFrame]:
+    """一次 groupby 把长表拆成选股器需要的 {code: DataFrame(date, ...)}"""
+    df = df.rename(columns={'time_key': 'date'}).sort_values(['code', 'date'])
+    return {code: g.reset_index(drop=True) for code, g in df.groupby('code', sort=False)}
+
+
+def compute_bbi_panel(close: pd.DataFrame, valid: Optional[np.ndarray] = None) -> pd.DataFrame:
+    """
+    对宽表逐列计算BBI (3,6,12,24日均线均值)，保持宽表的浮点类型（float32 面板按 float32 计算）
+
+    与 SuperB1Strategy 对单只股票K线序列的计算一致，均线只在该股票有K线的交易日上滚动：
+    每列的有效行先稳定地移到列首、计算后再放回原日期，停牌日为 NaN 且不会使之后 24 天的BBI缺失
+
+    参数:
+        valid: (日期数, 股票数) 布尔数组，该股票当天是否有K线（如 PricePanel.valid）；默认为收盘价非 NaN
+    """
+    values = close.to_numpy()
+    if values.dtype not in (np.float32, np.float64):
+        values = values.astype(np.float64)
+    mask = ~np.isnan(values)
+    if valid is not None:
+        mask &= np.asarray(valid, dtype=bool)
+    # 每列有效行在前（保持日期顺序），无效行在后；均线只向前看，列尾的无效行不影响有效行
+    order = np.argsort(~mask, axis=0, kind='stable')
+    packed = bbi(np.take_along_axis(values, order, axis=0))
+    out = np.empty_like(packed)
+    np.put_along_axis(out, order, packed, axis=0)
+    out[~mask] = np.nan
+    return pd.DataFrame(out, index=close.index, columns=close.columns)
+
+
+def bbi_exit_signals(close: pd.DataFrame, valid: Optional[np.ndarray] = None) -> pd.DataFrame:
+    """离场信号：收盘价跌破BBI"""
+    return close < compute_bbi_panel(close, valid)
+
+
+# ---------- 信号矩阵 ---------- #
+def selector_cache_key(selector) -> str:
+    """由选股器类名和全部参数（含嵌套选股器）生成缓存键，参数变化即失效"""
+    params = json.dumps(vars(selector), sort_keys=True, ensure_ascii=False,
+                        default=lambda o: vars(o) if hasattr(o, '__dict__') else str(o))
+    return f"{type(selector).__name__}_{hashlib.md5(params.encode('utf-8')).hexdigest()[:10]}"
+
+
+def signal_cache_file(cache_dir: Optional[str], version: str, selector, price_dtype: str = 'float64') -> Optional[str]:
+    """
+    信号矩阵缓存文件路径；选股器看到的 hist 随 price_dtype 变化（float32 舍入、int32 tick），
+    阈值附近的选股结果可能不同，因此价格类型也是缓存键的一部分
+
+    返回:
+        cache_dir 为空时返回 None（不缓存）
+    """
+    if not cache_dir:
+        return None
+    return os.path.join(cache_dir, f"{version}_{price_dtype}_{selector_cache_key(selector)}.parquet")
+
+
+_worker_selector = None
+_worker_data = None
+
+
+def _init_signal_worker(selector, data):
+    global _worker_selector, _worker_data
+    _worker_selector = selector
+    _worker_data = data
+
+
+def _select_on_dates(dates):
+    return [(date, _worker_selector.select(date, _worker_data)) for date in dates]
+
+
+def build_signal_matrix(selector, data: Dict[str, pd.DataFrame], dates, processes: Optional[int] = None) -> pd.DataFrame:
+    """
+    对每个交易日运行一次 selector.select，得到 日期×股票 的布尔信号矩阵
+
+    参数:
+        selector: 任意实现了 select(date, data) 的选股器实例
+        data: {code: DataFrame}，需包含 date 列
+        dates: 需要生成信号的交易日序列
+        processes: 并行进程数，默认使用全部CPU核心；为1时在当前进程运行
+    """
+    dates = list(pd.DatetimeIndex(dates))
+    codes = sorted(data.keys())
+    signals = pd.DataFrame(False, index=pd.DatetimeIndex(dates, name='time_key'), columns=codes)
+    if not dates:
+        return signals
+
+    processes = processes or os.cpu_count() or 1
+    if processes == 1:
+        _init_signal_worker(selector, data)
+        picks_by_date = _select_on_dates(dates)
+    else:
+        chunks = [dates[i::processes] for i in range(processes)]
+        with multiprocessing.Pool(processes, initializer=_init_signal_worker, initargs=(selector, data)) as pool:
+            picks_by_date = [item for chunk in pool.map(_select_on_dates, chunks) for item in chunk]
+
+    for date, picks in picks_by_date:
+        if picks:
+            signals.loc[date, picks] = True
+    return signals
+
+
+def load_or_build_signal_matrix(selector, data, dates, cache_file: Optional[str] = None, processes=None) -> pd.DataFrame:
+    """
+    带落盘缓存的信号矩阵构建；只为缓存中没有的日期运行选股器，与已缓存的日期合并后写回，
+    交替回测不同区间时缓存逐步扩大而不是互相覆盖
+    """
+    dates = pd.DatetimeIndex(dates)
+    cached = None
+    if cache_file and os.path.exists(cache_file):
+        cached = pd.read_parquet(cache_file)
+        if dates.isin(cached.index).all():
+            return cached.loc[dates]
+    missing = dates if cached is None else dates[~dates.isin(cached.index)]
+    signals = build_signal_matrix(selector, data, missing, processes=processes)
+    if cached is not None:
+        # 两次构建时的股票集合可能不同，缺失的格子没有信号
+        signals = pd.concat([cached, signals]).fillna(False).astype(bool).sort_index()
+        signals = signals[~signals.index.duplicated(keep='last')]
+    if cache_file:
+        os.makedirs(os.path.dirname(cache_file) or '.', exist_ok=True)
+        tmp_file = f'{cache_file}.tmp'
+        signals.to_parquet(tmp_file)
+        os.replace(tmp_file, cache_file)
+    return signals.loc[dates]
+
+
+def load_selectors(config_file: str, module_name: str = 'Selector') -> List[tuple]:
+    """按 configs.json 实例化启用的选股器，返回 [(alias, selector)]；无法加载的配置跳过"""
+    with open(config_file, 'r', encoding='utf-8') as f:
+        cfg_raw = json.load(f)
+    cfgs = cfg_raw['selectors'] if isinstance(cfg_raw, dict) and 'selectors' in cfg_raw else cfg_raw
+    if isinstance(cfgs, dict):
+        cfgs = [cfgs]
+
+    module = importlib.import_module(module_name)
+    selectors = []
+    for cfg in cfgs:
+        if cfg.get('activate', True) is False:
+            continue
+        cls_name = cfg.get('class')
+        try:
+            cls = getattr(module, cls_name)
+            selectors.append((cfg.get('alias', cls_name), cls(**cfg.get('params', {}))))
+        except Exception as e:
+            logger.error(f"跳过配置 {cls_name}: {e}")
+    return selectors
+
+
+# ---------- 组合模拟 ---------- #
+class PortfolioSimulator:
+    """
+    日频组合模拟器
+
+    规则:
+        • T 日收盘产生的买入/离场信号在 T+1 日开盘成交
+        • 最多同时持有 max_positions 只，单只目标市值不超过总资产的 max_weight
+        • 按 lot_size 整手买入，买卖均收取 commission 比例手续费
+        • 停牌（开盘价缺失）当日不成交，顺延到下一个可交易日
+    """
+
+    def __init__(
+        self,
+        initial_cash: float = 100000.0,
+        max_positions: int = 10,
+        max_weight: float = 0.2,
+        lot_size: int = 100,
+        commission: float = 0.001,
+        max_hold_days: Optional[int] = None,
+    ) -> None:
+        if max_positions < 1:
+            raise ValueError("max_positions 应 ≥ 1")
+        if not (0 < max_weight <= 1):
+            raise ValueError("max_weight 应位于 (0, 1] 区间")
+        self.initial_cash = initial_cash
+        self.max_positions = max_positions
+        self.max_weight = max_weight
+        self.lot_size = lot_size
+        self.commission = commission
+        self.max_hold_days = max_hold_days
+
+    def run(
+        self,
+        signals: pd.DataFrame,
+        open_: pd.DataFrame,
+        close: pd.DataFrame,
+        exit_signals: Optional[pd.DataFrame] = None,
+        scores: Optional[pd.DataFrame] = None,
+    ) -> Dict[str, Any]:
+        """
+        运行组合模拟
+
+        参数:
+            signals: 日期×股票 布尔买入信号
+            open_, close: 日期×股票 开盘价/收盘价宽表
+            exit_signals: 日期×股票 布尔离场信号，默认使用收盘跌破BBI
+            scores: 可选的排序分数，同日候选超过空余仓位时分数高者优先
+        返回:
+            {'equity': 每日资产Series, 'trades': 成交明细DataFrame, 'summary': 指标字典}
+        """
+        dates = close.index
+        codes = close.columns
+        if exit_signals is None:
+            exit_signals = bbi_exit_signals(close)
+        open_arr = open_.reindex(index=dates, columns=codes).to_numpy(dtype=np.float64)
+        close_arr = close.to_numpy(dtype=np.float64)
+        buy_arr = signals.reindex(index=dates, columns=codes).fillna(False).to_numpy(dtype=bool)
+        exit_arr = exit_signals.reindex(index=dates, columns=codes).fillna(False).to_numpy(dtype=bool)
+        score_arr = None if scores is None else scores.reindex(index=dates, columns=codes).to_numpy(dtype=np.float64)
+
+        n_codes = len(codes)
+        shares = np.zeros(n_codes, dtype=np.int64)
+        entry_price = np.zeros(n_codes)
+        entry_idx = np.full(n_codes, -1, dtype=np.int64)
+        last_close = np.full(n_codes, np.nan)
+        cash = float(self.initial_cash)
+        equity = np.empty(len(dates))
+        trades = []
+
+        pending_buy = np.zeros(n_codes, dtype=bool)
+        pending_sell = np.zeros(n_codes, dtype=bool)
+        pending_score = np.zeros(n_codes)
+
+        for t in range(len(dates)):
+            px_open = open_arr[t]
+            tradable = ~np.isnan(px_open)
+
+            # 1. 开盘先卖出
+            sell_idx = np.flatnonzero(pending_sell & (shares > 0) & tradable)
+            for i in sell_idx:
+                proceeds = shares[i] * px_open[i]
+                fee = proceeds * self.commission
+                cash += proceeds - fee
+                trades.append({
+                    'code': codes[i],
+                    'entry_date': dates[entry_idx[i]],
+                    'exit_date': dates[t],
+                    'entry_price': entry_price[i],
+                    'exit_price': px_open[i],
+                    'size': int(shares[i]),
+                    'pnl': shares[i] * (px_open[i] - entry_price[i]) - fee - shares[i] * entry_price[i] * self.commission,
+                    'return': px_open[i] / entry_price[i] - 1,
+                    'hold_days': t - entry_idx[i],
+                })
+                shares[i] = 0
+                entry_idx[i] = -1
+            pending_sell[sell_idx] = False
+
+            # 2. 开盘再买入
+            held = shares > 0
+            slots = self.max_positions - int(held.sum())
+            candidates = np.flatnonzero(pending_buy & ~held & tradable)
+            if slots > 0 and candidates.size:
+                if score_arr is not None:
+                    candidates = candidates[np.argsort(-pending_score[candidates], kind='stable')]
+                candidates = candidates[:slots]
+                mark = np.where(held, np.where(np.isnan(last_close), entry_price, last_close), 0.0)
+                total_value = cash + float((shares * mark).sum())
+                target = min(total_value * self.max_weight, total_value / self.max_positions)
+                for i in candidates:
+                    budget = min(target, cash / (1 + self.commission))
+                    size = int(budget // (px_open[i] * self.lot_size)) * self.lot_size
+                    if size <= 0:
+                        continue
+                    cost = size * px_open[i]
+                    cash -= cost * (1 + self.commission)
+                    shares[i] = size
+                    entry_price[i] = px_open[i]
+                    entry_idx[i] = t
+            pending_buy[:] = False
+
+            # 3. 收盘估值并生成次日指令
+            px_close = close_arr[t]
+            valid_close = ~np.isnan(px_close)
+            last_close[valid_close] = px_close[valid_close]
+            held = shares > 0
+            mark = np.where(np.isnan(last_close), entry_price, last_close)
+            equity[t] = cash + float((shares * np.where(held, mark, 0.0)).sum())
+
+            exit_now = exit_arr[t].copy()
+            if self.max_hold_days is not None:
+                exit_now |= held & (t - entry_idx >= self.max_hold_days)
+            pending_sell |= held & exit_now
+            pending_buy = buy_arr[t] & ~held
+            if score_arr is not None:
+                pending_score = np.nan_to_num(score_arr[t], nan=-np.inf)
+
+        equity = pd.Series(equity, index=dates, name='equity')
+        trades = pd.DataFrame(trades, columns=[
+            'code', 'entry_date', 'exit_date', 'entry_price', 'exit_price', 'size', 'pnl', 'return', 'hold_days'
+        ])
+        return {'equity': equity, 'trades': trades, 'summary': summarize_equity(equity, trades, self.initial_cash)}
+
+
+def summarize_equity(equity: pd.Series, trades: pd.DataFrame, initial_cash: float) -> Dict[str, float]:
+    """计算组合收益、最大回撤、夏普比率与交易统计"""
+    daily_ret = equity.pct_change().fillna(equity.iloc[0] / initial_cash - 1) if len(equity) else equity
+    total_return = equity.iloc[-1] / initial_cash - 1 if len(equity) else 0.0
+    years = len(equity) / TRADING_DAYS_PER_YEAR
+    drawdown = equity / equity.cummax() - 1 if len(equity) else equity
+    std = daily_ret.std()
+    return {
+        'final_value': float(equity.iloc[-1]) if len(equity) else initial_cash,
+        'total_return': float(total_return),
+        'annual_return': float((1 + total_return) ** (1 / years) - 1) if years > 0 else 0.0,
+        'max_drawdown': float(-drawdown.min()) if len(equity) else 0.0,
+        'sharpe': float(daily_ret.mean() / std * np.sqrt(TRADING_DAYS_PER_YEAR)) if std and std > 0 else float('nan'),
+        'trade_count': int(len(trades)),
+        'win_rate': float((trades['pnl'] > 0).mean()) if len(trades) else float('nan'),
+    }
+
+
+def run_config_portfolio(
+    kline_file: str,
+    config_file: str,
+    start_date: str,
+    end_date: str,
+    cache_dir: str = 'data/signal_cache',
+    processes: Optional[int] = None,
+    price_dtype: str = 'float64',
+    **simulator_params,
+) -> Dict[str, Any]:
+    """
+    端到端：加载K线 → 为每个启用的选股器构建（或读取缓存的）信号矩阵 → 合并信号 → 组合模拟
+
+    K线按数据版本对齐为面板并缓存，宽表和各选股器的 {code: DataFrame} 都从同一面板取得；
+    price_dtype='float32' 时价格宽表和各选股器的 hist 均为 float32，内存减半
+    """
+    panel = load_panel(kline_file, columns=['open', 'high', 'low', 'close', 'volume'], price_dtype=price_dtype)
+    open_ = panel.frame('open')
+    close = panel.frame('close')
+    dates = close.loc[start_date:end_date].index
+    data = panel.code_frames()
+
+    version = dataset_version(kline_file)
+    combined = pd.DataFrame(False, index=dates, columns=close.columns)
+    for alias, selector in load_selectors(config_file):
+        cache_file = signal_cache_file(cache_dir, version, selector, price_dtype)
+        logger.info(f"构建选股信号: {alias}")
+        signals = load_or_build_signal_matrix(selector, data, dates, cache_file=cache_file, processes=processes)
+        combined |= signals.reindex(index=dates, columns=close.columns).fillna(False).astype(bool)
+
+    simulator = PortfolioSimulator(**simulator_params)
+    # BBI 在完整历史上计算，避免回测窗口起点附近均线缺失
+    exit_signals = bbi_exit_signals(close, panel.valid).loc[dates]
+    return simulator.run(combined, open_.loc[dates], close.loc[dates], exit_signals=exit_signals)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="基于每日选股结果的组合回测")
+    parser.add_argument("--data-file", default="./data/kline_data.parquet", help="K线parquet文件")
+    parser.add_argument("--config", default="../Inference/configs.json", help="Selector 配置文件")
+    parser.add_argument("--start-date", required=True, help="开始日期 (YYYY-MM-DD)")
+    parser.add_argument("--end-date", required=True, help="结束日期 (YYYY-MM-DD)")
+    parser.add_argument("--initial-cash", type=float, default=100000.0)
+    parser.add_argument("--max-positions", type=int, default=10)
+    parser.add_argument("--max-weight", type=float, default=0.2)
+    parser.add_argument("--processes", type=int, default=None, help="构建信号矩阵的并行进程数")
+    parser.add_argument("--price-dtype", choices=PRICE_DTYPES, default='float64',
+                        help="面板价格类型，float32 内存减半，int32 为 tick 存储")
+    args = parser.parse_args()
+
+    result = run_config_portfolio(
+        args.data_file, args.config, args.start_date, args.end_date,
+        processes=args.processes,
+        price_dtype=args.price_dtype,
+        initial_cash=args.initial_cash,
+        max_positions=args.max_positions,
+        max_weight=args.max_weight,
+    )
+    for key, value in result['summary'].items():
+        print(f"{key}: {value}")
+
+
+if __name__ == "__main__":
+    main()
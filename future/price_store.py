@@ -0,0 +1,304 @@
+# 价格历史存储接口 - 日K线的读写与分析查询，可选 SQLite（Stock 表）或 DuckDB（分区 parquet）实现
+"""
+投资组合、持仓仍保存在 SQLite 中；日K线这类只追加、按列分析的数据放在 PriceStore 后面，
+DatabaseTools 通过同一组方法访问，不关心底层存储:
+
+    SQLitePriceStore   现有的 Stock 表（db_schema 中的批量写入和列投影查询）
+    DuckDBPriceStore   kline_dataset 的 hive 分区 parquet 目录，由 DuckDB 列式扫描，
+                       分区列（market/prefix/year）参与裁剪，最新日期、计数等聚合不读价格列
+
+两个实现的返回格式相同（列、排序、类型），由 test_price_store.py 中同一组测试验证。
+DuckDB 实现的写入与 kline_dataset.append_daily 相同，只新增增量文件；同一K线出现在多个文件中时，
+查询以最后写入的文件为准。
+
+用法:
+    store = open_price_store('duckdb')   # 默认查询 kline_dataset.DATASET_DIR
+    store.write(df)
+    panel = store.read(['SH.600000', 'SZ.000001'], start_date='2024-01-01', columns=['close'])
+    tools = DatabaseTools('investment_portfolio.db', price_store=store)
+"""
+
+import logging
+import os
+from abc import ABC, abstractmethod
+from typing import Dict, Iterable, List, Optional
+
+import pandas as pd
+from sqlalchemy import func
+
+from db_schema import (
+    STOCK_COLUMNS,
+    DatabaseManager,
+    Stock,
+    get_latest_dates_for_stocks,
+    get_stock_frame,
+    get_stock_panel_frame,
+    upsert_stock_klines,
+)
+from kline_dataset import DATASET_DIR, SCAN_RETRIES, append_daily
+
+logger = logging.getLogger(__name__)
+
+PRICE_STORE_BACKENDS = ('sqlite', 'duckdb')
+# 默认直接查询 fetch_kline_daily / 数据更新页面维护的分区数据集，两者的表结构和分区布局相同
+KLINE_STORE_DIR = DATASET_DIR
+
+
+class PriceStore(ABC):
+    """
+    日K线存储接口
+
+    read 返回按 (code, time_key) 升序的长表，time_key 为 datetime64，数值列为 float64
+    """
+
+    @abstractmethod
+    def write(self, df: pd.DataFrame) -> int:
+        """写入K线，(code, time_key) 已存在时覆盖；返回写入的行数"""
+
+    @abstractmethod
+    def read(self, codes: Iterable[str], start_date=None, end_date=None, columns: Optional[List[str]] = None,
+             limit: Optional[int] = None) -> pd.DataFrame:
+        """
+        读取多只股票的K线
+
+        参数:
+            codes: 股票代码列表
+            start_date, end_date: 日期区间（可选），结束日期当天包含在内
+            columns: 除 code、time_key 外需要的列，None 表示全部
+            limit: 每只股票只取最近 limit 条（可选）
+        """
+
+    def recent(self, code: str, limit: int = 100) -> pd.DataFrame:
+        """单只股票最近 limit 条K线，按 time_key 降序"""
+        return self.read([code], limit=limit).iloc[::-1].reset_index(drop=True)
+
+    @abstractmethod
+    def latest_dates(self, codes: Optional[Iterable[str]] = None) -> Dict[str, pd.Timestamp]:
+        """{股票代码: 最新日期}；codes 为 None 时返回全部股票，没有数据的股票不在结果中"""
+
+    @abstractmethod
+    def count_rows(self) -> int:
+        """K线总行数"""
+
+    @abstractmethod
+    def count_codes(self) -> int:
+        """股票数"""
+
+    @abstractmethod
+    def last_update_time(self):
+        """全部K线中最新的 time_key，没有数据时为 None"""
+
+
+class SQLitePriceStore(PriceStore):
+    """
+    基于 Stock 表的实现
+
+    参数:
+        db_manager: DatabaseManager 或数据库文件路径
+    """
+
+    def __init__(self, db_manager='investment_portfolio.db'):
+        if not isinstance(db_manager, DatabaseManager):
+            db_manager = DatabaseManager(db_manager)
+        if not db_manager.SessionLocal:
+            db_manager.init_db()
+        self.db_manager = db_manager
+
+    def write(self, df):
+        with self.db_manager.create_session() as session:
+            return upsert_stock_klines(session, df)
+
+    def read(self, codes, start_date=None, end_date=None, columns=None, limit=None):
+        with self.db_manager.create_session() as session:
+            return get_stock_panel_frame(session, codes, start_date, end_date, columns, limit)
+
+    def recent(self, code, limit=100):
+        # 保留 id 列，与原 get_stock_data 的字典一致
+        with self.db_manager.create_session() as session:
+            return get_stock_frame(session, code, limit)
+
+    def latest_dates(self, codes=None):
+        with self.db_manager.create_session() as session:
+            return {code: pd.Timestamp(value) for code, value in get_latest_dates_for_stocks(session, codes).items()}
+
+    def count_rows(self):
+        with self.db_manager.create_session() as session:
+            return session.query(func.count(Stock.id)).scalar()
+
+    def count_codes(self):
+        with self.db_manager.create_session() as session:
+            return session.query(func.count(Stock.code.distinct())).scalar()
+
+    def last_update_time(self):
+        with self.db_manager.create_session() as session:
+            value = session.query(func.max(Stock.time_key)).scalar()
+        return None if value is None else pd.Timestamp(value)
+
+
+class DuckDBPriceStore(PriceStore):
+    """
+    基于 hive 分区 parquet 目录的实现，写入复用 kline_dataset 的分区布局和增量文件，查询由 DuckDB 执行
+
+    参数:
+        dataset_dir: 分区数据集目录，不存在时在第一次写入时创建
+    """
+
+    # 与 kline_dataset 的写入先后一致：part-* 最早，delta-<写入序号>-* 按文件名递增
+    WRITE_ORDER = ("CASE WHEN starts_with(parse_filename(filename), 'delta-') "
+                   "THEN parse_filename(filename) ELSE '' END")
+
+    def __init__(self, dataset_dir: str = KLINE_STORE_DIR):
+        import duckdb
+
+        self.dataset_dir = dataset_dir
+        # 每次查询使用独立游标，多个线程可共用同一个 store
+        self._con = duckdb.connect()
+
+    def _source(self, params: list) -> Optional[str]:
+        """
+        数据集的 read_parquet 表达式，文件路径作为绑定参数追加到 params，目录名中的引号等字符不进入 SQL；
+        数据集目录不存在时返回 None
+        """
+        if not os.path.isdir(self.dataset_dir):
+            return None
+        params.append(os.path.join(self.dataset_dir, '**', '*.parquet'))
+        # 分区值按字符串/整数解析，避免 prefix=60 被推断为数字；filename 列用于判断写入先后
+        return ("read_parquet(?, hive_partitioning = true, filename = true, "
+                "hive_types = {'market': VARCHAR, 'prefix': VARCHAR, 'year': INTEGER})")
+
+    def _query(self, sql: str, params=()) -> pd.DataFrame:
+        """
+        执行查询；文件在 glob 展开之后被 compact_partitions 合并删除时，重新展开后重试
+        （合并先写入新文件再删除旧文件，重新展开总能看到完整数据）
+        """
+        import duckdb
+
+        for attempt in range(SCAN_RETRIES + 1):
+            cursor = self._con.cursor()
+            try:
+                return cursor.execute(sql, list(params)).df()
+            except duckdb.IOException as e:
+                if attempt == SCAN_RETRIES or 'No such file or directory' not in str(e):
+                    raise
+                logger.debug(f"{self.dataset_dir} 文件已被合并，重新查询")
+            finally:
+                cursor.close()
+
+    def _scalar(self, sql: str, default=None):
+        params: list = []
+        source = self._source(params)
+        if source is None:
+            return default
+        return self._query(sql.format(source=source), params).iloc[0, 0]
+
+    def write(self, df):
+        if df is None or df.empty:
+            return 0
+        # 每个分区只新增一个增量文件，不读取、不改写已有文件；小文件由 compact_partitions 合并
+        rows = append_daily(df.reindex(columns=STOCK_COLUMNS), self.dataset_dir)
+        logger.info(f"批量写入 {rows} 条K线到 {self.dataset_dir}")
+        return rows
+
+    @staticmethod
+    def _code_filter(codes: List[str], params: list) -> str:
+        """代码过滤，同时给出 market/prefix 分区条件，DuckDB 据此跳过无关目录"""
+        parts = pd.Series(codes, dtype=object).str.split('.', n=1, expand=True)
+        markets = sorted(set(parts[0]))
+        prefixes = sorted(set(parts[1].str[:2].dropna())) if parts.shape[1] > 1 else []
+        params.extend(codes + markets + prefixes)
+        clauses = [
+            f"code IN ({', '.join('?' * len(codes))})",
+            f"market IN ({', '.join('?' * len(markets))})",
+        ]
+        if prefixes:
+            clauses.append(f"prefix IN ({', '.join('?' * len(prefixes))})")
+        return ' AND '.join(clauses)
+
+    def read(self, codes, start_date=None, end_date=None, columns=None, limit=None):
+        names = ['code', 'time_key'] + [c for c in (columns or STOCK_COLUMNS) if c not in ('code', 'time_key')]
+        codes = sorted(set(codes))
+        params: list = []
+        source = self._source(params)
+        if source is None or not codes:
+            return self._empty(names)
+        where = [self._code_filter(codes, params)]
+        if start_date is not None:
+            start = pd.Timestamp(start_date).normalize()
+            where.append('year >= ? AND time_key >= ?')
+            params += [start.year, start.to_pydatetime()]
+        if end_date is not None:
+            end = pd.Timestamp(end_date).normalize() + pd.Timedelta(days=1)
+            where.append('year <= ? AND time_key < ?')
+            params += [pd.Timestamp(end_date).year, end.to_pydatetime()]
+        select = ', '.join(self._select_column(name) for name in names)
+        # 先按条件裁剪，再在同一K线的多个版本中取最后写入的一条
+        sql = (f"SELECT {select} FROM {source} WHERE {' AND '.join(where)} "
+               f"QUALIFY row_number() OVER (PARTITION BY code, time_key ORDER BY {self.WRITE_ORDER} DESC) = 1")
+        if limit is not None:
+            sql = (f"SELECT * FROM ({sql}) "
+                   "QUALIFY row_number() OVER (PARTITION BY code ORDER BY time_key DESC) <= ?")
+            params.append(int(limit))
+        df = self._query(sql + ' ORDER BY code, time_key', params)
+        return self._normalize(df)
+
+    @staticmethod
+    def _select_column(name: str) -> str:
+        # 与 Stock 表一致：成交量等数值列统一为 DOUBLE
+        if name in ('code', 'name', 'time_key'):
+            return name
+        return f'CAST({name} AS DOUBLE) AS {name}'
+
+    @staticmethod
+    def _normalize(df: pd.DataFrame) -> pd.DataFrame:
+        """与 SQLite 实现的列类型保持一致：字符串列使用 pandas 默认字符串类型，time_key 为 datetime64"""
+        df['time_key'] = pd.to_datetime(df['time_key'])
+        for name in ('code', 'name'):
+            if name in df.columns:
+                df[name] = df[name].astype(str)
+        return df
+
+    @classmethod
+    def _empty(cls, names: List[str]) -> pd.DataFrame:
+        return cls._normalize(pd.DataFrame({name: pd.Series(dtype='float64') for name in names}))
+
+    def latest_dates(self, codes=None):
+        params: list = []
+        source = self._source(params)
+        if source is None:
+            return {}
+        where = ''
+        if codes is not None:
+            codes = sorted(set(codes))
+            if not codes:
+                return {}
+            where = f'WHERE {self._code_filter(codes, params)}'
+        df = self._query(f"SELECT code, max(time_key) AS time_key FROM {source} {where} GROUP BY code", params)
+        return dict(zip(df['code'], pd.to_datetime(df['time_key'])))
+
+    def count_rows(self):
+        # 同一K线可能在多个文件中，按 (code, time_key) 去重计数；最新日期、股票数等聚合不受重复影响
+        return int(self._scalar("SELECT count(*) FROM (SELECT DISTINCT code, time_key FROM {source})", 0))
+
+    def count_codes(self):
+        return int(self._scalar("SELECT count(DISTINCT code) FROM {source}", 0))
+
+    def last_update_time(self):
+        value = self._scalar("SELECT max(time_key) FROM {source}")
+        return None if pd.isna(value) else pd.Timestamp(value)
+
+
+def open_price_store(backend: str = 'sqlite', db_manager='investment_portfolio.db',
+                     dataset_dir: str = KLINE_STORE_DIR) -> PriceStore:
+    """
+    按名称创建价格存储
+
+    参数:
+        backend: 'sqlite' 或 'duckdb'
+        db_manager: sqlite 实现使用的 DatabaseManager 或数据库文件
+        dataset_dir: duckdb 实现使用的分区数据集目录
+    """
+    if backend == 'sqlite':
+        return SQLitePriceStore(db_manager)
+    if backend == 'duckdb':
+        return DuckDBPriceStore(dataset_dir)
+    raise ValueError(f"不支持的价格存储: {backend}，可选 {PRICE_STORE_BACKENDS}")
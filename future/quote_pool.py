@@ -0,0 +1,188 @@
+# 富途行情连接池 - 复用长连接的 OpenQuoteContext，带健康检查、断线重连和并发上限
+"""
+每次请求都新建 OpenQuoteContext 的开销（建连、握手、启动收包线程）远大于请求本身。
+这里维护一个进程内共享的连接池：
+
+    • 最多同时存在 max_size 个连接，超出时借用方排队等待
+    • 归还时检查连接状态，断开的连接直接丢弃，下次借用时重新建连
+    • 空闲超过 health_check_interval 的连接在借出前用 get_global_state 探活
+
+用法:
+    with get_quote_pool().borrow() as quote_ctx:
+        ret, data = quote_ctx.get_market_snapshot(codes)
+"""
+
+import atexit
+import logging
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+from futu import OpenQuoteContext, RET_OK
+from futu.common.open_context_base import ContextStatus
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 11111
+
+
+class QuoteContextPool:
+    """
+    OpenQuoteContext 连接池
+
+    参数:
+        host, port: OpenD 地址
+        max_size: 同时存在的连接数上限
+        acquire_timeout: 借用连接的最长等待秒数，超时抛出 TimeoutError
+        health_check_interval: 连接空闲超过该秒数后，借出前先探活
+        context_factory: 创建连接的工厂函数，默认 OpenQuoteContext(host, port)；
+                         测试时可替换为本地模拟的行情上下文
+    """
+
+    def __init__(
+        self,
+        host: str = DEFAULT_HOST,
+        port: int = DEFAULT_PORT,
+        max_size: int = 4,
+        acquire_timeout: float = 60.0,
+        health_check_interval: float = 60.0,
+        context_factory: Optional[Callable[[], object]] = None,
+    ):
+        if max_size < 1:
+            raise ValueError("max_size 必须大于0")
+        self.host = host
+        self.port = port
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+        self.health_check_interval = health_check_interval
+        self.context_factory = context_factory or (lambda: OpenQuoteContext(host=self.host, port=self.port))
+        # 空闲连接队列，元素为 (ctx, 最近一次归还时间)
+        self._idle = queue.LifoQueue()
+        # 控制已创建连接总数不超过 max_size
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._lock = threading.Lock()
+        self._created = 0
+        self._closed = False
+
+    @property
+    def size(self) -> int:
+        """当前已创建（含借出）的连接数"""
+        return self._created
+
+    def _create(self):
+        ctx = self.context_factory()
+        with self._lock:
+            self._created += 1
+        logger.debug(f"新建行情连接，当前连接数 {self._created}")
+        return ctx
+
+    def _discard(self, ctx) -> None:
+        with self._lock:
+            self._created -= 1
+        try:
+            ctx.close()
+        except Exception as e:
+            logger.debug(f"关闭行情连接时出错: {e}")
+
+    @staticmethod
+    def _is_connected(ctx) -> bool:
+        """根据连接状态判断是否可用；没有 status 属性的上下文视为可用"""
+        status = getattr(ctx, 'status', None)
+        return status is None or status not in (ContextStatus.CLOSED, ContextStatus.CLOSING)
+
+    def _is_healthy(self, ctx, idle_since: float) -> bool:
+        if not self._is_connected(ctx):
+            return False
+        if time.monotonic() - idle_since < self.health_check_interval:
+            return True
+        try:
+            ret, _ = ctx.get_global_state()
+            return ret == RET_OK
+        except Exception as e:
+            logger.warning(f"行情连接探活失败: {e}")
+            return False
+
+    def acquire(self, timeout: Optional[float] = None):
+        """借出一个可用连接；优先复用空闲连接，不足时在上限内新建"""
+        if self._closed:
+            raise RuntimeError("行情连接池已关闭")
+        timeout = self.acquire_timeout if timeout is None else timeout
+        if not self._slots.acquire(timeout=timeout):
+            raise TimeoutError(f"等待行情连接超时（上限 {self.max_size} 个）")
+        try:
+            while True:
+                try:
+                    ctx, idle_since = self._idle.get_nowait()
+                except queue.Empty:
+                    return self._create()
+                if self._is_healthy(ctx, idle_since):
+                    return ctx
+                logger.info("行情连接已失效，丢弃并重连")
+                self._discard(ctx)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def release(self, ctx, broken: bool = False) -> None:
+        """归还连接；broken 或已断开的连接直接关闭，不再放回池中"""
+        try:
+            if broken or self._closed or not self._is_connected(ctx):
+                self._discard(ctx)
+            else:
+                self._idle.put((ctx, time.monotonic()))
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def borrow(self, timeout: Optional[float] = None):
+        """借用连接的上下文管理器，出错时在归还前检查连接是否仍然可用"""
+        ctx = self.acquire(timeout)
+        broken = False
+        try:
+            yield ctx
+        except Exception:
+            broken = not self._is_healthy(ctx, 0.0)
+            raise
+        finally:
+            self.release(ctx, broken=broken)
+
+    def close(self) -> None:
+        """关闭所有空闲连接；借出中的连接在归还时关闭"""
+        self._closed = True
+        while True:
+            try:
+                ctx, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(ctx)
+
+
+_pool: Optional[QuoteContextPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_quote_pool(**kwargs) -> QuoteContextPool:
+    """获取进程内共享的行情连接池，首次调用时按 kwargs 创建"""
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool._closed:
+            _pool = QuoteContextPool(**kwargs)
+        return _pool
+
+
+def set_quote_pool(pool: Optional[QuoteContextPool]) -> None:
+    """替换共享连接池（例如接入本地模拟行情），旧连接池会被关闭"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None and _pool is not pool:
+            _pool.close()
+        _pool = pool
+
+
+@atexit.register
+def _close_quote_pool():
+    if _pool is not None:
+        _pool.close()
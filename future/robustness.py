@@ -0,0 +1,185 @@
+# 回测结果稳健性分析 - 基于逐笔交易的 Bootstrap / 随机入场 蒙特卡洛模拟
+"""
+单次回测只给出一个夏普比率。这里把逐笔交易（TradeListAnalyzer 或 PortfolioSimulator 的 trades）
+重采样成成千上万条资金曲线，给出收益、最大回撤、夏普比率的置信区间。
+
+方法:
+    bootstrap  有放回地重采样交易盈亏，评估收益分布
+    shuffle    打乱交易顺序，评估路径依赖的回撤分布
+    random_entry 同一股票、同样持有天数、随机入场日，评估信号相对随机入场的优势
+
+所有路径按矩阵一次性计算；路径数较多时按块分发到多个进程。
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+TRADING_DAYS_PER_YEAR = 252
+# 单进程内一次处理的 路径数×交易数 上限，超过后才启用多进程
+_PARALLEL_THRESHOLD = 2_000_000
+
+
+def _trades_per_year(trades: pd.DataFrame) -> float:
+    """用交易日期跨度估算每年交易笔数，用于把逐笔夏普年化"""
+    if trades.empty or 'entry_date' not in trades or 'exit_date' not in trades:
+        return float(TRADING_DAYS_PER_YEAR)
+    start = pd.to_datetime(trades['entry_date']).min()
+    end = pd.to_datetime(trades['exit_date']).max()
+    years = max((end - start).days / 365.25, 1 / 365.25)
+    return len(trades) / years
+
+
+def path_metrics(pnl_paths: np.ndarray, initial_cash: float, periods_per_year: float) -> Dict[str, np.ndarray]:
+    """
+    对 路径数×交易数 的盈亏矩阵计算每条路径的指标
+
+    返回:
+        {'total_return', 'max_drawdown', 'sharpe'}，每项为长度等于路径数的数组
+    """
+    equity = initial_cash + np.cumsum(pnl_paths, axis=1)
+    equity = np.concatenate([np.full((equity.shape[0], 1), float(initial_cash)), equity], axis=1)
+    peak = np.maximum.accumulate(equity, axis=1)
+    max_drawdown = np.max(1 - equity / peak, axis=1)
+    step_ret = equity[:, 1:] / equity[:, :-1] - 1
+    std = step_ret.std(axis=1, ddof=1) if step_ret.shape[1] > 1 else np.zeros(step_ret.shape[0])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sharpe = np.where(std > 0, step_ret.mean(axis=1) / std * np.sqrt(periods_per_year), np.nan)
+    return {
+        'total_return': equity[:, -1] / initial_cash - 1,
+        'max_drawdown': max_drawdown,
+        'sharpe': sharpe,
+    }
+
+
+def _simulate_chunk(args):
+    method, pnl, n_paths, seed, initial_cash, periods_per_year, random_pnl = args
+    rng = np.random.default_rng(seed)
+    n = len(pnl)
+    if method == 'bootstrap':
+        paths = pnl[rng.integers(0, n, size=(n_paths, n))]
+    elif method == 'shuffle':
+        paths = np.take_along_axis(np.broadcast_to(pnl, (n_paths, n)), rng.random((n_paths, n)).argsort(axis=1), axis=1)
+    elif method == 'random_entry':
+        paths = random_pnl(rng, n_paths)
+    else:
+        raise ValueError(f"未知的模拟方法: {method}")
+    return path_metrics(paths, initial_cash, periods_per_year)
+
+
+class _RandomEntrySampler:
+    """对每笔交易在同一股票上随机挑选入场日，保持持有天数和入场资金不变"""
+
+    def __init__(self, trades: pd.DataFrame, close: pd.DataFrame):
+        codes = close.columns.get_indexer(trades['code'])
+        if (codes < 0).any():
+            raise ValueError("close 宽表缺少部分交易的股票代码")
+        self.close = close.to_numpy(dtype=np.float64)
+        self.codes = codes
+        self.hold = np.maximum(trades['hold_days'].to_numpy(dtype=np.int64), 1)
+        # 空头交易的 size 为负，随机入场的盈亏方向随之反转
+        self.notional = (trades['entry_price'] * trades['size']).to_numpy(dtype=np.float64)
+        # 每只股票的有效区间，随机入场日只在有行情的范围内选取
+        valid = ~np.isnan(self.close)
+        first = valid.argmax(axis=0)
+        last = self.close.shape[0] - 1 - valid[::-1].argmax(axis=0)
+        self.lo = first[codes]
+        self.hi = np.maximum(last[codes] - self.hold, self.lo)
+
+    def __call__(self, rng, n_paths):
+        n = len(self.codes)
+        start = self.lo + (rng.random((n_paths, n)) * (self.hi - self.lo + 1)).astype(np.int64)
+        end = np.minimum(start + self.hold, self.close.shape[0] - 1)
+        ret = self.close[end, self.codes] / self.close[start, self.codes] - 1
+        return np.nan_to_num(ret) * self.notional
+
+
+def monte_carlo(
+    trades: pd.DataFrame,
+    n_paths: int = 10000,
+    method: str = 'bootstrap',
+    initial_cash: float = 100000.0,
+    pnl_column: Optional[str] = None,
+    close: Optional[pd.DataFrame] = None,
+    seed: Optional[int] = None,
+    processes: Optional[int] = None,
+) -> pd.DataFrame:
+    """
+    生成 n_paths 条模拟资金曲线并返回逐路径指标
+
+    参数:
+        trades: 逐笔交易，至少包含 pnl/pnlcomm 列；random_entry 还需要 code/entry_price/size/hold_days
+        method: 'bootstrap' | 'shuffle' | 'random_entry'
+        pnl_column: 使用的盈亏列，默认优先 pnlcomm（扣费后）再 pnl
+        close: random_entry 需要的 日期×股票 收盘价宽表
+        processes: 并行进程数；默认仅在计算量较大时使用全部CPU核心
+    返回:
+        每条路径一行，列为 total_return / max_drawdown / sharpe
+    """
+    if trades is None or len(trades) == 0:
+        raise ValueError("交易列表为空，无法进行稳健性分析")
+    pnl_column = pnl_column or ('pnlcomm' if 'pnlcomm' in trades else 'pnl')
+    pnl = trades[pnl_column].to_numpy(dtype=np.float64)
+    periods_per_year = _trades_per_year(trades)
+
+    random_pnl = None
+    if method == 'random_entry':
+        if close is None:
+            raise ValueError("random_entry 方法需要提供 close 宽表")
+        random_pnl = _RandomEntrySampler(trades, close)
+
+    if processes is None:
+        processes = (os.cpu_count() or 1) if n_paths * len(pnl) > _PARALLEL_THRESHOLD else 1
+    processes = max(1, min(processes, n_paths))
+    seeds = np.random.SeedSequence(seed).spawn(processes)
+    sizes = [n_paths // processes + (1 if i < n_paths % processes else 0) for i in range(processes)]
+    jobs = [(method, pnl, size, s, initial_cash, periods_per_year, random_pnl) for size, s in zip(sizes, seeds)]
+
+    if processes == 1:
+        results = [_simulate_chunk(jobs[0])]
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            results = list(executor.map(_simulate_chunk, jobs))
+
+    return pd.DataFrame({key: np.concatenate([r[key] for r in results]) for key in results[0]})
+
+
+def confidence_report(
+    paths: pd.DataFrame,
+    observed: Optional[Dict[str, float]] = None,
+    levels: Sequence[float] = (0.05, 0.5, 0.95),
+) -> pd.DataFrame:
+    """
+    汇总模拟路径的分位数置信区间
+
+    参数:
+        paths: monte_carlo 的返回值
+        observed: 原始回测的指标，用于计算其在模拟分布中的分位
+    """
+    rows = []
+    for metric in paths.columns:
+        values = paths[metric].dropna().to_numpy()
+        row = {'metric': metric, 'mean': float(values.mean()) if values.size else np.nan}
+        for q in levels:
+            row[f'p{int(q * 100)}'] = float(np.quantile(values, q)) if values.size else np.nan
+        if metric == 'total_return':
+            row['prob_loss'] = float((values < 0).mean()) if values.size else np.nan
+        if observed and metric in observed and values.size:
+            row['observed'] = observed[metric]
+            row['observed_pct'] = float((values <= observed[metric]).mean())
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def analyze_backtest(strat, n_paths: int = 10000, method: str = 'bootstrap', initial_cash: float = 100000.0, **kwargs) -> pd.DataFrame:
+    """直接分析 backtrader 策略实例（需挂载名为 trade_list 的 TradeListAnalyzer）"""
+    from analyzers import trades_to_frame
+    trades = trades_to_frame(strat.analyzers.trade_list.get_analysis())
+    paths = monte_carlo(trades, n_paths=n_paths, method=method, initial_cash=initial_cash, **kwargs)
+    observed = path_metrics(
+        trades['pnlcomm'].to_numpy(dtype=np.float64)[None, :], initial_cash, _trades_per_year(trades)
+    )
+    return confidence_report(paths, observed={k: float(v[0]) for k, v in observed.items()})
@@ -0,0 +1,172 @@
+# 行情快照服务 - 合并并发请求批量拉取快照，短时缓存报价
+"""
+逐只调用 get_market_snapshot 时每只股票都要借一次连接、走一次网络往返，并占用一次快照配额；
+而富途快照接口单次最多可请求 400 只股票。SnapshotService:
+
+    • get_many(codes) 一次请求拿到全部报价（超过 400 只自动分批）
+    • 缓存 ttl 秒内的报价，同一页面多处取价不再重复请求
+    • 并发调用时，同一只股票只请求一次；不同调用方新增的股票在 linger 窗口内合并为一个批次
+    • 批次在后台线程中请求，调用方最多等待 timeout 秒，请求卡住时抛出 TimeoutError 而不是一直阻塞
+
+用法:
+    prices = get_snapshot_service().get_prices(['SH.510300', 'SZ.159915'])
+"""
+
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Dict, Iterable, List, Optional
+
+from futu import RET_OK
+
+from quote_pool import QuoteContextPool, get_quote_pool
+
+# 单次快照请求的最大股票数
+MAX_SNAPSHOT_CODES = 400
+
+
+class SnapshotService:
+    """
+    批量、带缓存的行情快照
+
+    参数:
+        ttl: 报价缓存秒数，0 表示不缓存
+        linger: 发起请求前等待其他调用方合并的秒数
+        batch_size: 单次请求的最大股票数
+        pool: 行情连接池，默认每次请求时使用进程内共享连接池
+        timeout: 调用方等待快照的最长秒数
+    """
+
+    def __init__(self, ttl: float = 3.0, linger: float = 0.005, batch_size: int = MAX_SNAPSHOT_CODES,
+                 pool: Optional[QuoteContextPool] = None, timeout: float = 30.0):
+        self.ttl = ttl
+        self.linger = linger
+        self.batch_size = batch_size
+        self.pool = pool
+        self.timeout = timeout
+        self.requests = 0
+        self._cache: Dict[str, tuple] = {}
+        self._inflight: Dict[str, Future] = {}
+        self._pending: List[str] = []
+        self._flushing = False
+        self._lock = threading.Lock()
+
+    def _fetch(self, codes: List[str]) -> None:
+        """请求一批快照并写入缓存，失败时让等待这些股票的调用方抛出异常"""
+        pool = self.pool or get_quote_pool()
+        with self._lock:
+            # 等待超时的股票已从 _inflight 中移除，不再请求；这里只完成本批次取出时登记的 Future
+            codes = [code for code in codes if code in self._inflight]
+            futures = [self._inflight[code] for code in codes]
+            if not codes:
+                return
+            self.requests += 1
+        try:
+            with pool.borrow() as quote_ctx:
+                ret, data = quote_ctx.get_market_snapshot(codes)
+            if ret != RET_OK:
+                raise RuntimeError(f"获取行情快照失败: {data}")
+            rows = {row['code']: row for row in data.to_dict('records')}
+            missing = [code for code in codes if code not in rows]
+            if missing:
+                raise RuntimeError(f"行情快照缺少股票: {missing}")
+        except Exception as e:
+            with self._lock:
+                self._release(codes, futures)
+            for future in futures:
+                future.set_exception(e)
+            return
+        now = time.monotonic()
+        with self._lock:
+            for code in codes:
+                self._cache[code] = (now, rows[code])
+            self._release(codes, futures)
+        for code, future in zip(codes, futures):
+            future.set_result(rows[code])
+
+    def _release(self, codes: List[str], futures: List[Future]) -> None:
+        """从 _inflight 中移除仍指向这些 Future 的股票（需持有 _lock）"""
+        for code, future in zip(codes, futures):
+            if self._inflight.get(code) is future:
+                del self._inflight[code]
+
+    def _flush(self) -> None:
+        """后台线程循环取出排队的股票，分批请求，直到队列清空"""
+        if self.linger:
+            time.sleep(self.linger)
+        while True:
+            with self._lock:
+                batch = self._pending[:self.batch_size]
+                del self._pending[:self.batch_size]
+                if not batch:
+                    self._flushing = False
+                    return
+            self._fetch(batch)
+
+    def get_many(self, codes: Iterable[str]) -> Dict[str, Dict]:
+        """
+        获取多只股票的快照，返回 {code: 快照字段字典}
+
+        任一批次请求失败时抛出 RuntimeError；timeout 秒内没有拿到全部报价时抛出 TimeoutError，
+        超时的股票不再等待原请求，下次调用重新请求
+        """
+        codes = list(dict.fromkeys(codes))
+        result, waiting = {}, {}
+        now = time.monotonic()
+        with self._lock:
+            for code in codes:
+                cached = self._cache.get(code)
+                if cached is not None and now - cached[0] < self.ttl:
+                    result[code] = cached[1]
+                elif code in self._inflight:
+                    waiting[code] = self._inflight[code]
+                else:
+                    waiting[code] = self._inflight[code] = Future()
+                    self._pending.append(code)
+            leader = bool(self._pending) and not self._flushing
+            if leader:
+                self._flushing = True
+        if leader:
+            # 在后台线程中请求，请求卡住时发起方也能按 timeout 返回
+            threading.Thread(target=self._flush, daemon=True, name='snapshot-flush').start()
+        deadline = time.monotonic() + self.timeout
+        for code, future in waiting.items():
+            try:
+                result[code] = future.result(timeout=max(deadline - time.monotonic(), 0))
+            except FutureTimeoutError:
+                with self._lock:
+                    self._release(list(waiting), list(waiting.values()))
+                    # 卡住的后台线程不再负责排队的股票，下一次调用另起线程请求
+                    self._flushing = False
+                raise TimeoutError(f"等待行情快照超时（{self.timeout:g}秒）: {code}") from None
+        return {code: result[code] for code in codes}
+
+    def get(self, code: str) -> Dict:
+        """获取单只股票的快照"""
+        return self.get_many([code])[code]
+
+    def get_prices(self, codes: Iterable[str]) -> Dict[str, float]:
+        """获取多只股票的最新价 {code: last_price}"""
+        return {code: row['last_price'] for code, row in self.get_many(codes).items()}
+
+    def invalidate(self, codes: Optional[Iterable[str]] = None) -> None:
+        """清除缓存，codes 为 None 时清除全部"""
+        with self._lock:
+            if codes is None:
+                self._cache.clear()
+            else:
+                for code in codes:
+                    self._cache.pop(code, None)
+
+
+_service: Optional[SnapshotService] = None
+_service_lock = threading.Lock()
+
+
+def get_snapshot_service(**kwargs) -> SnapshotService:
+    """获取进程内共享的快照服务，首次调用时按 kwargs 创建"""
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = SnapshotService(**kwargs)
+        return _service
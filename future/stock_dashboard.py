@@ -911,8 +911,8 @@ def update_kline_data(pool_name="etf"):
         
         # 获取并保存历史K线数据
         logger.info(f"开始更新{pool_name}的历史K线数据，共{len(stock_pool)}只{pool_name}")
-        data = fetcher.hist_kline_persistence(data_filename)
-        logger.info(f"{pool_name}历史K线数据更新完成，数据形状: {data.shape}")
+        data_path = fetcher.hist_kline_persistence(data_filename, return_data=False)
+        logger.info(f"{pool_name}历史K线数据更新完成，已保存到: {data_path}")
         
         return True, f"成功更新{len(stock_pool)}只{pool_name}的历史K线数据"
         
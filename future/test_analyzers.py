@@ -0,0 +1,66 @@
+"""
+逐笔交易分析器测试：多头和空头交易的成交价、数量符号和盈亏与 backtrader 的成交一致
+
+运行: python test_analyzers.py  或  pytest test_analyzers.py
+"""
+
+import backtrader as bt
+import numpy as np
+import pandas as pd
+
+from analyzers import TradeListAnalyzer, trades_to_frame
+
+PRICES = [10.0, 11.0, 12.0, 13.0, 12.0, 10.0, 9.0, 9.5, 10.5, 11.0]
+
+
+class ScriptedStrategy(bt.Strategy):
+    """按 bar 序号下单：orders 为 {bar 序号: 目标持仓}，市价单在下一根 bar 开盘成交"""
+
+    params = (('orders', {}),)
+
+    def next(self):
+        target = self.p.orders.get(len(self) - 1)
+        if target is not None:
+            self.order_target_size(target=target)
+
+
+def run_trades(orders) -> pd.DataFrame:
+    index = pd.bdate_range('2024-01-01', periods=len(PRICES))
+    prices = pd.DataFrame({'open': PRICES, 'high': PRICES, 'low': PRICES, 'close': PRICES, 'volume': 1e6},
+                          index=index)
+    cerebro = bt.Cerebro()
+    cerebro.adddata(bt.feeds.PandasData(dataname=prices), name='SH.600000')
+    cerebro.addstrategy(ScriptedStrategy, orders=orders)
+    cerebro.addanalyzer(TradeListAnalyzer, _name='trade_list')
+    strategy = cerebro.run()[0]
+    return trades_to_frame(strategy.analyzers.trade_list.get_analysis())
+
+
+def test_long_trade():
+    # bar 序号从 0 开始：第1根下单、第2根开盘 12 买入；第4根下单、第5根开盘 10 卖出
+    trades = run_trades({1: 100, 4: 0})
+    assert len(trades) == 1
+    trade = trades.iloc[0]
+    assert trade['size'] == 100
+    np.testing.assert_allclose([trade['entry_price'], trade['exit_price'], trade['pnl']], [12.0, 10.0, -200.0])
+
+
+def test_short_trade():
+    # 开盘 12 卖空 100 股，开盘 9 回补：盈利 300，出场价为 9 而不是以入场价镜像的 15
+    trades = run_trades({1: -100, 5: 0})
+    assert len(trades) == 1
+    trade = trades.iloc[0]
+    assert trade['size'] == -100
+    np.testing.assert_allclose([trade['entry_price'], trade['exit_price'], trade['pnl']], [12.0, 9.0, 300.0])
+    np.testing.assert_allclose(trade['return'], 300.0 / 1200.0)
+
+
+def main():
+    for name, func in list(globals().items()):
+        if name.startswith('test_') and callable(func):
+            func()
+            print(f"{name}: 通过")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+回测图表测试：缓存键随策略/参数/区间/数据版本变化、资金曲线与交易明细落盘往返、
+在 spawn 进程池中用 Agg 后端渲染且已渲染的图表不再重绘
+
+运行: python test_backtest_charts.py  或  pytest test_backtest_charts.py
+"""
+
+import os
+import sys
+import tempfile
+
+import pandas as pd
+
+from backtest_charts import chart_cache_key, load_backtest_series, render_charts, save_backtest_series
+from kline_dataset import write_dataset
+
+KLINE_FILE = 'data/kline_data.parquet'
+PNG_MAGIC = b'\x89PNG\r\n\x1a\n'
+
+
+def _series(dates: pd.DatetimeIndex):
+    equity = pd.DataFrame({'date': dates, 'value': 100000.0 + pd.Series(range(len(dates))) * 10.0})
+    trades = pd.DataFrame({
+        'entry_date': [dates[2]], 'entry_price': [10.0],
+        'exit_date': [dates[8]], 'exit_price': [11.0], 'pnl': [100.0],
+    })
+    return equity, trades
+
+
+def test_chart_cache_key():
+    base = chart_cache_key('BBIStrategy', 'HK.00700', {'period': 20}, 'v1', '2024-01-01', '2024-06-30')
+    assert base == chart_cache_key('BBIStrategy', 'HK.00700', {'period': 20}, 'v1', '2024-01-01', '2024-06-30')
+    # 参数字典的顺序不影响缓存键
+    assert (chart_cache_key('S', 'HK.00700', {'a': 1, 'b': 2}, 'v1')
+            == chart_cache_key('S', 'HK.00700', {'b': 2, 'a': 1}, 'v1'))
+    variants = [
+        chart_cache_key('OtherStrategy', 'HK.00700', {'period': 20}, 'v1', '2024-01-01', '2024-06-30'),
+        chart_cache_key('BBIStrategy', 'HK.00005', {'period': 20}, 'v1', '2024-01-01', '2024-06-30'),
+        chart_cache_key('BBIStrategy', 'HK.00700', {'period': 30}, 'v1', '2024-01-01', '2024-06-30'),
+        chart_cache_key('BBIStrategy', 'HK.00700', {'period': 20}, 'v2', '2024-01-01', '2024-06-30'),
+        chart_cache_key('BBIStrategy', 'HK.00700', {'period': 20}, 'v1', '2024-02-01', '2024-06-30'),
+        chart_cache_key('BBIStrategy', 'HK.00700', {'period': 20}, 'v1', '2024-01-01', '2024-07-31'),
+    ]
+    assert len({base, *variants}) == len(variants) + 1
+
+
+def test_save_load_round_trip():
+    dates = pd.date_range('2024-01-01', periods=20, freq='B')
+    equity, trades = _series(dates)
+    meta = {'strategy': 'BBIStrategy', 'code': 'HK.00700', 'start_date': dates[0], 'end_date': dates[-1]}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        save_backtest_series('k1', equity, trades, meta, series_dir=tmp_dir)
+        loaded_equity, loaded_trades, loaded_meta = load_backtest_series('k1', series_dir=tmp_dir)
+    pd.testing.assert_frame_equal(loaded_equity, equity, check_dtype=False)
+    pd.testing.assert_frame_equal(loaded_trades, trades, check_dtype=False)
+    # 时间戳按字符串保存在 meta.json 中
+    assert loaded_meta['code'] == 'HK.00700'
+    assert pd.Timestamp(loaded_meta['start_date']) == dates[0]
+
+
+def test_render_charts_headless_and_cached():
+    df = pd.read_parquet(KLINE_FILE)
+    df['time_key'] = pd.to_datetime(df['time_key'])
+    code = sorted(df['code'].unique())[0]
+    df = df[df['code'] == code]
+    dates = pd.DatetimeIndex(df['time_key'].iloc[-30:])
+    pyplot_loaded = 'matplotlib.pyplot' in sys.modules
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        dataset_dir = os.path.join(tmp_dir, 'dataset')
+        series_dir = os.path.join(tmp_dir, 'series')
+        chart_dir = os.path.join(tmp_dir, 'charts')
+        write_dataset(df, dataset_dir)
+
+        equity, trades = _series(dates)
+        keys = []
+        for i, meta_extra in enumerate([{'dataset_dir': dataset_dir}, {}]):
+            key = f'k{i}'
+            # 第二个回测没有可用的数据集，只画资金曲线
+            meta = {'strategy': 'BBIStrategy', 'code': code, 'start_date': str(dates[0].date()),
+                    'end_date': str(dates[-1].date()), **meta_extra}
+            save_backtest_series(key, equity, trades, meta, series_dir=series_dir)
+            keys.append(key)
+
+        paths = render_charts(keys + keys[:1], max_workers=2, series_dir=series_dir, chart_dir=chart_dir)
+        assert sorted(paths) == keys
+        mtimes = {}
+        for key, path in paths.items():
+            assert path == os.path.join(chart_dir, f'{key}.png')
+            with open(path, 'rb') as f:
+                assert f.read(8) == PNG_MAGIC
+            mtimes[key] = os.stat(path).st_mtime_ns
+        assert not [name for name in os.listdir(chart_dir) if '.tmp' in name]
+
+        # 已渲染的图表直接返回，不再启动子进程重绘
+        again = render_charts(keys, series_dir=series_dir, chart_dir=chart_dir)
+        assert again == paths
+        assert all(os.stat(path).st_mtime_ns == mtimes[key] for key, path in again.items())
+
+    # 绘图只发生在子进程中，调用方进程不会导入 pyplot（也就不会锁定 GUI 后端）
+    assert ('matplotlib.pyplot' in sys.modules) == pyplot_loaded
+
+
+def main():
+    for name, func in list(globals().items()):
+        if name.startswith('test_') and callable(func):
+            func()
+            print(f"{name}: 通过")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+紧凑价格面板的精度测试：float32 / int32 tick 面板上的指标与 float64 路径的误差在约定范围内
+
+运行: python test_compact_panel.py  或  pytest test_compact_panel.py
+"""
+
+import numpy as np
+import pandas as pd
+
+from compact_panel import PricePanel, bbi, compact_frame, dif, kdj, rolling_mean
+from minute_store import PRICE_SCALE
+from portfolio_backtest import compute_bbi_panel
+from Selector import compute_bbi, compute_dif, compute_kdj
+
+KLINE_FILE = 'data/kline_data.parquet'
+# float32 面板的误差上限
+MA_RTOL = 1e-5
+KDJ_ATOL = 1e-2
+
+
+def load_klines() -> pd.DataFrame:
+    df = pd.read_parquet(KLINE_FILE, columns=['code', 'time_key', 'open', 'high', 'low', 'close'])
+    df['time_key'] = pd.to_datetime(df['time_key'])
+    return df
+
+
+def _assert_close(actual, expected, rtol=0.0, atol=0.0, name=''):
+    actual = np.asarray(actual, dtype=np.float64)
+    expected = np.asarray(expected, dtype=np.float64)
+    assert np.array_equal(np.isnan(actual), np.isnan(expected)), f"{name} 缺失值位置不一致"
+    mask = ~np.isnan(expected)
+    err = np.abs(actual[mask] - expected[mask])
+    bound = atol + rtol * np.abs(expected[mask])
+    assert (err <= bound).all(), f"{name} 最大误差 {err.max():.3g} 超出容差"
+
+
+def test_kernels_match_pandas_float64():
+    """float64 内核与 Selector 中的 pandas 实现一致"""
+    df = load_klines()
+    for code, g in list(df.groupby('code'))[:10]:
+        g = g.sort_values('time_key').reset_index(drop=True)
+        high, low, close = (g[c].to_numpy()[:, None] for c in ('high', 'low', 'close'))
+        ref = compute_kdj(g)
+        k, d, j = kdj(high, low, close)
+        _assert_close(k[:, 0], ref['K'], rtol=1e-9, atol=1e-9, name=f'{code} K')
+        _assert_close(j[:, 0], ref['J'], rtol=1e-9, atol=1e-9, name=f'{code} J')
+        _assert_close(bbi(close)[:, 0], compute_bbi(g), rtol=1e-12, name=f'{code} BBI')
+        _assert_close(dif(close)[:, 0], compute_dif(g), rtol=1e-9, atol=1e-9, name=f'{code} DIF')
+
+
+def test_rolling_mean_min_periods():
+    a = np.array([[1.0], [np.nan], [3.0], [4.0]])
+    expected = pd.Series(a[:, 0]).rolling(2, min_periods=1).mean().to_numpy()
+    _assert_close(rolling_mean(a, 2, min_periods=1)[:, 0], expected, name='min_periods')
+    _assert_close(rolling_mean(a, 2)[:, 0], pd.Series(a[:, 0]).rolling(2).mean().to_numpy(), name='strict')
+
+
+def test_float32_panel_within_tolerance():
+    df = load_klines()
+    ref = PricePanel.from_long(df, 'float64')
+    small = PricePanel.from_long(df, 'float32')
+    assert small.arrays['close'].dtype == np.float32
+    assert small.nbytes < ref.nbytes * 0.6
+
+    close64, close32 = ref.values('close'), small.values('close')
+    _assert_close(close32, close64, rtol=2.0 ** -24, name='close')
+    result = bbi(close32)
+    assert result.dtype == np.float32
+    _assert_close(result, bbi(close64), rtol=MA_RTOL, name='BBI')
+    _assert_close(dif(close32), dif(close64), atol=MA_RTOL * np.nanmax(close64), name='DIF')
+
+    k64 = kdj(ref.values('high'), ref.values('low'), close64)
+    k32 = kdj(small.values('high'), small.values('low'), close32)
+    for name, a, b in zip('KDJ', k32, k64):
+        _assert_close(a, b, atol=KDJ_ATOL, name=name)
+
+
+def test_int32_ticks_within_half_tick():
+    df = load_klines()
+    ref = PricePanel.from_long(df, 'float64')
+    ticks = PricePanel.from_long(df, 'int32')
+    assert ticks.arrays['close'].dtype == np.int32
+    assert np.array_equal(ticks.valid, ref.valid)
+    # 前复权价格不在 tick 网格上，量化误差不超过半个 tick；均线是价格的平均，误差上限相同
+    half_tick = 0.5 / PRICE_SCALE + 1e-12
+    _assert_close(ticks.values('close'), ref.values('close'), atol=half_tick, name='close')
+    _assert_close(bbi(ticks.values('close')), bbi(ref.values('close')), atol=half_tick, name='BBI')
+
+
+def test_int32_ticks_lossless_on_tick_grid():
+    df = load_klines()
+    df[['open', 'high', 'low', 'close']] = df[['open', 'high', 'low', 'close']].round(2)
+    ref = PricePanel.from_long(df, 'float64')
+    ticks = PricePanel.from_long(df, 'int32')
+    # 不复权价格为 0.01 的整数倍，tick 还原后只有浮点舍入差异
+    _assert_close(ticks.values('close'), ref.values('close'), rtol=1e-15, name='close')
+
+
+def test_float32_frame_and_bbi_panel():
+    df = load_klines()
+    small = compact_frame(df, 'float32')
+    assert small['close'].dtype == np.float32 and df['close'].dtype == np.float64
+    close64 = df.pivot(index='time_key', columns='code', values='close')
+    close32 = small.pivot(index='time_key', columns='code', values='close')
+    panel32 = compute_bbi_panel(close32)
+    assert (panel32.dtypes == np.float32).all()
+    _assert_close(panel32.to_numpy(), compute_bbi_panel(close64).to_numpy(), rtol=MA_RTOL, name='BBI panel')
+
+
+def main():
+    for name, func in list(globals().items()):
+        if name.startswith('test_') and callable(func):
+            func()
+            print(f"{name}: 通过")
+
+
+if __name__ == "__main__":
+    main()
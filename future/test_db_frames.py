@@ -0,0 +1,131 @@
+"""
+按列读取测试：get_portfolios_frame/get_positions_frame + frame_to_records 与原先逐个 ORM 对象转字典的结果一致
+（键、DATETIME_FORMAT 字符串、None），日期时间列混有带/不带微秒的存储格式和 NULL 时也能解析
+
+运行: python test_db_frames.py  或  pytest test_db_frames.py
+"""
+
+import datetime
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+from db_schema import (
+    DATETIME_FORMAT,
+    DatabaseManager,
+    Portfolio,
+    Position,
+    _parse_datetime_column,
+    frame_to_records,
+    get_portfolios_by_account,
+    get_portfolios_frame,
+    get_positions_by_account,
+    get_positions_by_portfolio,
+    get_positions_frame,
+)
+
+
+def _baseline_records(objects, model):
+    """原先的转换方式：逐个对象读取列属性，日期时间格式化为 DATETIME_FORMAT"""
+    records = []
+    for obj in objects:
+        record = {}
+        for column in model.__table__.columns:
+            value = getattr(obj, column.name)
+            if hasattr(value, 'strftime'):
+                value = value.strftime(DATETIME_FORMAT)
+            record[column.name] = value
+        records.append(record)
+    return records
+
+
+def _populate(session):
+    """两个组合、各三条持仓；时间列混有 ORM 写入（带微秒）、func.now()（不带微秒）和 NULL"""
+    stamp = datetime.datetime(2024, 6, 3, 9, 30, 15, 123456)
+    for p, day in enumerate(['2024-06-03', '2024-06-04']):
+        portfolio_id = f'port_A_{day}'
+        session.add(Portfolio(
+            portfolio_id=portfolio_id, account_id='A', total_value=100000.0 + p, cash=5000.0,
+            initial_capital=100000.0, total_return=0.01 * p, date=day,
+            # 第一个组合的时间由 ORM 写入，第二个使用数据库默认值
+            **({'created_at': stamp, 'updated_at': stamp} if p == 0 else {}),
+        ))
+        for i, code in enumerate(['HK.00700', 'HK.00005', 'HK.09988']):
+            session.add(Position(
+                position_id=f'pos_{portfolio_id}_{code}', portfolio_id=portfolio_id, account_id='A',
+                code=code, name=code, quantity=100.0 * (i + 1), price=10.0 + i, value=1000.0 * (i + 1),
+                market_price=10.5 + i, profit_loss=50.0 * i, profit_loss_pct=0.5 * i, date=day,
+                **({'created_at': stamp + datetime.timedelta(seconds=i)} if i != 1 else {}),
+            ))
+    session.commit()
+    session.execute(text("UPDATE positions SET updated_at = NULL WHERE code = 'HK.09988'"))
+    session.commit()
+
+
+def test_frames_match_orm_records():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db = DatabaseManager(os.path.join(tmp_dir, 'portfolio.db'))
+        assert db.init_db()
+        session = db.create_session()
+        try:
+            _populate(session)
+            stored = {row[0] for row in session.execute(text("SELECT created_at FROM positions"))}
+            assert any(len(v) == 19 for v in stored) and any(len(v) == 26 for v in stored)
+
+            cases = [
+                (get_portfolios_by_account(session, 'A'), Portfolio, get_portfolios_frame(session, 'A')),
+                (get_portfolios_by_account(session, 'A', '2024-06-04'), Portfolio,
+                 get_portfolios_frame(session, 'A', '2024-06-04')),
+                (get_positions_by_portfolio(session, 'port_A_2024-06-03'), Position,
+                 get_positions_frame(session, portfolio_id='port_A_2024-06-03')),
+                (get_positions_by_account(session, 'A'), Position, get_positions_frame(session, account_id='A')),
+                (get_positions_by_account(session, 'A', code='HK.09988'), Position,
+                 get_positions_frame(session, account_id='A', code='HK.09988')),
+            ]
+            for objects, model, frame in cases:
+                expected = _baseline_records(objects, model)
+                actual = frame_to_records(frame, DATETIME_FORMAT)
+                assert expected, model.__name__
+                assert actual == expected, model.__name__
+                for record in actual:
+                    assert list(record) == [c.name for c in model.__table__.columns]
+                    assert not any(isinstance(v, np.generic) for v in record.values())
+
+            positions = frame_to_records(get_positions_frame(session, account_id='A', code='HK.09988'), DATETIME_FORMAT)
+            assert all(r['updated_at'] is None and isinstance(r['created_at'], str) for r in positions)
+            # 不格式化时日期时间为 Timestamp，缺失为 None
+            raw = frame_to_records(get_positions_frame(session, account_id='A', code='HK.09988'))
+            assert all(isinstance(r['created_at'], pd.Timestamp) and r['updated_at'] is None for r in raw)
+
+            assert get_portfolios_frame(session, 'nobody').empty
+            assert frame_to_records(get_portfolios_frame(session, 'nobody'), DATETIME_FORMAT) == []
+        finally:
+            session.close()
+            db.get_engine().dispose()
+
+
+def test_parse_mixed_datetime_formats():
+    parsed = _parse_datetime_column(
+        ['2024-06-03 09:30:15.123456', '2024-06-03 09:30:16', None, '2024-06-04', '2024-06-03 09:30:17.5'])
+    expected = [pd.Timestamp('2024-06-03 09:30:15.123456'), pd.Timestamp('2024-06-03 09:30:16'), pd.NaT,
+                pd.Timestamp('2024-06-04'), pd.Timestamp('2024-06-03 09:30:17.5')]
+    assert parsed[2] is pd.NaT
+    assert list(parsed.drop(index=2)) == expected[:2] + expected[3:]
+    assert pd.api.types.is_datetime64_any_dtype(parsed)
+    # 整列缺失
+    assert _parse_datetime_column([None, None]).isna().all()
+    assert pd.api.types.is_datetime64_any_dtype(_parse_datetime_column([None, None]))
+
+
+def main():
+    for name, func in list(globals().items()):
+        if name.startswith('test_') and callable(func):
+            func()
+            print(f"{name}: 通过")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+数据库迁移测试：旧表结构（无唯一索引、有重复K线）的数据库迁移后去重保留最新一条、
+建立 (code, time_key) 唯一索引、删除 ix_stocks_code、user_version 为最新版本，重复执行无变化
+
+运行: python test_db_migrate.py  或  pytest test_db_migrate.py
+"""
+
+import os
+import tempfile
+
+from sqlalchemy import create_engine, text
+
+from db_schema import SCHEMA_VERSION, DatabaseManager, dedupe_stocks, get_schema_version, migrate
+
+# 唯一索引引入之前的 stocks 表
+OLD_STOCKS_DDL = [
+    """CREATE TABLE stocks (
+        id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT,
+        code VARCHAR NOT NULL,
+        name VARCHAR NOT NULL,
+        time_key DATETIME NOT NULL,
+        open FLOAT NOT NULL,
+        close FLOAT NOT NULL,
+        high FLOAT NOT NULL,
+        low FLOAT NOT NULL,
+        pe_ratio FLOAT,
+        volume FLOAT NOT NULL,
+        turnover_rate FLOAT,
+        turnover FLOAT,
+        change_rate FLOAT
+    )""",
+    "CREATE INDEX ix_stocks_code ON stocks (code)",
+    "CREATE INDEX ix_stocks_time_key ON stocks (time_key)",
+]
+
+CODES = [f'HK.{i:05d}' for i in range(1, 8)]
+DAYS = ['2024-06-03 00:00:00.000000', '2024-06-04 00:00:00.000000', '2024-06-05 00:00:00.000000']
+
+
+def _create_old_db(path: str) -> dict:
+    """建立旧表结构的数据库并写入重复K线，返回每组 (code, time_key) 最后写入的收盘价"""
+    engine = create_engine(f'sqlite:///{path}')
+    latest = {}
+    with engine.begin() as conn:
+        for ddl in OLD_STOCKS_DDL:
+            conn.execute(text(ddl))
+        insert = text(
+            "INSERT INTO stocks (code, name, time_key, open, close, high, low, volume) "
+            "VALUES (:code, :code, :time_key, 1, :close, 1, 1, 100)"
+        )
+        for repeat in range(3):
+            for i, code in enumerate(CODES):
+                # 每只股票重复写入的次数不同，最后一轮只重复写入部分股票
+                if repeat and i % (repeat + 1):
+                    continue
+                for day in DAYS:
+                    close = 10.0 + repeat + i / 100
+                    conn.execute(insert, {'code': code, 'time_key': day, 'close': close})
+                    latest[(code, day)] = close
+    engine.dispose()
+    return latest
+
+
+def _indexes(engine) -> set:
+    with engine.connect() as conn:
+        return {row[0] for row in conn.execute(text(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'stocks'"
+        ))}
+
+
+def _rows(engine) -> list:
+    with engine.connect() as conn:
+        return conn.execute(text("SELECT id, code, time_key, close FROM stocks ORDER BY id")).fetchall()
+
+
+def test_migrate_old_database():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'old.db')
+        latest = _create_old_db(path)
+        engine = create_engine(f'sqlite:///{path}')
+        with engine.connect() as conn:
+            max_ids = {(code, day): max_id for code, day, max_id in conn.execute(text(
+                "SELECT code, time_key, MAX(id) FROM stocks GROUP BY code, time_key"))}
+        assert len(_rows(engine)) > len(latest)
+        assert get_schema_version(engine) == 0
+
+        assert migrate(engine) == SCHEMA_VERSION == 2
+        rows = _rows(engine)
+        assert len(rows) == len(latest) == len(CODES) * len(DAYS)
+        # 每组保留id最大（最后写入）的一条
+        assert {(code, day): row_id for row_id, code, day, _ in rows} == max_ids
+        assert {(code, day): close for _, code, day, close in rows} == latest
+
+        indexes = _indexes(engine)
+        assert 'uq_stocks_code_time_key' in indexes
+        assert 'ix_stocks_code' not in indexes
+        assert 'ix_stocks_time_key' in indexes
+        assert get_schema_version(engine) == 2
+        with engine.connect() as conn:
+            assert conn.execute(text("PRAGMA user_version")).scalar() == 2
+
+        # 重复执行不做任何变更
+        assert migrate(engine) == 2
+        assert _rows(engine) == rows
+        assert _indexes(engine) == indexes
+        engine.dispose()
+
+
+def test_dedupe_stocks_in_chunks():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'old.db')
+        latest = _create_old_db(path)
+        engine = create_engine(f'sqlite:///{path}')
+        total = len(_rows(engine))
+        # 每个事务只处理 2 只股票
+        assert dedupe_stocks(engine, chunk_size=2) == total - len(latest)
+        assert {(code, day): close for _, code, day, close in _rows(engine)} == latest
+        assert dedupe_stocks(engine, chunk_size=2) == 0
+        engine.dispose()
+
+
+def test_init_db_migrates_existing_file():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'old.db')
+        latest = _create_old_db(path)
+        db = DatabaseManager(path)
+        assert db.init_db()
+        engine = db.get_engine()
+        assert get_schema_version(engine) == SCHEMA_VERSION
+        assert len(_rows(engine)) == len(latest)
+        assert 'uq_stocks_code_time_key' in _indexes(engine)
+        engine.dispose()
+
+        # 新建的数据库直接是最新表结构
+        fresh = DatabaseManager(os.path.join(tmp_dir, 'new.db'))
+        assert fresh.init_db()
+        indexes = _indexes(fresh.get_engine())
+        assert 'uq_stocks_code_time_key' in indexes and 'ix_stocks_code' not in indexes
+        assert get_schema_version(fresh.get_engine()) == SCHEMA_VERSION
+        fresh.get_engine().dispose()
+
+
+def main():
+    for name, func in list(globals().items()):
+        if name.startswith('test_') and callable(func):
+            func()
+            print(f"{name}: 通过")
+
+
+if __name__ == "__main__":
+    main()
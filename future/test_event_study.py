@@ -0,0 +1,130 @@
+"""
+事件研究测试：远期收益按每只股票自己的交易日计算（停牌顺延）、掩码聚合与丢弃计数、缓存落盘与按数据版本复用
+
+运行: python test_event_study.py  或  pytest test_event_study.py
+"""
+
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from event_study import ForwardReturnCache, picks_to_signal_matrix
+
+KLINE_FILE = 'data/kline_data.parquet'
+
+
+def load_klines(n_codes: int = 4) -> pd.DataFrame:
+    df = pd.read_parquet(KLINE_FILE, columns=['code', 'time_key', 'high', 'low', 'close'])
+    df['time_key'] = pd.to_datetime(df['time_key'])
+    codes = sorted(df['code'].unique())[:n_codes]
+    return df[df['code'].isin(codes)].sort_values(['code', 'time_key']).reset_index(drop=True)
+
+
+def _expected_forward(g: pd.DataFrame, h: int):
+    """单只股票只含交易日的序列上的 h 日远期收益和 MFE/MAE"""
+    close, high, low = (g[c].to_numpy(dtype=float) for c in ('close', 'high', 'low'))
+    n = len(close)
+    ret, mfe, mae = np.full(n, np.nan), np.full(n, np.nan), np.full(n, np.nan)
+    for t in range(n - h):
+        ret[t] = close[t + h] / close[t] - 1
+        mfe[t] = np.nanmax(high[t + 1:t + h + 1]) / close[t] - 1
+        mae[t] = np.nanmin(low[t + 1:t + h + 1]) / close[t] - 1
+    return ret, mfe, mae
+
+
+def test_forward_returns_skip_suspension_days():
+    df = load_klines()
+    code = df['code'].iloc[0]
+    dates = sorted(df['time_key'].unique())
+    suspended = dates[100:105]
+    df = df[~((df['code'] == code) & df['time_key'].isin(suspended))].reset_index(drop=True)
+
+    cache = ForwardReturnCache.build(df, horizons=(1, 5))
+    for h in cache.horizons:
+        for c, g in df.groupby('code'):
+            g = g.reset_index(drop=True)
+            rows = cache.dates.get_indexer(g['time_key'])
+            col = cache.codes.get_loc(c)
+            ret, mfe, mae = _expected_forward(g, h)
+            np.testing.assert_allclose(cache.returns[h][rows, col], ret, rtol=1e-12, equal_nan=True)
+            np.testing.assert_allclose(cache.mfe[h][rows, col], mfe, rtol=1e-12, equal_nan=True)
+            np.testing.assert_allclose(cache.mae[h][rows, col], mae, rtol=1e-12, equal_nan=True)
+        # 停牌前最后一个交易日的事件顺延到复牌后，而不是被丢弃
+        before = cache.dates.get_loc(dates[99])
+        assert not np.isnan(cache.returns[h][before, cache.codes.get_loc(code)])
+        assert np.isnan(cache.returns[h][cache.dates.get_loc(suspended[0]), cache.codes.get_loc(code)])
+
+    # 等权基准：各日期有远期收益的股票的平均值
+    row = cache.dates.get_loc(dates[50])
+    fwd = cache.returns[5][row]
+    np.testing.assert_allclose(cache.excess[5][row], fwd - np.nanmean(fwd), rtol=1e-12)
+
+
+def test_evaluate_counts_dropped_events():
+    df = load_klines()
+    code = df['code'].iloc[0]
+    dates = sorted(df['time_key'].unique())
+    df = df[~((df['code'] == code) & df['time_key'].isin(dates[100:105]))].reset_index(drop=True)
+    cache = ForwardReturnCache.build(df, horizons=(1, 5))
+
+    # 一个正常事件、一个停牌日事件、一个距数据末尾不足 5 个交易日的事件
+    last = df.loc[df['code'] == code, 'time_key'].iloc[-2]
+    signals = picks_to_signal_matrix({dates[50]: [code], dates[102]: [code], last: [code]})
+    table = cache.evaluate(signals).set_index('horizon')
+    assert table.loc[1, 'events'] == 2 and table.loc[1, 'dropped'] == 1
+    assert table.loc[5, 'events'] == 1 and table.loc[5, 'dropped'] == 2
+
+    col, row = cache.codes.get_loc(code), cache.dates.get_loc(dates[50])
+    assert table.loc[5, 'mean_return'] == cache.returns[5][row, col]
+    assert table.loc[5, 'hit_rate'] == float(cache.returns[5][row, col] > 0)
+
+    empty = cache.evaluate(pd.DataFrame(False, index=cache.dates[:3], columns=cache.codes))
+    assert (empty['events'] == 0).all() and empty['mean_return'].isna().all()
+
+
+def test_save_load_round_trip():
+    cache = ForwardReturnCache.build(load_klines(), horizons=(1, 5, 10), benchmark=None, version='v1')
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cache_file = os.path.join(tmp_dir, 'sub', 'fwd.npz')
+        cache.save(cache_file)
+        loaded = ForwardReturnCache.load(cache_file, version='v1')
+    assert loaded.dates.equals(cache.dates)
+    assert list(loaded.codes) == list(cache.codes)
+    assert loaded.horizons == [1, 5, 10]
+    for h in cache.horizons:
+        for name in ('returns', 'excess', 'mfe', 'mae'):
+            np.testing.assert_array_equal(getattr(loaded, name)[h], getattr(cache, name)[h])
+
+
+def test_load_or_build_reuses_cache_per_version():
+    df = load_klines()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        kline_file = os.path.join(tmp_dir, 'kline.parquet')
+        cache_dir = os.path.join(tmp_dir, 'event_cache')
+        df.to_parquet(kline_file)
+        first = ForwardReturnCache.load_or_build(kline_file, cache_dir, horizons=(1, 5))
+        assert len(os.listdir(cache_dir)) == 1
+        again = ForwardReturnCache.load_or_build(kline_file, cache_dir, horizons=(1, 5))
+        assert again.version == first.version
+        np.testing.assert_array_equal(again.returns[5], first.returns[5])
+
+        # 数据更新后版本变化，重新构建
+        df[df['time_key'] < df['time_key'].max()].to_parquet(kline_file)
+        os.utime(kline_file, ns=(0, 0))
+        updated = ForwardReturnCache.load_or_build(kline_file, cache_dir, horizons=(1, 5))
+        assert updated.version != first.version
+        assert len(os.listdir(cache_dir)) == 2
+        assert len(updated.dates) == len(first.dates) - 1
+
+
+def main():
+    for name, func in list(globals().items()):
+        if name.startswith('test_') and callable(func):
+            func()
+            print(f"{name}: 通过")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+历史K线调度器的限频测试：在本地模拟网关上并发抓取全部夹具股票，请求不能超出网关配额
+
+运行: python test_hist_kline_scheduler.py  或  pytest test_hist_kline_scheduler.py
+"""
+
+import time
+
+import pandas as pd
+from futu import RET_OK
+
+from fake_opend import FakeOpenD
+from hist_kline_scheduler import HistKlineScheduler, SlidingWindowLimiter
+from quote_pool import QuoteContextPool
+
+KLINE_FILE = 'data/kline_data.parquet'
+# 缩短的配额窗口：每 QUOTA_WINDOW 秒最多 QUOTA 次，约束与真实网关相同，测试只需几秒
+QUOTA = 30
+QUOTA_WINDOW = 1.0
+
+
+def make_scheduler(server: FakeOpenD, quota: int = QUOTA, **kwargs) -> HistKlineScheduler:
+    pool = QuoteContextPool(max_size=4, context_factory=server.new_context)
+    limiter = SlidingWindowLimiter(quota, QUOTA_WINDOW, margin=0.1)
+    return HistKlineScheduler(pool=pool, limiter=limiter, backoff=0.05, progress=lambda *args: None, **kwargs)
+
+
+def test_limiter_never_exceeds_quota():
+    limiter = SlidingWindowLimiter(5, 0.2, margin=0.0)
+    stamps = []
+    for _ in range(16):
+        limiter.acquire()
+        stamps.append(time.monotonic())
+    for i in range(len(stamps) - 5):
+        assert stamps[i + 5] - stamps[i] >= 0.2, "窗口内放行次数超过配额"
+
+
+def test_fake_gateway_rejects_over_quota():
+    """不限频地连续请求时模拟网关按窗口拒绝，下面的零拒绝断言才有意义"""
+    server = FakeOpenD(KLINE_FILE, quotas={'request_history_kline': QUOTA}, quota_window=QUOTA_WINDOW)
+    ctx = server.new_context()
+    code = sorted(server.klines)[0]
+    rets = [ctx.request_history_kline(code, max_count=10)[0] for _ in range(QUOTA + 5)]
+    assert rets.count(RET_OK) == QUOTA and server.stats['quota_rejected'] == 5
+    time.sleep(QUOTA_WINDOW)
+    assert ctx.request_history_kline(code, max_count=10)[0] == RET_OK
+
+
+def test_scheduler_stays_within_quota():
+    """分页使请求数约为配额的 5 倍，全部股票抓取成功且没有一次被网关按配额拒绝"""
+    server = FakeOpenD(KLINE_FILE, latency=(0.0, 0.01), quotas={'request_history_kline': QUOTA},
+                       quota_window=QUOTA_WINDOW, seed=0)
+    scheduler = make_scheduler(server, page_size=500)
+    codes = sorted(server.klines)
+    result = dict(scheduler.run(codes, '2020-01-01', '2025-12-31'))
+
+    assert server.stats['request_history_kline'] > 4 * QUOTA
+    assert server.stats['quota_rejected'] == 0, f"被拒绝 {server.stats['quota_rejected']} 次"
+    assert scheduler.failed == {}
+    for code in codes:
+        expected = server.klines[code]
+        assert len(result[code]) == len(expected), code
+        assert (pd.to_datetime(result[code]['time_key']).to_numpy() == expected['time_key'].to_numpy()).all()
+    scheduler.pool.close()
+
+
+def test_scheduler_retries_injected_errors():
+    server = FakeOpenD(KLINE_FILE, quotas={'request_history_kline': QUOTA}, quota_window=QUOTA_WINDOW,
+                       error_rate=0.1, seed=1)
+    scheduler = make_scheduler(server, max_retries=5)
+    codes = sorted(server.klines)[:20]
+    result = dict(scheduler.run(codes, '2024-01-01', '2024-12-31'))
+    assert server.stats['injected_errors'] > 0
+    assert server.stats['quota_rejected'] == 0
+    assert scheduler.failed == {} and all(result[code] is not None for code in codes)
+    scheduler.pool.close()
+
+
+def test_scheduler_reconnects_when_gateway_drops_connections():
+    """每个连接只能请求 4 次：分页中途断线后换连接续抓，结果与夹具一致，没有重复或缺失"""
+    server = FakeOpenD(KLINE_FILE, quotas=None, disconnect_after=4, seed=0)
+    scheduler = make_scheduler(server, quota=1000, page_size=300)
+    codes = sorted(server.klines)
+    result = dict(scheduler.run(codes, '2020-01-01', '2025-12-31'))
+    assert scheduler.failed == {}
+    assert scheduler.pool.size <= scheduler.pool.max_size
+    for code in codes:
+        expected = server.klines[code]
+        assert (pd.to_datetime(result[code]['time_key']).to_numpy() == expected['time_key'].to_numpy()).all(), code
+    scheduler.pool.close()
+
+
+def main():
+    for name, func in list(globals().items()):
+        if name.startswith('test_') and callable(func):
+            func()
+            print(f"{name}: 通过")
+
+
+if __name__ == "__main__":
+    main()
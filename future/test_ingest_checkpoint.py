@@ -0,0 +1,97 @@
+"""
+断点续传测试：第一次抓取时网关随机出错，部分股票中途失败；重跑只抓未完成的股票并从水位线继续，
+最终暂存数据与夹具一致、没有重复
+
+运行: python test_ingest_checkpoint.py  或  pytest test_ingest_checkpoint.py
+"""
+
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from fake_opend import FakeOpenD
+from hist_kline_scheduler import HistKlineScheduler, SlidingWindowLimiter
+from ingest_checkpoint import IngestCheckpoint
+from parquet_sink import HIST_SCHEMA
+from quote_pool import QuoteContextPool
+
+KLINE_FILE = 'data/kline_data.parquet'
+START, END = '2023-01-01', '2025-12-31'
+
+
+def run_ingest(server: FakeOpenD, staging_dir: str, codes, max_retries: int):
+    """与 KlineFetcher.hist_kline_persistence 相同的流程：按检查点计划抓取，逐页落盘，成功后标记完成"""
+    checkpoint = IngestCheckpoint(staging_dir, {'start_date': START})
+    plan = checkpoint.plan(codes, START, END)
+
+    def on_page(code, data):
+        data = data.copy()
+        data['time_key'] = pd.to_datetime(data['time_key'].str[:10])
+        checkpoint.write_page(code, data)
+
+    pool = QuoteContextPool(max_size=4, context_factory=server.new_context)
+    scheduler = HistKlineScheduler(columns=HIST_SCHEMA.names, pool=pool, limiter=SlidingWindowLimiter(1000, 1.0),
+                                   max_retries=max_retries, backoff=0.01, page_size=100,
+                                   progress=lambda *args: None)
+    for code, _ in scheduler.run(list(plan), START, END, on_page=on_page, starts=plan):
+        if code not in scheduler.failed:
+            checkpoint.mark_done(code, END)
+    pool.close()
+    return checkpoint, plan, scheduler.failed
+
+
+def test_rerun_resumes_from_watermarks():
+    server = FakeOpenD(KLINE_FILE, quotas=None, error_rate=0.05, seed=3)
+    codes = sorted(server.klines)[:20]
+    with tempfile.TemporaryDirectory() as staging_dir:
+        checkpoint, plan, failed = run_ingest(server, staging_dir, codes, max_retries=0)
+        assert failed, "错误率下应有股票抓取失败"
+        assert set(plan) == set(codes)
+        first_requests = server.stats['request_history_kline']
+        # 失败前已写入部分分页的股票，重跑时从水位线的下一天开始
+        partial = {code: checkpoint.state(code)['watermark'] for code in failed if checkpoint.state(code)['watermark']}
+        assert partial, "应有股票在分页中途失败"
+
+        server.error_rate = 0.0
+        checkpoint, plan, failed = run_ingest(server, staging_dir, codes, max_retries=0)
+        assert failed == {}
+        assert set(plan) < set(codes), "已完成的股票不应重新抓取"
+        for code, watermark in partial.items():
+            assert plan[code] == (pd.Timestamp(watermark) + pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+        assert server.stats['request_history_kline'] - first_requests < first_requests
+
+        for code in codes:
+            bars = server.klines[code]
+            expected = bars[(bars['time_key'] >= START) & (bars['time_key'] <= END)]
+            actual = checkpoint.read_code(code)
+            assert len(actual) == len(expected), code
+            assert (actual['time_key'].to_numpy() == expected['time_key'].to_numpy()).all(), code
+            np.testing.assert_allclose(actual['close'].to_numpy(), expected['close'].to_numpy())
+
+        # 全部完成后再跑一次不发任何请求
+        requests = server.stats['request_history_kline']
+        _, plan, _ = run_ingest(server, staging_dir, codes, max_retries=0)
+        assert plan == {} and server.stats['request_history_kline'] == requests
+
+
+def test_changed_params_discard_staging():
+    server = FakeOpenD(KLINE_FILE, quotas=None)
+    codes = sorted(server.klines)[:2]
+    with tempfile.TemporaryDirectory() as staging_dir:
+        checkpoint, _, _ = run_ingest(server, staging_dir, codes, max_retries=0)
+        assert checkpoint.state(codes[0])['through'] == END
+        checkpoint = IngestCheckpoint(staging_dir, {'start_date': '2024-01-01'})
+        assert checkpoint.state(codes[0])['through'] is None
+        assert checkpoint.read_code(codes[0]) is None
+
+
+def main():
+    for name, func in list(globals().items()):
+        if name.startswith('test_') and callable(func):
+            func()
+            print(f"{name}: 通过")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+周线/月线物化测试：重叠追加、历史修正和小文件合并之后，增量物化的结果与全量重建一致，且只重算变化的周期
+
+运行: python test_kline_bars.py  或  pytest test_kline_bars.py
+"""
+
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from kline_bars import materialize_bars, resample_bars
+from kline_dataset import KlineDataset, append_daily, compact_partitions, write_dataset
+
+KLINE_FILE = 'data/kline_data.parquet'
+
+
+def load_klines(n_codes: int = 6) -> pd.DataFrame:
+    df = pd.read_parquet(KLINE_FILE)
+    df['time_key'] = pd.to_datetime(df['time_key'])
+    codes = sorted(df['code'].unique())[:n_codes]
+    return df[df['code'].isin(codes)].sort_values(['code', 'time_key']).reset_index(drop=True)
+
+
+def _assert_matches_rebuild(daily_dir: str, bars_dir: str, freq: str):
+    expected = resample_bars(KlineDataset(daily_dir).read(), freq).reset_index(drop=True)
+    actual = KlineDataset(bars_dir).read()
+    assert len(actual) == len(expected), f"{freq} 行数不一致: {len(actual)} != {len(expected)}"
+    assert (actual['code'].to_numpy() == expected['code'].to_numpy()).all()
+    assert (actual['time_key'].to_numpy() == expected['time_key'].to_numpy()).all()
+    for col in ('open', 'close', 'high', 'low', 'volume', 'change_rate'):
+        np.testing.assert_allclose(actual[col].to_numpy(dtype=float), expected[col].to_numpy(dtype=float),
+                                   equal_nan=True, err_msg=f'{freq} {col}')
+
+
+def test_overlapping_appends_stay_incremental():
+    """每次从最新日期（含）开始重新抓取，重复的K线不触发全量重建"""
+    df = load_klines()
+    dates = sorted(df['time_key'].unique())
+    n_codes = df['code'].nunique()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        daily_dir = os.path.join(tmp_dir, 'daily')
+        write_dataset(df[df['time_key'] < dates[-10]], daily_dir)
+        for freq in ('week', 'month'):
+            assert materialize_bars(daily_dir, freq) > n_codes * 10
+        for prev, day in zip(dates[-11:-1], dates[-10:]):
+            append_daily(df[df['time_key'].isin([prev, day])], daily_dir)
+            for freq in ('week', 'month'):
+                # 只重算上一交易日所在的一到两个周期
+                assert 0 < materialize_bars(daily_dir, freq) <= n_codes * 2
+                _assert_matches_rebuild(daily_dir, f'{daily_dir}_{freq}', freq)
+        assert materialize_bars(daily_dir, 'week') == 0
+
+
+def test_history_correction_after_compaction():
+    """合并小文件不触发重算；合并之后对历史K线的修正（行数不变）被发现并重算"""
+    df = load_klines()
+    dates = sorted(df['time_key'].unique())
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        daily_dir = os.path.join(tmp_dir, 'daily')
+        write_dataset(df[df['time_key'] < dates[-5]], daily_dir)
+        for day in dates[-5:]:
+            append_daily(df[df['time_key'] == day], daily_dir)
+        for freq in ('week', 'month'):
+            materialize_bars(daily_dir, freq)
+
+        assert compact_partitions(daily_dir, min_files=2) > 0
+        for freq in ('week', 'month'):
+            assert materialize_bars(daily_dir, freq) == 0
+
+        # 一年前的一周收盘价修正（复权）
+        old = df[(df['time_key'] >= dates[-250]) & (df['time_key'] < dates[-245])]
+        append_daily(old.assign(close=old['close'] * 1.1), daily_dir)
+        compact_partitions(daily_dir, min_files=2)
+        for freq in ('week', 'month'):
+            rows = materialize_bars(daily_dir, freq)
+            assert 0 < rows < len(resample_bars(df, freq))
+            _assert_matches_rebuild(daily_dir, f'{daily_dir}_{freq}', freq)
+
+
+def main():
+    for name, func in list(globals().items()):
+        if name.startswith('test_') and callable(func):
+            func()
+            print(f"{name}: 通过")
+
+
+if __name__ == "__main__":
+    main()
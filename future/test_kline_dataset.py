@@ -0,0 +1,141 @@
+"""
+分区K线数据集的增量写入测试：重复写入以最后一次为准，后台合并与追加、读取并发时不丢数据、不报错
+
+运行: python test_kline_dataset.py  或  pytest test_kline_dataset.py
+"""
+
+import multiprocessing
+import os
+import tempfile
+import threading
+
+import numpy as np
+import pandas as pd
+
+from kline_dataset import KlineDataset, append_daily, compact_partitions, write_dataset
+
+KLINE_FILE = 'data/kline_data.parquet'
+
+
+def load_klines(n_codes: int = 6) -> pd.DataFrame:
+    df = pd.read_parquet(KLINE_FILE)
+    df['time_key'] = pd.to_datetime(df['time_key'])
+    codes = sorted(df['code'].unique())[:n_codes]
+    return df[df['code'].isin(codes)].sort_values(['code', 'time_key']).reset_index(drop=True)
+
+
+def _assert_same(actual: pd.DataFrame, expected: pd.DataFrame):
+    expected = expected.sort_values(['code', 'time_key']).reset_index(drop=True)
+    assert len(actual) == len(expected), f"行数不一致: {len(actual)} != {len(expected)}"
+    assert (actual['code'].to_numpy() == expected['code'].to_numpy()).all()
+    assert (actual['time_key'].to_numpy() == expected['time_key'].to_numpy()).all()
+    np.testing.assert_allclose(actual['close'].to_numpy(), expected['close'].to_numpy())
+
+
+def test_append_is_upsert():
+    """已存在的K线被重新写入时，读取和合并后都以最后一次写入为准"""
+    df = load_klines()
+    history, last = df[df['time_key'] < '2025-01-01'], df[df['time_key'] >= '2025-01-01']
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        dataset_dir = os.path.join(tmp_dir, 'dataset')
+        write_dataset(history, dataset_dir)
+        assert append_daily(last, dataset_dir) == len(last)
+
+        # 修正历史K线两次（复权），第二次为准
+        fixed = history.groupby('code').tail(5).copy()
+        for delta in (1.0, 2.0):
+            corrected = fixed.assign(close=fixed['close'] + delta)
+            assert append_daily(corrected, dataset_dir) == len(corrected)
+        expected = df.copy()
+        expected.loc[fixed.index, 'close'] += 2.0
+
+        _assert_same(KlineDataset(dataset_dir).read(columns=['code', 'time_key', 'close']), expected)
+        # 重跑同一批次结果不变
+        append_daily(corrected, dataset_dir)
+        _assert_same(KlineDataset(dataset_dir).read(columns=['code', 'time_key', 'close']), expected)
+
+        assert compact_partitions(dataset_dir, min_files=2) > 0
+        _assert_same(KlineDataset(dataset_dir).read(columns=['code', 'time_key', 'close']), expected)
+
+
+def test_compaction_concurrent_with_appends_and_reads():
+    """追加、合并、读取三个线程同时运行：读取不报错，最终数据完整"""
+    df = load_klines()
+    dates = sorted(df['time_key'].unique())
+    split = dates[-60]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        dataset_dir = os.path.join(tmp_dir, 'dataset')
+        write_dataset(df[df['time_key'] < split], dataset_dir)
+        errors, done = [], threading.Event()
+
+        def appender():
+            for day in dates[-60:]:
+                append_daily(df[df['time_key'] == day], dataset_dir)
+            done.set()
+
+        def compactor():
+            while not done.is_set():
+                compact_partitions(dataset_dir, min_files=2)
+
+        def reader():
+            dataset = KlineDataset(dataset_dir)
+            while not done.is_set():
+                try:
+                    dataset.read(columns=['code', 'time_key', 'close'])
+                except Exception as e:
+                    errors.append(e)
+                    return
+
+        threads = [threading.Thread(target=f) for f in (appender, compactor, reader)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        assert not errors, f"读取出错: {errors[0]!r}"
+        compact_partitions(dataset_dir, min_files=2)
+        _assert_same(KlineDataset(dataset_dir).read(columns=['code', 'time_key', 'close']), df)
+
+
+def _append_days(dataset_dir: str, days: list, df: pd.DataFrame):
+    for day in days:
+        append_daily(df[df['time_key'] == day], dataset_dir)
+
+
+def _compact_until(dataset_dir: str, stop):
+    while not stop.is_set():
+        compact_partitions(dataset_dir, min_files=2)
+
+
+def test_compaction_across_processes():
+    """两个进程同时合并、另一个进程追加：文件锁跨进程互斥，合并不会重复处理或删除别人的文件"""
+    df = load_klines()
+    dates = sorted(df['time_key'].unique())
+    ctx = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        dataset_dir = os.path.join(tmp_dir, 'dataset')
+        write_dataset(df[df['time_key'] < dates[-30]], dataset_dir)
+        stop = ctx.Event()
+        appender = ctx.Process(target=_append_days, args=(dataset_dir, dates[-30:], df))
+        compactors = [ctx.Process(target=_compact_until, args=(dataset_dir, stop)) for _ in range(2)]
+        for p in compactors + [appender]:
+            p.start()
+        appender.join()
+        stop.set()
+        for p in compactors:
+            p.join()
+
+        assert appender.exitcode == 0
+        assert [p.exitcode for p in compactors] == [0, 0], "合并进程出错退出"
+        _assert_same(KlineDataset(dataset_dir).read(columns=['code', 'time_key', 'close']), df)
+
+
+def main():
+    for name, func in list(globals().items()):
+        if name.startswith('test_') and callable(func):
+            func()
+            print(f"{name}: 通过")
+
+
+if __name__ == "__main__":
+    main()
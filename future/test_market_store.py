@@ -0,0 +1,208 @@
+"""
+共享行情库增量发布测试：每日追加只写增量文件、全量文件硬链接共享、读取以最后写入为准、旧版本被清理、
+多个进程同时发布互不干扰、读者不发布
+
+运行: python test_market_store.py  或  pytest test_market_store.py
+"""
+
+import multiprocessing
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from kline_dataset import append_daily, dataset_version, write_dataset
+from market_store import (
+    CURRENT_FILE,
+    DATA_FILE,
+    MarketStore,
+    publish,
+    publish_append,
+    publish_source,
+    publish_source_append,
+    read_klines,
+)
+
+KLINE_FILE = 'data/kline_data.parquet'
+
+
+def load_klines(n_codes: int = 8) -> pd.DataFrame:
+    df = pd.read_parquet(KLINE_FILE)
+    df['time_key'] = pd.to_datetime(df['time_key'])
+    codes = sorted(df['code'].unique())[:n_codes]
+    return df[df['code'].isin(codes)].sort_values(['code', 'time_key']).reset_index(drop=True)
+
+
+def _current_dir(store_dir: str) -> str:
+    with open(os.path.join(store_dir, CURRENT_FILE), 'r', encoding='utf-8') as f:
+        return os.path.join(store_dir, f.read().strip())
+
+
+def _assert_same(actual: pd.DataFrame, expected: pd.DataFrame):
+    expected = expected.sort_values(['code', 'time_key']).reset_index(drop=True)
+    assert len(actual) == len(expected), f"行数不一致: {len(actual)} != {len(expected)}"
+    assert (actual['code'].to_numpy() == expected['code'].to_numpy()).all()
+    assert (actual['time_key'].to_numpy() == expected['time_key'].to_numpy()).all()
+    np.testing.assert_allclose(actual['close'].to_numpy(), expected['close'].to_numpy())
+
+
+def test_append_writes_only_new_rows():
+    df = load_klines()
+    dates = sorted(df['time_key'].unique())
+    base = df[df['time_key'] < dates[-3]]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store_dir = os.path.join(tmp_dir, 'store')
+        publish(base, store_dir)
+        base_inode = os.stat(os.path.join(_current_dir(store_dir), DATA_FILE)).st_ino
+        expected = base
+        for day in dates[-3:]:
+            daily = df[df['time_key'] == day]
+            # 同时修正前一天的收盘价，验证以后写入的为准
+            fixed = expected[expected['time_key'] == expected['time_key'].max()].assign(close=lambda x: x['close'] + 1)
+            batch = pd.concat([fixed, daily])
+            publish_append(batch, store_dir)
+            expected = pd.concat([expected, batch]).drop_duplicates(['code', 'time_key'], keep='last')
+
+            version_dir = _current_dir(store_dir)
+            # 全量文件在各版本间共享，不复制
+            assert os.stat(os.path.join(version_dir, DATA_FILE)).st_ino == base_inode
+            delta_sizes = [os.path.getsize(os.path.join(version_dir, f)) for f in os.listdir(version_dir)
+                           if f.startswith('delta-')]
+            assert max(delta_sizes) < os.path.getsize(os.path.join(version_dir, DATA_FILE)) / 50
+
+        store = MarketStore(store_dir)
+        assert len(store.meta['deltas']) == 3
+        _assert_same(store.read(), expected)
+        code = expected['code'].iloc[0]
+        subset = expected[(expected['code'] == code) & (expected['time_key'] >= dates[-10])]
+        _assert_same(store.read(code, dates[-10], columns=['code', 'time_key', 'close']), subset)
+        arrays = store.get_arrays(code, dates[-10])
+        assert (arrays['time_key'] == subset['time_key'].to_numpy('datetime64[ns]').view(np.int64)).all()
+        np.testing.assert_allclose(arrays['close'], subset['close'].to_numpy())
+        # 只在全量文件中有数据的区间返回映射视图
+        assert store.get_arrays(code, dates[0], dates[10])['close'].base is not None
+
+
+def test_deltas_consolidated_and_old_versions_removed():
+    df = load_klines()
+    dates = sorted(df['time_key'].unique())
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store_dir = os.path.join(tmp_dir, 'store')
+        publish(df[df['time_key'] < dates[-5]], store_dir)
+        # 本进程中断的发布留下的临时目录被清理；仍在运行的其他进程的临时目录不属于本进程，保留
+        own_tmp = f'v000099.{os.getpid()}-0a1b.tmp'
+        other_tmp = f'v000100.{os.getppid()}-0a1b.tmp'
+        os.makedirs(os.path.join(store_dir, own_tmp))
+        os.makedirs(os.path.join(store_dir, other_tmp))
+        for day in dates[-5:]:
+            publish_append(df[df['time_key'] == day], store_dir, keep=1, max_deltas=3)
+        store = MarketStore(store_dir)
+        # 第 4 次追加时合并为全量版本，之后再追加一次
+        assert len(store.meta['deltas']) == 1
+        _assert_same(store.read(), df)
+        names = sorted(name for name in os.listdir(store_dir) if not name.startswith('.'))
+        assert names == [CURRENT_FILE, 'v000005', 'v000006', other_tmp]
+
+
+def test_source_append_falls_back_when_store_is_stale():
+    df = load_klines()
+    dates = sorted(df['time_key'].unique())
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        dataset_dir = os.path.join(tmp_dir, 'dataset')
+        store_dir = os.path.join(tmp_dir, 'store')
+        write_dataset(df[df['time_key'] < dates[-2]], dataset_dir)
+        # 尚未发布时全量发布数据源
+        publish_source_append(dataset_dir, df.iloc[:0], None, store_dir)
+        _assert_same(MarketStore(store_dir).read(), df[df['time_key'] < dates[-2]])
+
+        # 正常的每日追加只写增量文件
+        day1, day2 = df[df['time_key'] == dates[-2]], df[df['time_key'] == dates[-1]]
+        previous = dataset_version(dataset_dir)
+        append_daily(day1, dataset_dir)
+        publish_source_append(dataset_dir, day1, previous, store_dir)
+        assert len(MarketStore(store_dir).meta['deltas']) == 1
+
+        # 漏发布一次修正：追加前的版本与已发布版本不一致，改为全量发布
+        fixed = day1.assign(close=day1['close'] + 1)
+        append_daily(fixed, dataset_dir)
+        previous = dataset_version(dataset_dir)
+        append_daily(day2, dataset_dir)
+        publish_source_append(dataset_dir, day2, previous, store_dir)
+        store = MarketStore(store_dir)
+        assert store.meta['deltas'] == [] and store.meta['source_version'] == dataset_version(dataset_dir)
+        _assert_same(store.read(), pd.concat([df[df['time_key'] < dates[-2]], fixed, day2]))
+
+
+def _publish_days(store_dir: str, days: list, df: pd.DataFrame, full: bool, barrier):
+    barrier.wait()
+    for day in days:
+        batch = df[df['time_key'] == day]
+        if full:
+            publish(pd.concat([df[df['time_key'] < days[0]], batch]), store_dir, keep=1)
+        else:
+            publish_append(batch, store_dir, keep=1)
+
+
+def test_concurrent_publishers():
+    """四个进程同时发布（增量和全量混合）：发布锁使版本号不冲突、临时文件互不删除，最终版本完整可读"""
+    df = load_klines()
+    dates = sorted(df['time_key'].unique())
+    ctx = multiprocessing.get_context('spawn')
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store_dir = os.path.join(tmp_dir, 'store')
+        publish(df[df['time_key'] < dates[-40]], store_dir)
+        groups = [dates[-40:][i::4] for i in range(4)]
+        barrier = ctx.Barrier(4)
+        procs = [ctx.Process(target=_publish_days, args=(store_dir, days, df, i == 0, barrier))
+                 for i, days in enumerate(groups)]
+        for p in procs:
+            p.start()
+        for p in procs:
+            p.join()
+        assert [p.exitcode for p in procs] == [0] * 4, "发布进程出错退出"
+
+        store = MarketStore(store_dir)
+        assert store.version == 41
+        assert not [name for name in os.listdir(store_dir) if name.endswith('.tmp')]
+        # 全量发布的进程只带入自己的日期，最终数据随最后一次发布而定；每个版本本身完整可读
+        data = store.read()
+        assert not data.duplicated(['code', 'time_key']).any()
+        assert data['time_key'].min() == df['time_key'].min()
+
+
+def test_readers_do_not_publish():
+    df = load_klines()
+    dates = sorted(df['time_key'].unique())
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        source = os.path.join(tmp_dir, 'kline_data.parquet')
+        store_dir = os.path.join(tmp_dir, 'store')
+        df[df['time_key'] < dates[-1]].to_parquet(source)
+        code = df['code'].iloc[0]
+
+        # 尚未发布：直接读取数据源，不创建行情库
+        assert MarketStore.open_current(source, store_dir) is None
+        expected = df[(df['code'] == code) & (df['time_key'] >= dates[-20]) & (df['time_key'] < dates[-1])]
+        _assert_same(read_klines(source, code, dates[-20], columns=['code', 'time_key', 'close'],
+                                 store_dir=store_dir), expected)
+        assert not os.path.exists(store_dir)
+
+        publish_source(source, store_dir)
+        assert MarketStore.open_current(source, store_dir) is not None
+        # 数据源更新后行情库落后，读者读取数据源的新数据
+        df.to_parquet(source)
+        os.utime(source, ns=(os.stat(source).st_atime_ns, os.stat(source).st_mtime_ns + 1))
+        assert MarketStore.open_current(source, store_dir) is None
+        _assert_same(read_klines(source, store_dir=store_dir), df)
+        assert MarketStore(store_dir).version == 1
+
+
+def main():
+    for name, func in list(globals().items()):
+        if name.startswith('test_') and callable(func):
+            func()
+            print(f"{name}: 通过")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+分钟K线存储测试：tick 编码往返、重复写入去重、按月分区裁剪、结束日期整天包含、小时线/日线重采样
+
+运行: python test_minute_store.py  或  pytest test_minute_store.py
+"""
+
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from minute_store import PRICE_SCALE, MinuteStore, encode_prices
+
+CODES = ['SH.600000', 'SZ.000001']
+DAYS = ['2024-05-30', '2024-05-31', '2024-06-03']
+
+
+def _session_minutes(day: str) -> pd.DatetimeIndex:
+    """A股一个交易日的 240 根分钟K线时间（分钟K线的时间为区间结束时刻）"""
+    day = pd.Timestamp(day)
+    morning = pd.date_range(day + pd.Timedelta('9h31min'), day + pd.Timedelta('11h30min'), freq='1min')
+    afternoon = pd.date_range(day + pd.Timedelta('13h01min'), day + pd.Timedelta('15h'), freq='1min')
+    return morning.append(afternoon)
+
+
+def make_minutes(codes=CODES, days=DAYS, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    frames = []
+    for i, code in enumerate(codes):
+        times = pd.DatetimeIndex(np.concatenate([_session_minutes(d).values for d in days]))
+        # 价格在 0.01 网格上，tick 编码无损
+        close = np.round(10.0 + i + np.cumsum(rng.integers(-3, 4, len(times))) * 0.01, 2)
+        open_ = np.round(close + rng.integers(-2, 3, len(times)) * 0.01, 2)
+        frames.append(pd.DataFrame({
+            'code': code,
+            'time_key': times,
+            'open': open_,
+            'close': close,
+            'high': np.maximum(open_, close) + 0.01,
+            'low': np.minimum(open_, close) - 0.01,
+            'volume': rng.integers(100, 10000, len(times)),
+            'turnover': rng.integers(1000, 100000, len(times)).astype(float),
+        }))
+    return pd.concat(frames, ignore_index=True)
+
+
+def test_write_read_round_trip():
+    df = make_minutes()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = MinuteStore(tmp_dir)
+        assert store.write(df) == len(df)
+        assert store.codes() == CODES
+        out = store.read()
+    assert len(out) == len(df)
+    np.testing.assert_array_equal(out['time_key'].to_numpy(), df['time_key'].to_numpy())
+    for col in ('open', 'close', 'high', 'low'):
+        np.testing.assert_allclose(out[col].to_numpy(), df[col].to_numpy(), atol=0.5 / PRICE_SCALE)
+    np.testing.assert_array_equal(out['volume'].to_numpy(), df['volume'].to_numpy())
+    np.testing.assert_array_equal(out['turnover'].to_numpy(), df['turnover'].to_numpy())
+
+
+def test_rewrite_dedupes_and_keeps_latest():
+    df = make_minutes()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = MinuteStore(tmp_dir)
+        store.write(df)
+        # 重新抓取最后一天，并修正其中一根K线
+        last_day = df[df['time_key'] >= pd.Timestamp(DAYS[-1])].copy()
+        fixed = last_day.index[10]
+        last_day.loc[fixed, 'close'] = 99.99
+        store.write(last_day)
+        out = store.read()
+        assert len(out) == len(df)
+        assert not out.duplicated(['code', 'time_key']).any()
+        row = out[(out['code'] == df.loc[fixed, 'code']) & (out['time_key'] == df.loc[fixed, 'time_key'])]
+        assert row['close'].iloc[0] == 99.99
+        # 临时文件不残留
+        leftovers = [name for _, _, files in os.walk(tmp_dir) for name in files if name.endswith('.tmp')]
+        assert leftovers == []
+
+
+def test_month_pruning_and_inclusive_end():
+    df = make_minutes()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = MinuteStore(tmp_dir)
+        store.write(df)
+        # 破坏 6 月的文件：只读 5 月时分区裁剪不会打开它
+        for code in CODES:
+            with open(store._path(code, 202406), 'wb') as f:
+                f.write(b'not a parquet file')
+        may = store.read(CODES[0], '2024-05-01', '2024-05-31')
+        # 只给日期时 end 当天整天包含在内
+        expected = df[(df['code'] == CODES[0]) & (df['time_key'] < pd.Timestamp('2024-06-01'))]
+        assert len(may) == len(expected) == 480
+        assert may['time_key'].max() == pd.Timestamp('2024-05-31 15:00')
+
+        one_day = store.read(CODES, '2024-05-31', '2024-05-31')
+        assert len(one_day) == 2 * 240
+        # 带时刻的 end 按时刻截止（含）
+        morning = store.read(CODES[1], '2024-05-31', '2024-05-31 11:30')
+        assert len(morning) == 120 and morning['time_key'].max() == pd.Timestamp('2024-05-31 11:30')
+        assert store.read('SH.999999', '2024-05-01', '2024-05-31').empty
+
+
+def test_resample_hour_and_day():
+    df = make_minutes()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = MinuteStore(tmp_dir)
+        store.write(df)
+        hourly = store.resample(CODES, '2024-05-30', '2024-05-30', rule='hour')
+        daily = store.resample(CODES, rule='day')
+
+    times = ['10:30', '11:30', '13:30', '14:30', '15:00']
+    for code in CODES:
+        bars = hourly[hourly['code'] == code].reset_index(drop=True)
+        assert list(bars['time_key'].dt.strftime('%H:%M')) == times
+        src = df[(df['code'] == code) & (df['time_key'].dt.normalize() == pd.Timestamp(DAYS[0]))]
+        first = src[src['time_key'] <= pd.Timestamp(f'{DAYS[0]} 10:30')]
+        assert len(first) == 60
+        assert np.isclose(bars.loc[0, 'open'], first['open'].iloc[0])
+        assert np.isclose(bars.loc[0, 'close'], first['close'].iloc[-1])
+        assert np.isclose(bars.loc[0, 'high'], first['high'].max())
+        assert np.isclose(bars.loc[0, 'low'], first['low'].min())
+        assert bars['volume'].sum() == src['volume'].sum()
+        # 最后一根只含 14:31-15:00 的 30 分钟
+        assert bars.loc[4, 'volume'] == src[src['time_key'] > pd.Timestamp(f'{DAYS[0]} 14:30')]['volume'].sum()
+
+    assert len(daily) == len(CODES) * len(DAYS)
+    assert (daily['time_key'] == daily['time_key'].dt.normalize()).all()
+    for (code, day), bar in daily.set_index(['code', 'time_key']).iterrows():
+        src = df[(df['code'] == code) & (df['time_key'].dt.normalize() == day)]
+        assert np.isclose(bar['open'], src['open'].iloc[0]) and np.isclose(bar['close'], src['close'].iloc[-1])
+        assert bar['volume'] == src['volume'].sum()
+
+
+def test_encode_prices_rejects_nan_and_overflow():
+    np.testing.assert_array_equal(encode_prices(pd.Series([1.234, 0.0006, 10.0])), [1234, 1, 10000])
+    for bad in ([1.0, np.nan], [np.iinfo(np.int32).max / PRICE_SCALE + 1.0]):
+        try:
+            encode_prices(pd.Series(bad))
+        except ValueError:
+            continue
+        raise AssertionError(f"{bad} 应抛出 ValueError")
+
+
+def main():
+    for name, func in list(globals().items()):
+        if name.startswith('test_') and callable(func):
+            func()
+            print(f"{name}: 通过")
+
+
+if __name__ == "__main__":
+    main()
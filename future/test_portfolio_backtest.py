@@ -0,0 +1,143 @@
+"""
+组合回测测试：停牌日不影响BBI离场、信号矩阵缓存只补缺失日期、模拟器次日开盘成交
+
+运行: python test_portfolio_backtest.py  或  pytest test_portfolio_backtest.py
+"""
+
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from compact_panel import PricePanel
+from portfolio_backtest import PortfolioSimulator, bbi_exit_signals, compute_bbi_panel, load_or_build_signal_matrix, signal_cache_file
+from Selector import compute_bbi
+
+KLINE_FILE = 'data/kline_data.parquet'
+
+
+def load_klines(n_codes: int = 4) -> pd.DataFrame:
+    df = pd.read_parquet(KLINE_FILE, columns=['code', 'time_key', 'open', 'close'])
+    df['time_key'] = pd.to_datetime(df['time_key'])
+    codes = sorted(df['code'].unique())[:n_codes]
+    return df[df['code'].isin(codes)].sort_values(['code', 'time_key']).reset_index(drop=True)
+
+
+class CountingSelector:
+    """收盘价高于开盘价的股票入选，记录被调用的日期"""
+
+    def __init__(self):
+        self.calls = []
+
+    def select(self, date, data):
+        self.calls.append(date)
+        picks = []
+        for code, g in data.items():
+            row = g[g['date'] == date]
+            if not row.empty and row['close'].iloc[0] > row['open'].iloc[0]:
+                picks.append(code)
+        return picks
+
+
+def test_bbi_skips_suspension_days():
+    """停牌日为 NaN，复牌后的BBI与只含交易日的单只股票序列（SuperB1Strategy 的算法）一致"""
+    df = load_klines()
+    code = df['code'].iloc[0]
+    dates = sorted(df['time_key'].unique())
+    # 停牌 5 天
+    suspended = df[(df['code'] == code) & df['time_key'].isin(dates[100:105])].index
+    df = df.drop(suspended)
+    panel = PricePanel.from_long(df, columns=['open', 'close'])
+    close = panel.frame('close')
+
+    result = compute_bbi_panel(close, panel.valid)
+    assert result[code].loc[dates[100:105]].isna().all()
+    for c, g in df.groupby('code'):
+        g = g.reset_index(drop=True)
+        expected = compute_bbi(g.rename(columns={'time_key': 'date'})).to_numpy()
+        np.testing.assert_allclose(result[c].loc[g['time_key']].to_numpy(), expected, rtol=1e-12, equal_nan=True)
+    # 复牌后立即可以产生离场信号，而不是在 24 天内都没有BBI
+    resumed = df.loc[(df['code'] == code) & (df['time_key'] >= dates[105]), 'time_key'][:24]
+    assert result[code].loc[resumed].notna().all()
+    exits = bbi_exit_signals(close, panel.valid)
+    assert not exits[code].loc[dates[100:105]].any()
+
+
+def test_signal_cache_only_builds_missing_dates():
+    df = load_klines()
+    data = {code: g.rename(columns={'time_key': 'date'}).reset_index(drop=True) for code, g in df.groupby('code')}
+    dates = pd.DatetimeIndex(sorted(df['time_key'].unique()))
+    first, second = dates[-60:-30], dates[-40:]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cache_file = os.path.join(tmp_dir, 'signals.parquet')
+        selector = CountingSelector()
+        a = load_or_build_signal_matrix(selector, data, first, cache_file, processes=1)
+        assert len(selector.calls) == len(first)
+
+        # 第二个区间只为缓存中没有的日期选股
+        selector.calls.clear()
+        b = load_or_build_signal_matrix(selector, data, second, cache_file, processes=1)
+        assert pd.DatetimeIndex(selector.calls).equals(second.difference(first))
+
+        # 交替回到第一个区间，两个区间都在缓存中，不再选股
+        selector.calls.clear()
+        again = load_or_build_signal_matrix(selector, data, first, cache_file, processes=1)
+        assert selector.calls == []
+        assert again.equals(a)
+        assert load_or_build_signal_matrix(selector, data, second, cache_file, processes=1).equals(b)
+        assert selector.calls == []
+
+        fresh = load_or_build_signal_matrix(CountingSelector(), data, second, None, processes=1)
+        assert b.equals(fresh)
+        assert b.to_numpy().any()
+
+
+def test_signal_cache_key_includes_price_dtype():
+    selector = CountingSelector()
+    files = {signal_cache_file('cache', 'v1', selector, dtype) for dtype in ('float64', 'float32', 'int32')}
+    assert len(files) == 3
+    assert signal_cache_file('cache', 'v1', selector) == signal_cache_file('cache', 'v1', selector, 'float64')
+    assert signal_cache_file(None, 'v1', selector, 'float32') is None
+
+
+def test_simulator_fills_at_next_open():
+    dates = pd.date_range('2024-01-01', periods=6, freq='B')
+    open_ = pd.DataFrame({'A': [10.0, 11.0, 12.0, 13.0, 14.0, 15.0]}, index=dates)
+    close = pd.DataFrame({'A': [10.5, 11.5, 12.5, 13.5, 14.5, 15.5]}, index=dates)
+    signals = pd.DataFrame({'A': [True, False, False, False, False, False]}, index=dates)
+    exits = pd.DataFrame({'A': [False, False, True, False, False, False]}, index=dates)
+
+    result = PortfolioSimulator(initial_cash=10000, max_positions=1, max_weight=1.0, commission=0.0).run(
+        signals, open_, close, exit_signals=exits)
+    trade = result['trades'].iloc[0]
+    # T 日收盘的信号在 T+1 日开盘成交
+    assert trade['entry_date'] == dates[1] and trade['entry_price'] == 11.0
+    assert trade['exit_date'] == dates[3] and trade['exit_price'] == 13.0
+    assert trade['size'] == 900 and trade['pnl'] == 900 * 2.0
+    assert result['equity'].iloc[-1] == 10000 + 900 * 2.0
+
+
+def test_simulator_defers_fill_over_suspension():
+    dates = pd.date_range('2024-01-01', periods=5, freq='B')
+    open_ = pd.DataFrame({'A': [10.0, np.nan, 12.0, 13.0, 14.0]}, index=dates)
+    close = pd.DataFrame({'A': [10.0, np.nan, 12.0, 13.0, 14.0]}, index=dates)
+    signals = pd.DataFrame({'A': [True, True, False, False, False]}, index=dates)
+    exits = pd.DataFrame(False, index=dates, columns=['A'])
+    result = PortfolioSimulator(initial_cash=10000, max_positions=1, max_weight=1.0, commission=0.0).run(
+        signals, open_, close, exit_signals=exits)
+    assert result['trades'].empty
+    # 停牌日开盘价缺失不成交，次日信号仍有效，在复牌日开盘买入
+    assert result['equity'].iloc[1] == 10000
+    assert result['equity'].iloc[-1] == 10000 + 800 * (14.0 - 12.0)
+
+
+def main():
+    for name, func in list(globals().items()):
+        if name.startswith('test_') and callable(func):
+            func()
+            print(f"{name}: 通过")
+
+
+if __name__ == "__main__":
+    main()
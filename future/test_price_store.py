@@ -0,0 +1,247 @@
+"""
+价格存储接口的一致性测试：同一组测试分别在 SQLite 和 DuckDB/parquet 两个实现上运行
+
+运行: python test_price_store.py  或  pytest test_price_store.py
+"""
+
+import os
+import tempfile
+import threading
+
+import duckdb
+import numpy as np
+import pandas as pd
+import pytest
+
+from kline_dataset import DATASET_DIR, append_daily, compact_partitions
+from price_store import KLINE_STORE_DIR, PRICE_STORE_BACKENDS, DuckDBPriceStore, PriceStore, SQLitePriceStore
+
+KLINE_FILE = 'data/kline_data.parquet'
+VALUE_COLUMNS = ['open', 'close', 'high', 'low', 'pe_ratio', 'volume', 'turnover_rate', 'turnover', 'change_rate']
+
+
+def make_store(backend: str, tmp_dir: str):
+    if backend == 'sqlite':
+        return SQLitePriceStore(os.path.join(tmp_dir, 'prices.db'))
+    return DuckDBPriceStore(os.path.join(tmp_dir, 'kline_store'))
+
+
+@pytest.fixture(params=PRICE_STORE_BACKENDS)
+def store(request, tmp_path):
+    return make_store(request.param, str(tmp_path))
+
+
+def load_klines(n_codes: int = 6) -> pd.DataFrame:
+    df = pd.read_parquet(KLINE_FILE)
+    df['time_key'] = pd.to_datetime(df['time_key'])
+    codes = sorted(df['code'].unique())[:n_codes]
+    return df[df['code'].isin(codes)].sort_values(['code', 'time_key']).reset_index(drop=True)
+
+
+def _assert_same(actual: pd.DataFrame, expected: pd.DataFrame, columns=None):
+    columns = columns or list(expected.columns)
+    actual = actual.reset_index(drop=True)
+    expected = expected.reset_index(drop=True)
+    assert list(actual.columns) == columns, f"列不一致: {list(actual.columns)}"
+    assert len(actual) == len(expected), f"行数不一致: {len(actual)} != {len(expected)}"
+    assert (actual['code'].astype(str).to_numpy() == expected['code'].astype(str).to_numpy()).all()
+    assert (actual['time_key'].to_numpy('datetime64[ns]') == expected['time_key'].to_numpy('datetime64[ns]')).all()
+    for col in columns:
+        if col in VALUE_COLUMNS:
+            assert actual[col].dtype == np.float64, f"{col} 类型为 {actual[col].dtype}"
+            np.testing.assert_allclose(actual[col].to_numpy(), expected[col].to_numpy(dtype=np.float64),
+                                       rtol=1e-12, equal_nan=True, err_msg=col)
+
+
+def test_empty_store(store):
+    assert store.read(['SH.600000']).empty
+    assert store.latest_dates() == {}
+    assert store.count_rows() == 0 and store.count_codes() == 0
+    assert store.last_update_time() is None
+
+
+def test_write_and_read_roundtrip(store):
+    df = load_klines()
+    assert store.write(df) == len(df)
+    codes = sorted(df['code'].unique())
+    result = store.read(codes)
+    assert pd.api.types.is_datetime64_any_dtype(result['time_key'])
+    _assert_same(result, df, ['code', 'time_key', 'name'] + VALUE_COLUMNS)
+
+
+def test_upsert_overwrites_existing_bars(store):
+    df = load_klines()
+    store.write(df)
+    last = df.groupby('code').tail(3).copy()
+    last['close'] = last['close'] + 1
+    new = last.copy()
+    new['time_key'] = new['time_key'] + pd.Timedelta(days=400)
+    store.write(pd.concat([last, new]))
+
+    expected = pd.concat([df.drop(last.index), last, new]).sort_values(['code', 'time_key'])
+    assert store.count_rows() == len(expected)
+    _assert_same(store.read(sorted(df['code'].unique()), columns=['close']), expected, ['code', 'time_key', 'close'])
+
+
+def test_date_range_columns_and_limit(store):
+    df = load_klines()
+    store.write(df)
+    codes = sorted(df['code'].unique())[:3]
+    subset = df[df['code'].isin(codes)]
+
+    # 结束日期当天整天包含在内
+    result = store.read(codes, '2024-01-02', '2024-03-29', columns=['close', 'volume'])
+    expected = subset[(subset['time_key'] >= '2024-01-02') & (subset['time_key'] < '2024-03-30')]
+    _assert_same(result, expected, ['code', 'time_key', 'close', 'volume'])
+
+    result = store.read(codes + ['XX.000000'], columns=['close'], limit=5)
+    _assert_same(result, subset.groupby('code').tail(5), ['code', 'time_key', 'close'])
+
+
+def test_latest_dates_and_counts(store):
+    df = load_klines()
+    store.write(df)
+    latest = df.groupby('code')['time_key'].max()
+    assert store.latest_dates() == latest.to_dict()
+    codes = list(latest.index[:2])
+    assert store.latest_dates(codes + ['XX.000000']) == latest[codes].to_dict()
+    assert store.count_rows() == len(df)
+    assert store.count_codes() == df['code'].nunique()
+    assert store.last_update_time() == df['time_key'].max()
+
+
+def test_recent_is_descending(store):
+    df = load_klines()
+    store.write(df)
+    code = df['code'].iloc[0]
+    result = store.recent(code, 10)
+    expected = df[df['code'] == code].tail(10).iloc[::-1]
+    assert len(result) == 10
+    assert (result['time_key'].to_numpy('datetime64[ns]') == expected['time_key'].to_numpy('datetime64[ns]')).all()
+    np.testing.assert_allclose(result['close'].to_numpy(), expected['close'].to_numpy())
+
+
+def test_incomplete_store_cannot_be_created():
+    class ReadOnlyStore(PriceStore):
+        def read(self, codes, start_date=None, end_date=None, columns=None, limit=None):
+            return pd.DataFrame()
+
+    with pytest.raises(TypeError):
+        ReadOnlyStore()
+
+
+def test_duckdb_write_adds_files_and_latest_wins():
+    """DuckDB 实现写入只新增增量文件，已有文件不改写；查询以最后写入为准，合并后结果不变"""
+    df = load_klines()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # 目录名中的引号不影响查询
+        store = DuckDBPriceStore(os.path.join(tmp_dir, "it's", 'kline_store'))
+        store.write(df)
+        files = {os.path.join(root, f): os.stat(os.path.join(root, f)).st_mtime_ns
+                 for root, _, names in os.walk(store.dataset_dir) for f in names if f.endswith('.parquet')}
+        expected = df.copy()
+        for delta in (1.0, 2.0):
+            last = df.groupby('code').tail(3).copy()
+            last['close'] = last['close'] + delta
+            store.write(last)
+        expected.loc[last.index, 'close'] = last['close']
+
+        for path, mtime in files.items():
+            assert os.stat(path).st_mtime_ns == mtime, f"已有文件被改写: {path}"
+        codes = sorted(df['code'].unique())
+        assert store.count_rows() == len(df)
+        _assert_same(store.read(codes, columns=['close']), expected, ['code', 'time_key', 'close'])
+        _assert_same(store.read(codes, columns=['close'], limit=2), expected.groupby('code').tail(2),
+                     ['code', 'time_key', 'close'])
+
+        assert compact_partitions(store.dataset_dir, min_files=2) > 0
+        assert store.count_rows() == len(df)
+        _assert_same(store.read(codes, columns=['close']), expected, ['code', 'time_key', 'close'])
+
+
+class _FlakyConnection:
+    """第一次查询抛出给定的 IO 错误，之后交给真实连接执行"""
+
+    def __init__(self, con, message: str):
+        self.con = con
+        self.message = message
+        self.calls = 0
+
+    def cursor(self):
+        cursor = self.con.cursor()
+        outer = self
+
+        class Cursor:
+            def execute(self, sql, params):
+                outer.calls += 1
+                if outer.calls == 1:
+                    raise duckdb.IOException(outer.message)
+                return cursor.execute(sql, params)
+
+            def close(self):
+                cursor.close()
+
+        return Cursor()
+
+
+def test_duckdb_retries_when_files_are_compacted_away():
+    df = load_klines()
+    codes = sorted(df['code'].unique())
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = DuckDBPriceStore(os.path.join(tmp_dir, 'kline_store'))
+        store.write(df)
+        real = store._con
+        # glob 展开之后文件被删除：重新展开后重试
+        store._con = _FlakyConnection(real, 'IO Error: Cannot open file "x.parquet": No such file or directory')
+        _assert_same(store.read(codes, columns=['close']), df, ['code', 'time_key', 'close'])
+        assert store._con.calls == 2
+        # 其他 IO 错误不重试
+        store._con = _FlakyConnection(real, 'IO Error: Permission denied')
+        with pytest.raises(duckdb.IOException):
+            store.read(codes)
+        assert store._con.calls == 1
+
+        # 后台不断追加并合并小文件，并发查询始终得到完整结果
+        stop = threading.Event()
+
+        def compact_loop():
+            day = df[df['time_key'] == df['time_key'].max()]
+            while not stop.is_set():
+                for _ in range(3):
+                    append_daily(day, store.dataset_dir)
+                compact_partitions(store.dataset_dir, min_files=2)
+
+        store._con = real
+        thread = threading.Thread(target=compact_loop)
+        thread.start()
+        try:
+            for _ in range(40):
+                assert len(store.read(codes, columns=['close'])) == len(df)
+        finally:
+            stop.set()
+            thread.join()
+
+
+def test_default_store_is_the_kline_dataset():
+    # fetch_kline_daily / 数据更新页面写入 DATASET_DIR，DuckDB 存储默认直接查询它
+    assert KLINE_STORE_DIR == DATASET_DIR
+    assert DuckDBPriceStore().dataset_dir == DATASET_DIR
+
+
+def main():
+    tests = [func for name, func in list(globals().items()) if name.startswith('test_') and callable(func)]
+    for func in tests:
+        if func.__code__.co_argcount == 0:
+            func()
+            print(f"{func.__name__}: 通过")
+    for backend in PRICE_STORE_BACKENDS:
+        for func in tests:
+            if func.__code__.co_argcount == 0:
+                continue
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                func(make_store(backend, tmp_dir))
+            print(f"{func.__name__}[{backend}]: 通过")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+行情连接池测试：在本地模拟网关上验证连接上限、断线连接的丢弃与重连、空闲连接探活
+
+运行: python test_quote_pool.py  或  pytest test_quote_pool.py
+"""
+
+import threading
+
+from futu import RET_OK
+
+from fake_opend import FakeOpenD
+from quote_pool import QuoteContextPool
+
+KLINE_FILE = 'data/kline_data.parquet'
+
+
+def make_pool(server: FakeOpenD, **kwargs):
+    created = []
+
+    def factory():
+        ctx = server.new_context()
+        created.append(ctx)
+        return ctx
+
+    return QuoteContextPool(context_factory=factory, **kwargs), created
+
+
+def test_reuses_connection_until_disconnected():
+    """连接被网关断开后，归还时丢弃，下次借用重新建连"""
+    server = FakeOpenD(KLINE_FILE, quotas=None, disconnect_after=3)
+    pool, created = make_pool(server, max_size=1)
+    code = sorted(server.klines)[0]
+
+    results = []
+    for _ in range(7):
+        with pool.borrow() as ctx:
+            ret, _ = ctx.get_market_snapshot([code])
+            results.append(ret)
+    # 每个连接成功 3 次，第 4 次请求时断开；该次失败，之后的请求使用新连接
+    assert results == [RET_OK] * 3 + [results[3]] + [RET_OK] * 3
+    assert results[3] != RET_OK
+    assert len(created) == 2 and pool.size == 1
+
+
+def test_broken_connection_discarded_on_exception():
+    server = FakeOpenD(KLINE_FILE, quotas=None)
+    pool, created = make_pool(server, max_size=2)
+    try:
+        with pool.borrow() as ctx:
+            ctx.close()
+            raise RuntimeError("请求中途断线")
+    except RuntimeError:
+        pass
+    assert pool.size == 0
+    with pool.borrow() as ctx:
+        assert ctx is created[1] and ctx.get_global_state()[0] == RET_OK
+
+
+def test_idle_connection_health_checked():
+    """空闲超过探活间隔的连接先探活，已断开的在借出前被替换"""
+    server = FakeOpenD(KLINE_FILE, quotas=None)
+    pool, created = make_pool(server, max_size=1, health_check_interval=0.0)
+    with pool.borrow():
+        pass
+    created[0].close()
+    with pool.borrow() as ctx:
+        assert ctx is created[1]
+    assert pool.size == 1
+
+
+def test_concurrent_borrowers_respect_max_size():
+    server = FakeOpenD(KLINE_FILE, quotas=None, latency=0.01, disconnect_after=5)
+    pool, created = make_pool(server, max_size=3)
+    codes = sorted(server.klines)
+    in_use, peak, lock = [0], [0], threading.Lock()
+
+    def worker(i):
+        for j in range(20):
+            with pool.borrow() as ctx:
+                with lock:
+                    in_use[0] += 1
+                    peak[0] = max(peak[0], in_use[0])
+                ctx.get_market_snapshot([codes[(i + j) % len(codes)]])
+                with lock:
+                    in_use[0] -= 1
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert peak[0] <= 3 and pool.size <= 3
+    # 每个连接最多成功 5 次，160 次请求必然多次重连
+    assert len(created) > 160 // 6
+
+
+def main():
+    for name, func in list(globals().items()):
+        if name.startswith('test_') and callable(func):
+            func()
+            print(f"{name}: 通过")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+行情快照服务测试：在本地模拟网关上验证分批、并发合并、缓存过期、请求计数和请求卡住时的超时
+
+运行: python test_snapshot_service.py  或  pytest test_snapshot_service.py
+"""
+
+import threading
+import time
+
+from fake_opend import FakeOpenD
+from quote_pool import QuoteContextPool
+from snapshot_service import SnapshotService
+
+KLINE_FILE = 'data/kline_data.parquet'
+
+
+def make_service(server: FakeOpenD, **kwargs) -> SnapshotService:
+    pool = QuoteContextPool(max_size=4, context_factory=server.new_context)
+    return SnapshotService(pool=pool, **kwargs)
+
+
+def _run_threads(target, n: int) -> list:
+    errors = []
+
+    def wrapped(i):
+        try:
+            target(i)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=wrapped, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return errors
+
+
+def test_large_request_split_into_batches():
+    server = FakeOpenD(KLINE_FILE)
+    service = make_service(server, batch_size=10)
+    codes = sorted(server.klines)
+    result = service.get_many(codes)
+    assert list(result) == codes
+    assert server.stats['get_market_snapshot'] == service.requests == 5
+    for code in codes:
+        assert result[code]['last_price'] == server.klines[code]['close'].iloc[-1]
+
+
+def test_concurrent_callers_share_one_batch():
+    """多个线程同时请求有重叠的股票，在 linger 窗口内合并，每只股票只请求一次"""
+    server = FakeOpenD(KLINE_FILE)
+    service = make_service(server, linger=0.1)
+    codes = sorted(server.klines)
+    barrier = threading.Barrier(8)
+    results = {}
+
+    def call(i):
+        barrier.wait()
+        results[i] = service.get_prices(codes[i * 4:i * 4 + 20])
+
+    assert _run_threads(call, 8) == []
+    assert server.stats['get_market_snapshot'] <= 2
+    for i, prices in results.items():
+        assert list(prices) == codes[i * 4:i * 4 + 20]
+
+
+def test_cache_expires_after_ttl():
+    server = FakeOpenD(KLINE_FILE)
+    service = make_service(server, ttl=0.2)
+    code = sorted(server.klines)[0]
+    service.get(code)
+    service.get(code)
+    assert server.stats['get_market_snapshot'] == 1
+    time.sleep(0.25)
+    service.get(code)
+    assert server.stats['get_market_snapshot'] == 2
+    service.invalidate([code])
+    service.get(code)
+    assert server.stats['get_market_snapshot'] == 3
+
+
+def test_gateway_error_raised_to_caller():
+    server = FakeOpenD(KLINE_FILE, quotas={'get_market_snapshot': 1})
+    service = make_service(server, ttl=0)
+    codes = sorted(server.klines)
+    service.get(codes[0])
+    try:
+        service.get(codes[1])
+        raise AssertionError("超出配额时应抛出 RuntimeError")
+    except RuntimeError as e:
+        assert '频率' in str(e)
+    assert service._inflight == {}
+
+
+def test_request_counter_is_exact_under_threads():
+    """不缓存、不合并时每次调用各发一次请求，计数与网关收到的请求数一致"""
+    server = FakeOpenD(KLINE_FILE, quotas=None)
+    service = make_service(server, ttl=0, linger=0)
+    codes = sorted(server.klines)
+
+    def call(i):
+        for _ in range(20):
+            service.get(codes[i])
+
+    assert _run_threads(call, 16) == []
+    assert service.requests == server.stats['get_market_snapshot']
+
+
+def test_stalled_request_times_out_and_recovers():
+    server = FakeOpenD(KLINE_FILE, quotas=None, latency=1.0)
+    service = make_service(server, timeout=0.2)
+    code = sorted(server.klines)[0]
+
+    start = time.monotonic()
+    try:
+        service.get(code)
+        raise AssertionError("请求卡住时应抛出 TimeoutError")
+    except TimeoutError as e:
+        assert code in str(e)
+    assert time.monotonic() - start < 0.8
+
+    # 网关恢复后，超时的股票重新请求，不再等待卡住的旧请求
+    server.latency = 0.0
+    assert service.get(code)['code'] == code
+
+
+def main():
+    for name, func in list(globals().items()):
+        if name.startswith('test_') and callable(func):
+            func()
+            print(f"{name}: 通过")
+
+
+if __name__ == "__main__":
+    main()
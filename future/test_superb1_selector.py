@@ -5,19 +5,14 @@ from typing import List, Dict, Any
 from itertools import product
 from Selector import BBIKDJSelector, SuperB1Selector
 import os
+from kline_dataset import KlineDataset
+from compact_panel import PricePanel, load_panel
 
-def select_stocks(df: pd.DataFrame, custom_selector: SuperB1Selector) -> List[str]:
-    # 选股逻辑，假设BBIKDJSelector类已经实现了选股方法
-    # 这里简化处理，实际使用时应该调用selector的选股方法
-    df = df.rename(columns={'time_key': 'date'})
-    latest_date = df['date'].max()
-    stockes = df['code'].unique()
-    multi_stock_data = dict()
-    for stock_code in stockes:
-        multi_stock_data[stock_code] = df[df['code'] == stock_code]
-    return custom_selector.select(latest_date, multi_stock_data)
+def select_stocks(panel: PricePanel, custom_selector: SuperB1Selector) -> List[str]:
+    # 各股票的 DataFrame 在面板上只拆分一次，所有参数组合共用
+    return custom_selector.select(panel.dates[-1], panel.code_frames())
 
-def run_hyperparameter_experiment(df: pd.DataFrame, params_dict: Dict[str, List[Any]]) -> pd.DataFrame:
+def run_hyperparameter_experiment(panel: PricePanel, params_dict: Dict[str, List[Any]]) -> pd.DataFrame:
     """
     运行超参组合实验，返回实验结果DataFrame
     """
@@ -52,7 +47,7 @@ def run_hyperparameter_experiment(df: pd.DataFrame, params_dict: Dict[str, List[
             selector = SuperB1Selector(**selector_params)
             
             # 执行选股
-            selected_stocks = select_stocks(df, selector)
+            selected_stocks = select_stocks(panel, selector)
             
             print(f"  选出股票数量: {len(selected_stocks)}")
             print(f"  选出股票: {selected_stocks}")
@@ -111,16 +106,17 @@ def main():
     
     # 加载数据
     print("加载股票数据...")
-    try:
-        df = pd.read_parquet('future/data/kline_data.parquet')
-    except Exception:
-        # 尝试相对路径
-        df = pd.read_parquet('data/kline_data.parquet')
+    # 从分区数据集只读取选股器用到的列
+    base_dir = 'future/data' if os.path.isdir('future/data') else 'data'
+    dataset = KlineDataset.open_or_build(f'{base_dir}/kline_data.parquet', f'{base_dir}/kline_dataset')
+    # 对齐到交易日历的面板按数据版本缓存，重复实验不再重新拆分
+    panel = load_panel(dataset.dataset_dir, columns=['open', 'high', 'low', 'close', 'volume'],
+                       cache_dir=f'{base_dir}/panel_cache')
     
-    print(f"数据加载完成，共 {len(df)} 条记录，包含 {df['code'].nunique()} 只股票")
+    print(f"数据加载完成，共 {int(panel.valid.sum())} 条记录，包含 {len(panel.codes)} 只股票")
     
     # 运行超参实验
-    results_df = run_hyperparameter_experiment(df, params_dict)
+    results_df = run_hyperparameter_experiment(panel, params_dict)
     
     # 保存结果
     output_file = 'BBIKDJ_selector_experiment_results.parquet'
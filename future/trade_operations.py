@@ -7,6 +7,7 @@ from db_schema import DatabaseManager, get_portfolios_by_account, get_positions_
 from sqlalchemy.orm import Session
 import streamlit as st
 from fetch_kline_daily import get_market_snapshot
+from snapshot_service import get_snapshot_service
 from db_tools import DatabaseTools
 SLIP_FEE_RATE = 0.00008
 # 配置日志
@@ -294,9 +295,10 @@ def refresh_position_prices(db_session, positions):
         更新后的持仓列表
     """
     updated_positions = []
+    # 一次请求取回全部持仓的最新价格
+    prices = get_snapshot_service().get_prices([position.code for position in positions])
     for position in positions:
-        # 模拟获取最新价格（在实际应用中应该从外部API获取）
-        latest_price = get_market_snapshot(position.code)
+        latest_price = prices[position.code]
         
         # 考虑滑点费用万分之0.8
         slip_fee = latest_price * position.quantity * SLIP_FEE_RATE
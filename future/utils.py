@@ -13,32 +13,57 @@ import pandas as pd
 import backtrader as bt
 import backtrader.indicators as btind
 from dotenv import load_dotenv
+from kline_mmap import MmapKlineData, MMAP_COLUMNS
+from market_store import MarketStore
+from kline_dataset import KlineDataset, dataset_version
+from analyzers import TradeListAnalyzer, EquityCurveAnalyzer, trades_to_frame
+from backtest_charts import chart_cache_key, save_backtest_series, render_chart
+from snapshot_service import get_snapshot_service
 load_dotenv('.env')
 token = os.getenv('OPENAI_API_KEY')
 api_url = os.getenv('API_URL')
 api_key = os.getenv('API_KEY')
 ts_key = os.getenv('TS_KEY')
 
-def run_backtest(strategy, stock_code, start_date, end_date, initial_cash=100000):
+KLINE_FILE = 'data/kline_data.parquet'
+MARKET_STORE_DIR = 'data/market_store/kline_data'
+DATASET_DIR = 'data/kline_dataset'
+
+def _load_arrays(stock_code, start_date, end_date, use_mmap=False):
+    """
+    取单只股票区间内的列数组
+
+    单次回测从分区数据集中只读取该股票、该区间、需要的列；
+    批量并行回测挂载共享的 Arrow 行情库，各进程共用同一份页缓存
+    """
+    # 只挂载已发布的行情库；尚未发布当前数据时改为从数据集读取，不在回测进程中发布
+    store = MarketStore.open_current(KLINE_FILE, MARKET_STORE_DIR) if use_mmap else None
+    if store is not None:
+        return store.get_arrays(stock_code, start_date, end_date, columns=MMAP_COLUMNS)
+    dataset = KlineDataset.open_or_build(KLINE_FILE, DATASET_DIR)
+    df = dataset.read(stock_code, start_date, end_date, columns=['time_key'] + MMAP_COLUMNS)
+    if df.empty:
+        return None
+    arrays = {'time_key': df['time_key'].to_numpy('datetime64[ns]').astype(np.int64)}
+    for col in MMAP_COLUMNS:
+        arrays[col] = df[col].to_numpy(dtype=np.float64)
+    return arrays
+
+def _build_cerebro(strategy, stock_code, start_date, end_date, initial_cash=100000, printlog=True, use_mmap=False):
     # 创建回测引擎
     cerebro = bt.Cerebro()
     
     # 添加策略
-    cerebro.addstrategy(strategy, printlog=True)
+    cerebro.addstrategy(strategy, printlog=printlog)
     
-    # 获取数据
-    df = pd.read_parquet('data/kline_data.parquet')
-    df = df[df['code'] == stock_code]
-    df['time_key'] = pd.to_datetime(df['time_key'])
-    df.set_index('time_key', inplace=True)
-    df = df[start_date:end_date]
-    df = df[['open', 'high', 'low', 'close', 'volume']]
-
-
+    # 获取数据：只读取该股票回测区间内需要的列
+    arrays = _load_arrays(stock_code, start_date, end_date, use_mmap=use_mmap)
+    if arrays is None:
+        raise ValueError(f"K线数据中未找到股票 {stock_code}")
     
     # 转换为backtrader数据格式
-    data = bt.feeds.PandasData(dataname=df)
-    cerebro.adddata(data)
+    data = MmapKlineData(arrays=arrays)
+    cerebro.adddata(data, name=stock_code)
     
     # 设置初始资金
     cerebro.broker.setcash(initial_cash)
@@ -51,6 +76,12 @@ def run_backtest(strategy, stock_code, start_date, end_date, initial_cash=100000
     cerebro.addanalyzer(bt.analyzers.SharpeRatio, _name='sharpe')
     cerebro.addanalyzer(bt.analyzers.DrawDown, _name='drawdown')
     cerebro.addanalyzer(bt.analyzers.TradeAnalyzer, _name='trade_analyzer')
+    cerebro.addanalyzer(TradeListAnalyzer, _name='trade_list')
+    cerebro.addanalyzer(EquityCurveAnalyzer, _name='equity_curve')
+    return cerebro
+
+def run_backtest(strategy, stock_code, start_date, end_date, initial_cash=100000, plot=False):
+    cerebro = _build_cerebro(strategy, stock_code, start_date, end_date, initial_cash)
     
     print(f'初始资金: {initial_cash:.2f}')
     
@@ -75,24 +106,61 @@ def run_backtest(strategy, stock_code, start_date, end_date, initial_cash=100000
         if trade_analysis["lost"]["total"] > 0:
             print(f'平均亏损: {trade_analysis["lost"]["pnl"]["average"]:.2f}')
     
-    # 绘制回测结果
-    fig = cerebro.plot()[0][0]
-    fig.set_size_inches(12, 8)
-    fig.savefig('test.png')
+    # 保存紧凑的资金曲线和交易明细，图表按需在独立进程中渲染并缓存
+    params = {k: v for k, v in strat.params._getkwargs().items() if k != 'printlog'}
+    chart_key = chart_cache_key(strategy.__name__, stock_code, params, dataset_version(DATASET_DIR), start_date, end_date)
+    save_backtest_series(
+        chart_key,
+        strat.analyzers.equity_curve.get_analysis(),
+        trades_to_frame(strat.analyzers.trade_list.get_analysis()),
+        {
+            'strategy': strategy.__name__,
+            'code': stock_code,
+            'params': params,
+            'start_date': start_date,
+            'end_date': end_date,
+            'dataset_dir': DATASET_DIR,
+        },
+    )
+    strat.chart_key = chart_key
+    print(f'回测序列已保存, chart_key: {chart_key}')
+    if plot:
+        print(f'回测图表: {render_chart(chart_key)}')
 
     return results
 
-def get_market_snapshot(codes: str):
-    quote_ctx = OpenQuoteContext(host='127.0.0.1', port=11111)
+def _backtest_worker(args):
+    strategy, stock_code, start_date, end_date, initial_cash = args
+    cerebro = _build_cerebro(strategy, stock_code, start_date, end_date, initial_cash, printlog=False, use_mmap=True)
+    strat = cerebro.run()[0]
+    return {
+        'code': stock_code,
+        'final_value': cerebro.broker.getvalue(),
+        'rtot': strat.analyzers.returns.get_analysis().get('rtot'),
+        'sharpe': strat.analyzers.sharpe.get_analysis().get('sharperatio'),
+        'max_drawdown': strat.analyzers.drawdown.get_analysis()['max']['drawdown'],
+    }
 
-    ret, data = quote_ctx.get_market_snapshot(codes)
-    if ret == RET_OK:
-        last_price = data['last_price'][0]
-        name = data['name'][0]
-    else:
-        print('error:', data)
-    quote_ctx.close()
-    return last_price, name
+def run_backtests_parallel(strategy, stock_codes, start_date, end_date, initial_cash=100000, processes=None):
+    """
+    每个CPU核心一个进程并行回测多只股票，返回汇总指标DataFrame
+
+    各进程挂载同一份内存映射的行情库，单进程内存只包含自身切片用到的页面
+    """
+    import multiprocessing
+    # 行情库由抓取任务发布；落后于数据源时各进程改为从分区数据集读取
+    if MarketStore.open_current(KLINE_FILE, MARKET_STORE_DIR) is None:
+        print(f"行情库 {MARKET_STORE_DIR} 尚未发布 {KLINE_FILE} 的当前数据，回测进程将从分区数据集读取")
+        # 数据集不存在时在主进程构建一次，避免各子进程同时构建
+        KlineDataset.open_or_build(KLINE_FILE, DATASET_DIR)
+    jobs = [(strategy, code, start_date, end_date, initial_cash) for code in stock_codes]
+    with multiprocessing.Pool(processes=processes or os.cpu_count()) as pool:
+        summaries = pool.map(_backtest_worker, jobs)
+    return pd.DataFrame(summaries)
+
+def get_market_snapshot(codes: str):
+    snapshot = get_snapshot_service().get(codes)
+    return snapshot['last_price'], snapshot['name']
     
 def get_ai_recommendation(prompt: str, system_prompt: str="你是一个专业的证券操盘手，专注于股票的交易策略的执行，擅长根据股票的历史数据和当前市场情况，进行交易。") -> str:
     client = OpenAI(api_key=token, base_url="https://api.deepseek.com")